@@ -0,0 +1,323 @@
+"""
+Video Similarity Tester benchmark
+Usage: python benchmark.py [--corpus=<folder>] [--output=<json>] [--quick] [--workers=<count>] [--no-memory] [--baseline=<json>] [--tolerance=<ratio>] [-h/--help]
+Synthetic videos are generated with FFmpeg lavfi sources, every original gets the cut, cropping, transform_shift and transform_size variants of test_result.txt.
+Fast decode modes are timed and their signatures are compared with the default mode (hash bits, similarity error, detected variants).
+sys.argv[?] (--corpus) folder of the generated videos, reused between runs (default: ./benchmark_corpus)
+sys.argv[?] (--output) path of the machine readable result (default: ./benchmark_result.json)
+sys.argv[?] (--quick) smaller scales for a fast check
+sys.argv[?] (--workers) number of worker processes for hashing and fingerprinting (default: 1)
+sys.argv[?] (--no-memory) skip the second, traced run of every measurement that records peak memory
+sys.argv[?] (--baseline) previous result to compare with, exit with code 1 on throughput or peak memory regression
+sys.argv[?] (--tolerance) allowed relative regression against baseline (default: 0.2)
+sys.argv[?] (-h/--help) help (show available options)
+"""
+import os
+import sys
+import gc
+import csv
+import json
+import time
+import getopt
+import logging
+import platform
+import subprocess
+import contextlib
+import tracemalloc
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+import main as vst
+
+#* Deterministic lavfi sources of the original videos, every original also gets a distinct hue
+ORIGINAL_SOURCE_LIST = [
+    "testsrc2=size=640x360:rate=25",
+    "mandelbrot=size=640x360:rate=25",
+    "life=size=640x360:rate=25:seed=42:mold=10:life_color=#00ff00",
+    "cellauto=size=640x360:rate=25:seed=7:rule=110",
+    "testsrc=size=640x360:rate=25",
+]
+ORIGINAL_DURATION = 12
+#* Variants mirror similarity_test/test_result.txt
+VARIANT_LIST = [
+    ("cut", ["-ss", "3"], None),
+    ("cropping", [], "crop=iw*0.8:ih*0.8"),
+    ("transform_shift", [], "pad=iw+64:ih+36:64:36:black,crop=iw-64:ih-36:0:0"),
+    ("transform_size", [], "scale=320:180"),
+]
+ENCODE_OPTION_LIST = ["-an", "-c:v", "mpeg4", "-q:v", "2", "-fflags", "+bitexact", "-flags:v", "+bitexact", "-threads", "1"]
+#* At least two originals, so that every scale has unrelated pairs for the best_unrelated margin and variant detection
+SIGNATURE_SCALE = {"quick": [2], "full": [2, 4]}
+ALL_PAIRS_SCALE = {"quick": [500, 1000], "full": [1000, 2000, 4000]}
+THRESHOLD_SCALE = {"quick": [10000, 100000], "full": [10000, 100000, 1000000]}
+#* 0.95 allows 3 flipped bits, 4 hash index substrings of 16 bits keep buckets small at a million videos
+HASH_THRESHOLD = 0.95
+#* --fast-decode modes compared with the default decode
+FAST_DECODE_LIST = ["keyframe", 1.0, 0.5]
+SEED = 20231018
+
+def ffmpeg(argument_list: list) -> None:
+    subprocess.run(["ffmpeg", "-y", "-loglevel", "error"] + argument_list, check=True)
+
+def generate_corpus(corpus_path: str, original_count: int) -> list:
+    #* Generate (or reuse) original_count originals with their variants, return [(name, path)] in original/variant order
+    video_list = []
+    for i in range(original_count):
+        source = ORIGINAL_SOURCE_LIST[i % len(ORIGINAL_SOURCE_LIST)] + ",hue=h={}".format((i * 47) % 360)
+        original_path = os.path.join(corpus_path, "{}_original.mp4".format(i))
+        if not os.path.exists(original_path):
+            ffmpeg(["-f", "lavfi", "-i", source, "-t", str(ORIGINAL_DURATION)] + ENCODE_OPTION_LIST + [original_path])
+        video_list.append(("{}_original".format(i), original_path))
+        for variant, input_option_list, video_filter in VARIANT_LIST:
+            variant_path = os.path.join(corpus_path, "{}_{}.mp4".format(i, variant))
+            if not os.path.exists(variant_path):
+                filter_option_list = ["-vf", video_filter] if video_filter != None else []
+                ffmpeg(input_option_list + ["-i", original_path] + filter_option_list + ENCODE_OPTION_LIST + [variant_path])
+            video_list.append(("{}_{}".format(i, variant), variant_path))
+    return video_list
+
+def synthetic_signature(video_count: int, seed: int) -> tuple:
+    #* Clusters of 4 near duplicate signatures (a few flipped hash bits, mutated or cut fingerprint) with random cluster heads
+    rng = np.random.default_rng(seed)
+    cluster = np.arange(video_count) // 4
+    cluster_count = int(cluster[-1]) + 1
+    base_hash = np.frombuffer(rng.bytes(8 * cluster_count), dtype=np.uint64)
+    packed_hash = base_hash[cluster].copy()
+    for _ in range(3):
+        flip = rng.random(video_count) < 0.5
+        packed_hash[flip] ^= np.left_shift(np.uint64(1), rng.integers(0, 64, size=int(flip.sum())).astype(np.uint64))
+    bits = np.unpackbits(packed_hash.astype(">u8").view(np.uint8)).reshape(video_count, 64)
+    hash_list = ["0b" + bit_string for bit_string in (bits + ord("0")).astype(np.uint8).view("S64").ravel().astype(str)]
+    letter = np.frombuffer(b"rgblnRGBLN", dtype=np.uint8)
+    base_code = letter[rng.integers(0, letter.shape[0], size=(cluster_count, 24))]
+    code = base_code[cluster].copy()
+    mutate = rng.random(code.shape) < 0.1
+    code[mutate] = letter[rng.integers(0, letter.shape[0], size=int(mutate.sum()))]
+    start = np.where(rng.random(video_count) < 0.25, rng.integers(1, 6, size=video_count), 0)
+    length = rng.integers(16, 25, size=video_count)
+    finger_print_list = [code[i, start[i]:length[i]].tobytes().decode("ascii") for i in range(video_count)]
+    return np.array(hash_list, dtype=str), np.array(finger_print_list, dtype=str)
+
+def new_tester(list_filepath: str, workers: int, hash_threshold=None, fast_decode=None, **option):
+    return vst.VideoSimilarityTester(cache_path=os.path.dirname(list_filepath), PATH_list_filepath=list_filepath, remove_cache=False, signature_cache=False, workers=workers, hash_threshold=hash_threshold, fast_decode=fast_decode, run=False, **option)
+
+def measure(stage: str, setup, unit: str, item_count: int, trace_memory: bool, **detail) -> dict:
+    #* setup() prepares a fresh tester and returns the call to time, it is called again for the traced run
+    peak_memory_mb = None
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        run = setup()
+        gc.collect()
+        start_time, start_cpu_time = time.perf_counter(), time.process_time()
+        run()
+        seconds, cpu_seconds = time.perf_counter() - start_time, time.process_time() - start_cpu_time
+        if trace_memory == True:
+            run = setup()
+            gc.collect()
+            tracemalloc.start()
+            run()
+            peak_memory_mb = tracemalloc.get_traced_memory()[1] / 2**20
+            tracemalloc.stop()
+    record = {"stage": stage, **detail, "item_count": item_count, "seconds": seconds, "cpu_seconds": cpu_seconds, "throughput": item_count / seconds if seconds > 0 else None, "throughput_unit": unit, "peak_memory_mb": peak_memory_mb}
+    print("{:<28} {:>10} {:>12.3f} s {:>14.1f} {:<9} {:>10}".format(stage, item_count, seconds, record["throughput"] or 0, unit, "-" if peak_memory_mb == None else "{:.1f} MB".format(peak_memory_mb)))
+    return record
+
+def benchmark_signature(corpus_path: str, original_count: int, workers: int, trace_memory: bool) -> list:
+    #* Time _hash_video, _finger_print_video and _extract_signature on the synthetic corpus, report similarity of every variant with its original
+    video_list = generate_corpus(corpus_path, original_count)
+    list_filepath = os.path.join(corpus_path, "list_{}.csv".format(original_count))
+    with open(list_filepath, "w", newline="") as f:
+        csv.writer(f).writerows([[path, ""] for name, path in video_list])
+    detail = {"original_count": original_count, "video_count": len(video_list), "workers": workers}
+
+    def phase_setup(phase: str, fast_decode=None):
+        def setup():
+            tester = new_tester(list_filepath, workers, fast_decode=fast_decode)
+            tester._load_PATH_list()
+            tester._load_content_key()
+            def run():
+                getattr(tester, phase)()
+                if tester.COLLAGE_PATH_list.shape[0] != 0:
+                    tester._remove_cache()
+            return run
+        return setup
+
+    record_list = []
+    record_list.append(measure("hash_video", phase_setup("_hash_video"), "videos/s", len(video_list), trace_memory, **detail))
+    record_list.append(measure("finger_print_video", phase_setup("_finger_print_video"), "videos/s", len(video_list), trace_memory, **detail))
+    record_list.append(measure("extract_signature", phase_setup("_extract_signature"), "videos/s", len(video_list), trace_memory, **detail))
+    for fast_decode in FAST_DECODE_LIST:
+        record_list.append(measure("extract_signature_fast", phase_setup("_extract_signature", fast_decode), "videos/s", len(video_list), trace_memory, **detail, fast_decode=fast_decode))
+    #* Verdicts of test_result.txt, best unrelated pair is the margin a variant has to beat
+    name_list = [name for name, path in video_list]
+    default_tester = signature_tester(list_filepath, workers, None)
+    for fast_decode in [None] + FAST_DECODE_LIST:
+        tester = default_tester if fast_decode == None else signature_tester(list_filepath, workers, fast_decode)
+        mode_record_list = similarity_record_list(tester, name_list, detail if fast_decode == None else {**detail, "fast_decode": fast_decode})
+        record_list += mode_record_list
+        record_list.append(fast_decode_accuracy(default_tester, tester, mode_record_list, {**detail, "fast_decode": fast_decode}))
+    return record_list
+
+def signature_tester(list_filepath: str, workers: int, fast_decode) -> object:
+    #* Tester with signatures and comparison result of every corpus video, default mode runs videohash and videofingerprint
+    tester = new_tester(list_filepath, workers, fast_decode=fast_decode)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        tester._load_PATH_list()
+        tester._load_content_key()
+        if fast_decode == None:
+            tester._hash_video()
+            tester._finger_print_video()
+            tester._remove_cache()
+        else:
+            tester._extract_signature()
+        tester._generate_result()
+    return tester
+
+def similarity_record_list(tester, name_list: list, detail: dict) -> list:
+    #* avg_similarity of every variant with its original and of the best unrelated pair
+    record_list = []
+    comparison = tester.comparison_dataframe
+    for vid1_idx, vid2_idx, avg_similarity in zip(comparison["vid1_idx"], comparison["vid2_idx"], comparison["avg_similarity"]):
+        original1, variant1 = name_list[vid1_idx].split("_", 1)
+        original2, variant2 = name_list[vid2_idx].split("_", 1)
+        if original1 == original2 and variant1 == "original":
+            record_list.append({"stage": "similarity", **detail, "pair": "original_vs_" + variant2, "original": int(original1), "avg_similarity": float(avg_similarity)})
+    unrelated = np.array([name_list[vid1_idx].split("_")[0] != name_list[vid2_idx].split("_")[0] for vid1_idx, vid2_idx in zip(comparison["vid1_idx"], comparison["vid2_idx"])], dtype=bool)
+    if unrelated.any():
+        record_list.append({"stage": "similarity", **detail, "pair": "best_unrelated", "avg_similarity": float(comparison["avg_similarity"][unrelated].max())})
+    return record_list
+
+def fast_decode_accuracy(default_tester, tester, record_list: list, detail: dict) -> dict:
+    #* Agreement of fast decode with the default mode on the same videos
+    hash_bit_agreement = np.mean([np.mean([bit1 == bit2 for bit1, bit2 in zip(hash1[2:], hash2[2:])]) for hash1, hash2 in zip(default_tester.HASH_list, tester.HASH_list) if hash1 != "" and hash2 != ""])
+    similarity_error = np.abs(np.asarray(tester.comparison_dataframe["avg_similarity"], dtype=float) - np.asarray(default_tester.comparison_dataframe["avg_similarity"], dtype=float))
+    #* A variant is detected when it scores above every unrelated pair
+    variant_similarity_list = [record["avg_similarity"] for record in record_list if record["pair"] != "best_unrelated"]
+    best_unrelated = max([record["avg_similarity"] for record in record_list if record["pair"] == "best_unrelated"], default=0)
+    return {"stage": "fast_decode_accuracy", **detail, "hash_bit_agreement": float(hash_bit_agreement), "similarity_mean_abs_error": float(similarity_error.mean()), "similarity_max_abs_error": float(similarity_error.max()), "variant_detected_ratio": float(np.mean([similarity > best_unrelated for similarity in variant_similarity_list]))}
+
+def benchmark_comparison(list_filepath: str, video_count: int, hash_threshold, trace_memory: bool) -> dict:
+    #* Time _generate_result on synthetic signatures, all pairs or hash index pairs above hash_threshold
+    hash_list, finger_print_list = synthetic_signature(video_count, SEED)
+
+    def setup():
+        tester = new_tester(list_filepath, 1, hash_threshold=hash_threshold)
+        tester.PATH_list = np.full(video_count, "", dtype=str)
+        tester.HASH_list = hash_list
+        tester.FINGER_PRINT_list = finger_print_list
+        return tester._generate_result
+
+    if hash_threshold == None:
+        return measure("generate_result_all_pairs", setup, "pairs/s", video_count * (video_count - 1) // 2, trace_memory, video_count=video_count)
+    return measure("generate_result_threshold", setup, "videos/s", video_count, trace_memory, video_count=video_count, hash_threshold=hash_threshold)
+
+def benchmark_comparison_stream(list_filepath: str, video_count: int, resume: bool, trace_memory: bool) -> dict:
+    #* Time _generate_result with --stream on synthetic signatures, with --resume every block is checkpointed in the run journal
+    hash_list, finger_print_list = synthetic_signature(video_count, SEED)
+    export_path = os.path.join(os.path.dirname(list_filepath), "stream_result")
+    os.makedirs(export_path, exist_ok=True)
+
+    def setup():
+        tester = new_tester(list_filepath, 1, export_comparison_result=export_path, stream_result=True, resume=resume)
+        tester.PATH_list = np.full(video_count, "", dtype=str)
+        tester.HASH_list = hash_list
+        tester.FINGER_PRINT_list = finger_print_list
+        tester._open_journal()
+        def run():
+            tester._generate_result()
+            tester.journal.close(complete=True)
+        return run
+
+    return measure("generate_result_stream", setup, "pairs/s", video_count * (video_count - 1) // 2, trace_memory, video_count=video_count, resume=resume)
+
+def compare_baseline(record_list: list, baseline_filepath: str, tolerance: float) -> list:
+    #* Measurements are matched by every field that describes the run, not by the measured values
+    measured_key_list = ["seconds", "cpu_seconds", "throughput", "peak_memory_mb", "avg_similarity", "hash_bit_agreement", "similarity_mean_abs_error", "similarity_max_abs_error", "variant_detected_ratio"]
+    def identity(record):
+        return json.dumps({key: value for key, value in record.items() if key not in measured_key_list}, sort_keys=True)
+    with open(baseline_filepath, "r") as f:
+        baseline = {identity(record): record for record in json.load(f)["result"]}
+    regression_list = []
+    for record in record_list:
+        previous = baseline.get(identity(record))
+        if previous == None or record["stage"] in ("similarity", "fast_decode_accuracy"):
+            continue
+        if previous["throughput"] != None and record["throughput"] != None and record["throughput"] < previous["throughput"] * (1 - tolerance):
+            regression_list.append("{} at {}: throughput {:.1f} -> {:.1f} {}".format(record["stage"], record["item_count"], previous["throughput"], record["throughput"], record["throughput_unit"]))
+        if previous["peak_memory_mb"] != None and record["peak_memory_mb"] != None and record["peak_memory_mb"] > previous["peak_memory_mb"] * (1 + tolerance):
+            regression_list.append("{} at {}: peak memory {:.1f} -> {:.1f} MB".format(record["stage"], record["item_count"], previous["peak_memory_mb"], record["peak_memory_mb"]))
+    return regression_list
+
+def environment() -> dict:
+    ffmpeg_version = subprocess.run(["ffmpeg", "-version"], capture_output=True, text=True).stdout.split("\n")[0]
+    return {"python": platform.python_version(), "numpy": np.__version__, "platform": platform.platform(), "cpu_count": os.cpu_count(), "ffmpeg": ffmpeg_version, "seed": SEED}
+
+def execute() -> None:
+    #* Check arguments
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "h", ["corpus=", "output=", "quick", "workers=", "no-memory", "baseline=", "tolerance=", "help"])
+    except getopt.GetoptError:
+        print(__doc__)
+        sys.exit(2)
+    corpus_path = "./benchmark_corpus"
+    output_filepath = "./benchmark_result.json"
+    scale = "full"
+    workers = 1
+    trace_memory = True
+    baseline_filepath = None
+    tolerance = 0.2
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            print(__doc__)
+            sys.exit()
+        elif opt == "--corpus":
+            corpus_path = arg
+        elif opt == "--output":
+            output_filepath = arg
+        elif opt == "--quick":
+            scale = "quick"
+        elif opt == "--workers":
+            workers = int(arg)
+        elif opt == "--no-memory":
+            trace_memory = False
+        elif opt == "--baseline":
+            baseline_filepath = arg
+        elif opt == "--tolerance":
+            tolerance = float(arg)
+    corpus_path = os.path.abspath(corpus_path)
+    os.makedirs(corpus_path, exist_ok=True)
+    #* Run benchmark
+    record_list = []
+    print("{:<28} {:>10} {:>14} {:>24} {:>10}".format("stage", "items", "time", "throughput", "peak mem"))
+    for original_count in SIGNATURE_SCALE[scale]:
+        record_list += benchmark_signature(corpus_path, original_count, workers, trace_memory)
+    list_filepath = os.path.join(corpus_path, "list_{}.csv".format(SIGNATURE_SCALE[scale][0]))
+    for video_count in ALL_PAIRS_SCALE[scale]:
+        record_list.append(benchmark_comparison(list_filepath, video_count, None, trace_memory))
+        for resume in [False, True]:
+            record_list.append(benchmark_comparison_stream(list_filepath, video_count, resume, trace_memory))
+    for video_count in THRESHOLD_SCALE[scale]:
+        record_list.append(benchmark_comparison(list_filepath, video_count, HASH_THRESHOLD, trace_memory))
+    for record in record_list:
+        if record["stage"] == "similarity":
+            print("{:<28} {:<30} {:.4f}".format("similarity" + ("" if "fast_decode" not in record else " ({})".format(record["fast_decode"])), record["pair"] + ("" if "original" not in record else " ({})".format(record["original"])), record["avg_similarity"]))
+    for record in record_list:
+        if record["stage"] == "fast_decode_accuracy":
+            print("{:<28} hash bits {:.3f}, similarity error mean {:.4f} max {:.4f}, detected variants {:.2f}".format("fast_decode ({})".format("default" if record["fast_decode"] == None else record["fast_decode"]), record["hash_bit_agreement"], record["similarity_mean_abs_error"], record["similarity_max_abs_error"], record["variant_detected_ratio"]))
+    #* Export result
+    with open(output_filepath, "w") as f:
+        json.dump({"environment": environment(), "scale": scale, "result": record_list}, f, indent=2)
+    print("Exported benchmark result to {}.".format(os.path.abspath(output_filepath)))
+    if baseline_filepath != None:
+        regression_list = compare_baseline(record_list, baseline_filepath, tolerance)
+        for regression in regression_list:
+            print("Regression: " + regression)
+        if len(regression_list) != 0:
+            sys.exit(1)
+        print("No regression against {}.".format(baseline_filepath))
+
+if __name__ == "__main__":
+    logger = vst.config_logging()
+    vst.vst_error = vst.VST_Error(logger=logger)
+    vst.vst_warning = vst.VST_Warning(logger=logger)
+    logging.info("Initialized benchmark.")
+    execute()
@@ -0,0 +1,493 @@
+"""
+Video Similarity Tester tests
+Usage: python -m unittest discover similarity_test
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+import contextlib
+import threading
+import logging
+import itertools
+import unittest
+import http.server
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+import main as vst
+
+#* Warnings of the tester are printed through the module level helper that main.py creates in __main__, log records are dropped
+logging.getLogger().addHandler(logging.NullHandler())
+vst.vst_warning = vst.VST_Warning(logger=logging.getLogger())
+
+
+def _write_video_detail(folder: str, PATH_list: list, HASH_list: list, FINGER_PRINT_list: list) -> None:
+    #* Exported signatures of a previous run and the PATH list of its videos
+    with open(os.path.join(folder, "video_detail.csv"), "w") as f:
+        f.write("PATH,HASH,FINGER_PRINT\n" + "".join("{},{},{}\n".format(*row) for row in zip(PATH_list, HASH_list, FINGER_PRINT_list)))
+    with open(os.path.join(folder, "list.csv"), "w") as f:
+        f.write("".join("{},\n".format(path) for path in PATH_list))
+
+
+def _random_hash_list(rng, video_count: int) -> list:
+    #* Random "0b..." hashes, every third one a near duplicate of an earlier hash (0-4 flipped bits), with unequal length and failed (empty) hashes in between
+    hash_list = []
+    for i in range(video_count):
+        if i % 3 == 2:
+            bit_list = list(hash_list[int(rng.integers(0, i))][2:] or "0" * 64)
+            for k in rng.choice(len(bit_list), size=int(rng.integers(0, 5)), replace=False):
+                bit_list[k] = "1" if bit_list[k] == "0" else "0"
+            hash_list.append("0b" + "".join(bit_list))
+        elif i % 17 == 5:
+            hash_list.append("0b" + "".join(rng.choice(["0", "1"], size=60)))
+        elif i % 23 == 7:
+            hash_list.append("")
+        else:
+            hash_list.append("0b" + "".join(rng.choice(["0", "1"], size=64)))
+    return hash_list
+
+
+def _brute_force_pair(code_list: list, first_new=0) -> tuple:
+    #* (vid1_idx, vid2_idx, similarity) of every pair in itertools.combinations order, scored by _compare_code like the original pairwise loop
+    fallback = vst._code_fallback(code_list)
+    pair_list = [(i, j) for i, j in itertools.combinations(range(len(code_list)), 2) if j >= first_new]
+    vid1_idx = np.array([i for i, j in pair_list], dtype=int)
+    vid2_idx = np.array([j for i, j in pair_list], dtype=int)
+    return vid1_idx, vid2_idx, np.array([fallback(i, j) for i, j in pair_list], dtype=float)
+
+
+class _DownloadHandler(http.server.BaseHTTPRequestHandler):
+    #* /missing answers 404, /flaky answers 503 on its first request, every other path answers the video bytes
+    request_count = {}
+
+    def do_GET(self):
+        count = _DownloadHandler.request_count.get(self.path, 0) + 1
+        _DownloadHandler.request_count[self.path] = count
+        if self.path == "/missing" or (self.path == "/flaky" and count == 1):
+            self.send_error(404 if self.path == "/missing" else 503)
+            return
+        self.send_response(200)
+        self.send_header("Content-Length", "5")
+        self.end_headers()
+        self.wfile.write(b"video")
+
+    def log_message(self, format, *args):
+        pass
+
+
+class DownloadJobTest(unittest.TestCase):
+    def setUp(self):
+        _DownloadHandler.request_count = {}
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _DownloadHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = "http://127.0.0.1:{}".format(self.server.server_address[1])
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.folder)
+
+    def test_permanent_error_is_not_retried(self):
+        title, failure_list = vst._download_job(self.url + "/missing", os.path.join(self.folder, "0.mp4"), 5, 0)
+        self.assertEqual(title, None)
+        self.assertEqual(len(failure_list), 1)
+        self.assertEqual(_DownloadHandler.request_count["/missing"], 1)
+
+    def test_server_error_is_retried(self):
+        path = os.path.join(self.folder, "0.mp4")
+        title, failure_list = vst._download_job(self.url + "/flaky", path, 5, 0)
+        self.assertEqual(title, "flaky")
+        self.assertEqual(len(failure_list), 1)
+        self.assertEqual(_DownloadHandler.request_count["/flaky"], 2)
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), b"video")
+
+
+class SimilarityServiceTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.PATH_list = ["a.mp4", "b.mp4", "c.mp4"]
+        self.HASH_list = ["0b" + "01" * 32, "0b" + "0" * 64, ""]
+        self.FINGER_PRINT_list = ["NBnRRrlll", "NBnRRrllG", "GGgLl"]
+        _write_video_detail(self.folder, self.PATH_list, self.HASH_list, self.FINGER_PRINT_list)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_corpus_from_video_detail_without_index(self):
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            service = vst.VideoSimilarityService(self.folder, self.folder, signature_cache=False)
+        self.assertEqual(service.PATH_list, self.PATH_list)
+        self.assertEqual(service.HASH_list, self.HASH_list)
+        self.assertEqual(service.FINGER_PRINT_list, self.FINGER_PRINT_list)
+        vst.SignatureIndex.write(os.path.join(self.folder, "video_detail_index"), self.PATH_list, self.HASH_list, self.FINGER_PRINT_list)
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            indexed_service = vst.VideoSimilarityService(self.folder, self.folder, signature_cache=False)
+        self.assertEqual(indexed_service.PATH_list, self.PATH_list)
+        self.assertTrue(np.array_equal(indexed_service.finger_print_engine.similarity_to("NBnRRrllG", np.arange(3)), service.finger_print_engine.similarity_to("NBnRRrllG", np.arange(3))))
+
+    def test_query_without_range_is_clipped(self):
+        #* No comparison_result.json in the folder, the bigram Dice of "NNNN" to "NN" is 1.5 and has to be clipped to 1
+        _write_video_detail(self.folder, self.PATH_list + ["d.mp4"], self.HASH_list + ["0b" + "1" * 64], self.FINGER_PRINT_list + ["NNNN"])
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            service = vst.VideoSimilarityService(self.folder, self.folder, signature_cache=False)
+        self.assertEqual(service.fingerprint_similarity_range, None)
+        service.signature = lambda path: ("0b" + "1" * 64, "NN")
+        match_list = service.query("e.mp4", top_k=4)["match"]
+        self.assertEqual(match_list[0]["path"], "d.mp4")
+        self.assertEqual(match_list[0]["fingerprint_similarity"], 1.0)
+        self.assertEqual(match_list[0]["avg_similarity"], 1.0)
+        self.assertTrue(all(0 <= match["fingerprint_similarity"] <= 1 for match in match_list))
+
+    def test_request_error(self):
+        self.assertEqual(vst._request_error({"path": "a.mp4", "top_k": 5, "min_similarity": 0.5, "add": True}), None)
+        for request in [{"path": "a.mp4", "top_k": "5"}, {"path": "a.mp4", "top_k": 0}, {"path": "a.mp4", "top_k": True}, {"path": "a.mp4", "min_similarity": "0.5"}, {"path": "a.mp4", "add": "yes"}, {"path": 1}]:
+            self.assertNotEqual(vst._request_error(request), None)
+
+
+class ComparisonShardTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        rng = np.random.default_rng(20231018)
+        video_count = 50
+        PATH_list = ["{}.mp4".format(i) for i in range(video_count)]
+        HASH_list = ["0b" + "".join(rng.choice(["0", "1"], size=64)) for _ in range(video_count)]
+        FINGER_PRINT_list = ["".join(rng.choice(list("NBnRrGgLl"), size=rng.integers(8, 12))) for _ in range(video_count)]
+        _write_video_detail(self.folder, PATH_list, HASH_list, FINGER_PRINT_list)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def run_tester(self, **option):
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            vst.VideoSimilarityTester(cache_path=self.folder, PATH_list_filepath=os.path.join(self.folder, "list.csv"), export_video_detail=self.folder, export_comparison_result=self.folder, remove_cache=False, signature_cache=False, **option)
+        with open(os.path.join(self.folder, "comparison_result.csv"), "r") as f:
+            return f.read()
+
+    def test_plan_work_merge(self):
+        expected = self.run_tester(rescore=True)
+        os.remove(os.path.join(self.folder, "comparison_result.csv"))
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            vst.VideoSimilarityTester(cache_path=self.folder, PATH_list_filepath=os.path.join(self.folder, "list.csv"), export_video_detail=self.folder, export_comparison_result=self.folder, remove_cache=False, signature_cache=False, rescore=True, shard_tile_size=16)
+        shard_path = os.path.join(self.folder, "comparison_shard")
+        self.assertEqual(len(vst.ComparisonShard(shard_path).missing_tile_list()), 10)
+        #* Two workers one after another, the second one finds every tile done
+        self.assertEqual(vst._comparison_shard_job(shard_path, os.path.join(self.folder, "video_detail_index")), (10, 50 * 49 // 2))
+        self.assertEqual(vst._comparison_shard_job(shard_path, os.path.join(self.folder, "video_detail_index")), (0, 0))
+        self.assertEqual(self.run_tester(shard_merge=True), expected)
+
+    def test_stale_claim_is_taken_over_once(self):
+        shard_path = os.path.join(self.folder, "comparison_shard")
+        vst.ComparisonShard.plan(shard_path, 50, 16, claim_timeout=60)
+        comparison_shard = vst.ComparisonShard(shard_path)
+        self.assertTrue(comparison_shard.claim(0))
+        self.assertFalse(comparison_shard.claim(0))
+        claim_path = os.path.join(shard_path, "tile_0.claim")
+        os.utime(claim_path, (time.time() - 120, time.time() - 120))
+        #* Workers racing for the same stale claim, exactly one of them wins and its claim is fresh
+        result_list = []
+        thread_list = [threading.Thread(target=lambda: result_list.append(vst.ComparisonShard(shard_path).claim(0))) for _ in range(8)]
+        for thread in thread_list:
+            thread.start()
+        for thread in thread_list:
+            thread.join()
+        self.assertEqual(sorted(result_list), [False] * 7 + [True])
+        self.assertFalse(comparison_shard.claim(0))
+        self.assertLess(time.time() - os.path.getmtime(claim_path), 60)
+
+    def test_takeover_between_check_and_replace(self):
+        shard_path = os.path.join(self.folder, "comparison_shard")
+        vst.ComparisonShard.plan(shard_path, 50, 16, claim_timeout=60)
+        self.assertTrue(vst.ComparisonShard(shard_path).claim(0))
+        os.utime(os.path.join(shard_path, "tile_0.claim"), (time.time() - 120, time.time() - 120))
+        #* Worker A takes the stale claim over right after worker B opened it and found it stale
+        fstat, result_list = os.fstat, []
+        def racing_fstat(fd):
+            stat = fstat(fd)
+            if len(result_list) == 0:
+                result_list.append(None)
+                vst.os.fstat = fstat
+                result_list.append(vst.ComparisonShard(shard_path).claim(0))
+            return stat
+        vst.os.fstat = racing_fstat
+        try:
+            result_list.append(vst.ComparisonShard(shard_path).claim(0))
+        finally:
+            vst.os.fstat = fstat
+        self.assertEqual(result_list[1:], [True, False])
+
+
+class FingerprintLSHTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        #* Every fingerprint repeats its own letter (bigrams are lower case), no two videos share a bigram
+        self.FINGER_PRINT_list = [letter * (10 + i % 3) for i, letter in enumerate("BGLNRacdef")]
+        _write_video_detail(self.folder, ["{}.mp4".format(i) for i in range(10)], ["0b" + "0" * 64] * 10, self.FINGER_PRINT_list)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_no_candidate(self):
+        fingerprint_lsh = vst.FingerprintLSH(vst.FingerprintComparisonEngine(self.FINGER_PRINT_list, fallback=None), 0.8)
+        vid1_idx, vid2_idx = fingerprint_lsh.pairs_above()
+        self.assertEqual((vid1_idx.shape[0], vid2_idx.shape[0]), (0, 0))
+        self.assertEqual(fingerprint_lsh.recall(vid1_idx, vid2_idx), (None, 0))
+        #* A whole run without any pair to score writes a result without rows
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            vst.VideoSimilarityTester(cache_path=self.folder, PATH_list_filepath=os.path.join(self.folder, "list.csv"), export_video_detail=self.folder, export_comparison_result=self.folder, remove_cache=False, signature_cache=False, fingerprint_threshold=0.8, rescore=True)
+        with open(os.path.join(self.folder, "comparison_result.csv"), "r") as f:
+            self.assertEqual(len(f.read().splitlines()), 1)
+
+
+class HashComparisonEngineTest(unittest.TestCase):
+    def setUp(self):
+        self.hash_list = _random_hash_list(np.random.default_rng(20231018), 120)
+        self.engine = vst.HashComparisonEngine(self.hash_list, fallback=vst._code_fallback(self.hash_list), block_pair=500)
+
+    def test_similarity_matches_compare_code(self):
+        vid1_idx, vid2_idx, similarity = _brute_force_pair(self.hash_list)
+        self.assertTrue(np.array_equal(self.engine.similarity(vid1_idx, vid2_idx), similarity))
+
+    def test_iter_block_matches_compare_code(self):
+        for first_new in [0, 100]:
+            expected = _brute_force_pair(self.hash_list, first_new=first_new)
+            block_list = list(self.engine.iter_block(first_new=first_new))
+            self.assertGreater(len(block_list), 1)
+            for column, expected_column in zip(zip(*block_list), expected):
+                self.assertTrue(np.array_equal(np.concatenate(column), expected_column))
+
+
+class HashIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.hash_list = _random_hash_list(np.random.default_rng(20231019), 300)
+        self.engine = vst.HashComparisonEngine(self.hash_list, fallback=vst._code_fallback(self.hash_list))
+
+    def test_pairs_above_matches_brute_force(self):
+        #* 0.99, 0.95 and 0.9 use 1, 4 and 7 substring tables, 0.5 falls back to blocked brute force
+        for first_new in [0, 250]:
+            vid1_idx, vid2_idx, similarity = _brute_force_pair(self.hash_list, first_new=first_new)
+            for threshold in [1.0, 0.99, 0.95, 0.9, 0.5]:
+                keep = similarity >= threshold
+                result = vst.HashIndex(self.engine, threshold).pairs_above(first_new=first_new)
+                self.assertGreater(keep.sum(), 0)
+                for column, expected_column in zip(result, (vid1_idx[keep], vid2_idx[keep], similarity[keep])):
+                    self.assertTrue(np.array_equal(column, expected_column))
+
+    def test_neighbours_matches_brute_force(self):
+        #* Exact and planted near duplicates of indexed hashes, an unrelated hash, a 60-bit hash and a failed hash
+        bit_list = list(self.hash_list[0][2:])
+        bit_list[3] = "1" if bit_list[3] == "0" else "0"
+        query_list = [self.hash_list[0], "0b" + "".join(bit_list), self.hash_list[2], "0b" + "1" * 64, self.hash_list[22], ""]
+        for threshold in [0.99, 0.95, 0.9, 0.5]:
+            index = vst.HashIndex(self.engine, threshold)
+            for query in query_list:
+                expected = []
+                for i, video_hash in enumerate(self.hash_list):
+                    try:
+                        expected.append(vst._compare_code(query, video_hash))
+                    except Exception:
+                        expected.append(0)
+                expected = np.array(expected, dtype=float)
+                candidate, similarity = index.neighbours(query)
+                self.assertTrue(np.array_equal(candidate, np.flatnonzero(expected >= threshold)))
+                self.assertTrue(np.array_equal(similarity, expected[candidate]))
+
+
+class FingerprintComparisonEngineTest(unittest.TestCase):
+    def setUp(self):
+        #* Mostly equal lengths so that both the position by position and the bigram comparison are common, every 13th fingerprint is empty
+        rng = np.random.default_rng(20231020)
+        self.finger_print_list = ["" if i % 13 == 6 else "".join(rng.choice(list("NBnRrGgLl"), size=rng.integers(8, 11))) for i in range(90)]
+
+    def check_engine(self, finger_print_list: list, new_finger_print_list: list) -> None:
+        engine = vst.FingerprintComparisonEngine(finger_print_list, fallback=vst._code_fallback(finger_print_list), chunk_element=256)
+        vid1_idx, vid2_idx, similarity = _brute_force_pair(finger_print_list)
+        self.assertTrue(np.array_equal(engine.similarity(vid1_idx, vid2_idx), similarity))
+        for finger_print in new_finger_print_list:
+            expected = []
+            for video_finger_print in finger_print_list:
+                try:
+                    expected.append(vst._compare_code(video_finger_print, finger_print))
+                except Exception:
+                    expected.append(0)
+            self.assertTrue(np.array_equal(engine.similarity_to(finger_print, np.arange(len(finger_print_list))), np.array(expected, dtype=float)))
+            engine.append(finger_print)
+        #* finger_print_list now holds the appended fingerprints too
+        vid1_idx, vid2_idx, similarity = _brute_force_pair(finger_print_list)
+        self.assertTrue(np.array_equal(engine.similarity(vid1_idx, vid2_idx), similarity))
+
+    def test_ascii_matches_compare_code(self):
+        #* New fingerprints: equal length to existing ones, a new bigram, an empty one and one longer than any indexed fingerprint
+        self.check_engine(self.finger_print_list, [self.finger_print_list[0], "NBnRrGgLXZ", "", "NBnRrGgLlNBnRrGgLl"])
+
+    def test_non_ascii_matches_compare_code(self):
+        self.check_engine(self.finger_print_list + ["NBnÄäRrGg", "ÄÄNBnRrGg"], ["NBnÄäRrGg", "ÉBnRrGgLl", ""])
+
+
+class IncrementalTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        rng = np.random.default_rng(20231021)
+        self.PATH_list = ["{}.mp4".format(i) for i in range(60)]
+        HASH_list = _random_hash_list(rng, 60)
+        FINGER_PRINT_list = ["".join(rng.choice(list("NBnRrGgLl"), size=rng.integers(8, 11))) for _ in range(60)]
+        self.signature = dict(zip(self.PATH_list, zip(HASH_list, FINGER_PRINT_list)))
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def run_tester(self, export_path: str, video_count: int, **option) -> pd.DataFrame:
+        #* A PATH list run of the first video_count videos, hashing and fingerprinting are replaced by the prepared signatures
+        os.makedirs(export_path, exist_ok=True)
+        list_path = os.path.join(self.folder, "list.csv")
+        with open(list_path, "w") as f:
+            f.write("".join("{},\n".format(path) for path in self.PATH_list[:video_count]))
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            tester = vst.VideoSimilarityTester(cache_path=self.folder, PATH_list_filepath=list_path, export_video_detail=export_path, export_comparison_result=export_path, remove_cache=False, signature_cache=False, run=False, **option)
+            tester._load_PATH_list()
+            if tester.incremental == True:
+                tester._load_previous_result()
+            for i, path in enumerate(tester.PATH_list):
+                video_hash, finger_print = self.signature[path]
+                tester.hash_result[i] = (video_hash, "", "", "")
+                tester.fingerprint_result[i] = finger_print
+            tester._save_hash_result()
+            tester._save_finger_print_result()
+            if tester.previous_video_detail_dataframe is not None:
+                tester._merge_previous_video_detail()
+            tester._write_video_detail()
+            tester._generate_result()
+        comparison_dataframe = pd.read_csv(os.path.join(export_path, "comparison_result.csv"))
+        return comparison_dataframe.sort_values(["vid1_idx", "vid2_idx"], ignore_index=True)
+
+    def test_incremental_matches_full_run(self):
+        #* Previous result of 40 videos read back from CSV, 20 new videos appended, with and without --stream
+        for option in [{}, {"stream_result": True}]:
+            expected = self.run_tester(os.path.join(self.folder, "full"), 60, **option)
+            export_path = os.path.join(self.folder, "incremental")
+            self.run_tester(export_path, 40, **option)
+            result = self.run_tester(export_path, 60, incremental=True, **option)
+            self.assertEqual(result.shape[0], 60 * 59 // 2)
+            for column in ["vid1_idx", "vid2_idx", "mix_idx", "hash_similarity"]:
+                self.assertTrue((result[column] == expected[column]).all())
+            #* Previous fingerprint similarity is mapped back to raw values and normalized again, exact up to rounding
+            for column in ["fingerprint_similarity", "avg_similarity"]:
+                self.assertTrue(np.allclose(result[column], expected[column], rtol=0, atol=1e-12))
+            for name in ["video_detail.csv", "comparison_result.json"]:
+                with open(os.path.join(self.folder, "full", name), "r") as f, open(os.path.join(export_path, name), "r") as g:
+                    self.assertEqual(g.read(), f.read())
+            shutil.rmtree(export_path)
+
+
+def _brute_force_top_k(comparison_dataframe: pd.DataFrame, k: int) -> pd.DataFrame:
+    #* Every pair ranked for both of its videos by (-avg_similarity, partner index), pairs among the first k of either video, in itertools.combinations order
+    ranking = pd.concat([comparison_dataframe.assign(video=comparison_dataframe["vid1_idx"], partner=comparison_dataframe["vid2_idx"]), comparison_dataframe.assign(video=comparison_dataframe["vid2_idx"], partner=comparison_dataframe["vid1_idx"])])
+    ranking = ranking.assign(negative_avg_similarity=-ranking["avg_similarity"]).sort_values(["video", "negative_avg_similarity", "partner"])
+    kept = ranking.groupby("video").head(k)
+    kept = kept.drop_duplicates(["vid1_idx", "vid2_idx"]).sort_values(["vid1_idx", "vid2_idx"], ignore_index=True)
+    return kept[comparison_dataframe.columns]
+
+
+class TopKTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        rng = np.random.default_rng(20231022)
+        PATH_list = ["{}.mp4".format(i) for i in range(50)]
+        HASH_list = _random_hash_list(rng, 50)
+        FINGER_PRINT_list = ["".join(rng.choice(list("NBnRrGgLl"), size=rng.integers(8, 11))) for _ in range(50)]
+        _write_video_detail(self.folder, PATH_list, HASH_list, FINGER_PRINT_list)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def run_tester(self, **option) -> pd.DataFrame:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            vst.VideoSimilarityTester(cache_path=self.folder, PATH_list_filepath=os.path.join(self.folder, "list.csv"), export_video_detail=self.folder, export_comparison_result=self.folder, remove_cache=False, signature_cache=False, rescore=True, **option)
+        return pd.read_csv(os.path.join(self.folder, "comparison_result.csv"))
+
+    def test_collector_matches_brute_force(self):
+        #* Similarities rounded to one decimal so that many pairs tie and the partner index decides, added in blocks smaller and larger than chunk_size
+        rng = np.random.default_rng(20231023)
+        vid1_idx, vid2_idx = np.triu_indices(40, k=1)
+        comparison_dataframe = pd.DataFrame({"vid1_idx": vid1_idx, "vid2_idx": vid2_idx, "mix_idx": vst._mix_idx(vid1_idx, vid2_idx), "hash_similarity": rng.random(vid1_idx.shape[0]), "fingerprint_similarity": rng.random(vid1_idx.shape[0]), "avg_similarity": np.round(rng.random(vid1_idx.shape[0]), 1)})
+        for k in [1, 3, 50]:
+            collector = vst.TopKCollector(40, k, chunk_size=37)
+            for start in range(0, comparison_dataframe.shape[0], 100):
+                block = comparison_dataframe.iloc[start:start + 100]
+                collector.add(block["vid1_idx"].to_numpy(), block["vid2_idx"].to_numpy(), block["avg_similarity"].to_numpy(), block["hash_similarity"].to_numpy(), block["fingerprint_similarity"].to_numpy())
+            pd.testing.assert_frame_equal(collector.dataframe(comparison_dataframe.columns).astype(comparison_dataframe.dtypes), _brute_force_top_k(comparison_dataframe, k))
+
+    def test_stream_matches_full_result(self):
+        #* --stream with --min-similarity and --top-k against the same selection on the full comparison result
+        expected = self.run_tester()
+        min_similarity = float(expected["avg_similarity"].median())
+        above = expected[expected["avg_similarity"] >= min_similarity].reset_index(drop=True)
+        pd.testing.assert_frame_equal(self.run_tester(stream_result=True, min_similarity=min_similarity), above)
+        pd.testing.assert_frame_equal(self.run_tester(stream_result=True, top_k=3), _brute_force_top_k(expected, 3))
+        pd.testing.assert_frame_equal(self.run_tester(stream_result=True, top_k=3, min_similarity=min_similarity), _brute_force_top_k(above, 3))
+
+
+class _SmallBlockHashEngine(vst.HashComparisonEngine):
+    #* One row of the pair matrix per comparison block, so that a run has many blocks to interrupt
+    def __init__(self, hash_list, fallback, **option) -> None:
+        super().__init__(hash_list, fallback, block_pair=1, **option)
+
+
+class ResumeTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        rng = np.random.default_rng(20231018)
+        self.HASH_list = np.array(["0b" + "".join(rng.choice(["0", "1"], size=64)) for _ in range(60)])
+        self.FINGER_PRINT_list = np.array(["".join(rng.choice(list("NBnRrGgLl"), size=rng.integers(8, 12))) for _ in range(60)])
+        _write_video_detail(self.folder, ["{}.mp4".format(i) for i in range(60)], self.HASH_list, self.FINGER_PRINT_list)
+        self.HashComparisonEngine = vst.HashComparisonEngine
+        vst.HashComparisonEngine = _SmallBlockHashEngine
+
+    def tearDown(self):
+        vst.HashComparisonEngine = self.HashComparisonEngine
+        shutil.rmtree(self.folder)
+
+    def generate_result(self, export_path: str, fail_after=None) -> None:
+        #* Comparison phase of a run with --stream --resume, fingerprint similarity fails after fail_after blocks
+        os.makedirs(export_path, exist_ok=True)
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            tester = vst.VideoSimilarityTester(cache_path=self.folder, PATH_list_filepath=os.path.join(self.folder, "list.csv"), export_video_detail=export_path, export_comparison_result=export_path, remove_cache=False, signature_cache=False, stream_result=True, resume=True, run=False)
+            tester.PATH_list, tester.HASH_list, tester.FINGER_PRINT_list = np.array(["{}.mp4".format(i) for i in range(60)]), self.HASH_list, self.FINGER_PRINT_list
+            tester._open_journal()
+            similarity = vst.FingerprintComparisonEngine.similarity
+            call_count = []
+            def failing_similarity(engine, vid1_idx, vid2_idx):
+                call_count.append(None)
+                if fail_after != None and len(call_count) > fail_after:
+                    raise KeyboardInterrupt
+                return similarity(engine, vid1_idx, vid2_idx)
+            vst.FingerprintComparisonEngine.similarity = failing_similarity
+            try:
+                tester._generate_result()
+                tester.journal.close(complete=True)
+            except KeyboardInterrupt:
+                tester.journal.close()
+            finally:
+                vst.FingerprintComparisonEngine.similarity = similarity
+        return len(call_count)
+
+    def test_resume_stream_comparison(self):
+        self.assertEqual(self.generate_result(os.path.join(self.folder, "expected")), 59 * 2)
+        with open(os.path.join(self.folder, "expected", "comparison_result.csv"), "r") as f:
+            expected = f.read()
+        #* Interrupted in the first pass, then in the second pass, then finished: every block is compared once per pass
+        export_path = os.path.join(self.folder, "resumed")
+        self.assertEqual(self.generate_result(export_path, fail_after=20), 21)
+        self.assertEqual(self.generate_result(export_path, fail_after=60), 61)
+        self.assertEqual(self.generate_result(export_path), 59 * 2 - 20 - 60)
+        with open(os.path.join(export_path, "comparison_result.csv"), "r") as f:
+            self.assertEqual(f.read(), expected)
+        self.assertFalse(os.path.exists(os.path.join(self.folder, "run_journal")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,15 +1,54 @@
-from videohash import VideoHash
-from pytube import YouTube
-import videofingerprint as vfp
 import pandas as pd
 import numpy as np
 import csv
 import logging
 import os
-import itertools
 import sys
 import getopt
 import subprocess
+import sqlite3
+import hashlib
+import time
+import concurrent.futures
+import multiprocessing
+import math
+import re
+import io
+import json
+import shutil
+import queue
+import urllib.parse
+import urllib.request
+import urllib.error
+import contextlib
+import http.server
+import socketserver
+import socket
+import cProfile
+try:
+    import resource
+except ImportError:
+    resource = None
+
+#* Video libraries are imported on first use by _import_video_library(), re-scoring exported signatures never loads them
+VideoHash = None
+FFmpegNotFound = None
+YouTube = None
+vfp = None
+Image = None
+imagehash = None
+
+def _import_video_library() -> None:
+    global VideoHash, FFmpegNotFound, YouTube, vfp, Image, imagehash
+    #* imagehash is bound last, so a thread never sees a half imported set
+    if imagehash != None:
+        return
+    from videohash import VideoHash
+    from videohash.exceptions import FFmpegNotFound
+    from pytube import YouTube
+    import videofingerprint as vfp
+    from PIL import Image
+    import imagehash
 
 def config_logging() -> None:
     logger_file_path = "./vst.log"
@@ -73,14 +112,1278 @@ class VST_Warning:
         print("{}General warning: {}.{}".format(self.warning_str, warning, self.end_str))
         self.logger.warning(warning)
 
+class RunMetrics:
+    #* Wall time, CPU time, per-video latency, counters and peak RSS of every phase, exported as a JSON run report
+    def __init__(self, profile_phase_list=None) -> None:
+        self.profile_phase_list = profile_phase_list if profile_phase_list != None else []
+        self.start_time = time.time()
+        self.start_perf_counter = time.perf_counter()
+        self.phase_list = []
+        self.current = None
+        self.profile_list = []
+        self.detail = {}
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        record = {"phase": name, "wall_seconds": 0.0, "cpu_seconds": 0.0, "children_cpu_seconds": 0.0, "peak_rss_mb": None, "children_peak_rss_mb": None, "counter": {}, "video_latency": {}}
+        previous, self.current = self.current, record
+        self.phase_list.append(record)
+        latency_list = {}
+        record["_latency_list"] = latency_list
+        profiler = None
+        if name in self.profile_phase_list or "all" in self.profile_phase_list:
+            profiler = cProfile.Profile()
+        start_times = os.times()
+        start_cpu_time, start_perf_counter = time.process_time(), time.perf_counter()
+        if profiler != None:
+            profiler.enable()
+        try:
+            yield record
+        finally:
+            if profiler != None:
+                profiler.disable()
+                self.profile_list.append((name, profiler))
+            end_times = os.times()
+            record["wall_seconds"] = time.perf_counter() - start_perf_counter
+            record["cpu_seconds"] = time.process_time() - start_cpu_time
+            #* Worker processes and FFmpeg subprocesses are only counted once they have been waited for
+            record["children_cpu_seconds"] = (end_times.children_user - start_times.children_user) + (end_times.children_system - start_times.children_system)
+            record["peak_rss_mb"], record["children_peak_rss_mb"] = self.peak_rss()
+            for job_name, latency in record.pop("_latency_list").items():
+                latency = np.array(latency, dtype=float)
+                record["video_latency"][job_name] = {"count": int(latency.shape[0]), "mean": float(latency.mean()), "p50": float(np.percentile(latency, 50)), "p90": float(np.percentile(latency, 90)), "p99": float(np.percentile(latency, 99)), "max": float(latency.max())}
+            logging.info("Phase {} took {:.3f}s wall, {:.3f}s CPU, {:.3f}s children CPU.".format(name, record["wall_seconds"], record["cpu_seconds"], record["children_cpu_seconds"]))
+            self.current = previous
+
+    def video(self, job_name: str, seconds: float) -> None:
+        #* Latency of one video job, measured where the job ran
+        if self.current != None:
+            self.current["_latency_list"].setdefault(job_name, []).append(seconds)
+
+    def count(self, name: str, value=1) -> None:
+        if self.current != None:
+            self.current["counter"][name] = self.current["counter"].get(name, 0) + value
+
+    @staticmethod
+    def peak_rss() -> tuple:
+        #* Peak resident set size in MB of this process and of its largest waited child, not available on Windows
+        if resource == None:
+            return None, None
+        unit = 2**20 if sys.platform == "darwin" else 2**10
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / unit, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / unit
+
+    def write(self, export_path: str) -> None:
+        #* Profiles are saved next to the report as <report>_<phase>.prof, readable with pstats
+        profile_path_list = {}
+        for name, profiler in self.profile_list:
+            profile_path = "{}_{}.prof".format(os.path.splitext(export_path)[0], name)
+            profiler.dump_stats(profile_path)
+            profile_path_list[name] = profile_path
+        for record in self.phase_list:
+            if record["phase"] in profile_path_list:
+                record["profile_path"] = profile_path_list[record["phase"]]
+        peak_rss_mb, children_peak_rss_mb = self.peak_rss()
+        report = {"start_time": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.start_time)), "wall_seconds": time.perf_counter() - self.start_perf_counter, "peak_rss_mb": peak_rss_mb, "children_peak_rss_mb": children_peak_rss_mb, **self.detail, "phase": self.phase_list}
+        with open(export_path, "w") as f:
+            json.dump(report, f, indent=2)
+
+class SignatureCache:
+    #* Persistent signature cache keyed by file content identity (size, mtime, partial content hash)
+    def __init__(self, cache_path: str, max_age_days=None, max_entries=None, variant=None) -> None:
+        self.db_path = os.path.abspath(os.path.join(cache_path, "signature_cache.sqlite3"))
+        self.max_age_days = max_age_days
+        self.max_entries = max_entries
+        #* Signatures of another decode mode (e.g. fast decode) are kept under their own keys
+        self.variant = variant
+        self.partial_hash_chunk_size = 64 * 1024
+        self.hit_count = {"hash": 0, "fingerprint": 0, "segment": 0}
+        self.miss_count = {"hash": 0, "fingerprint": 0, "segment": 0}
+        self.connection = sqlite3.connect(self.db_path)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS signature (content_key TEXT PRIMARY KEY, path TEXT, hash TEXT, hash_hex TEXT, bits_in_hash TEXT, fingerprint TEXT, last_access REAL, segment_thumbnail BLOB)")
+        #* Caches created before segment hashing lack the thumbnail column
+        if "segment_thumbnail" not in [row[1] for row in self.connection.execute("PRAGMA table_info(signature)")]:
+            self.connection.execute("ALTER TABLE signature ADD COLUMN segment_thumbnail BLOB")
+        #* Fingerprints cached before version 1 may depend on the video fingerprinted before them in the same worker process
+        if self.connection.execute("PRAGMA user_version").fetchone()[0] < 1:
+            self.connection.execute("UPDATE signature SET fingerprint = NULL")
+            self.connection.execute("PRAGMA user_version = 1")
+        self.connection.commit()
+        logging.info("Opened signature cache at {}.".format(self.db_path))
+
+    def content_key(self, path: str):
+        #* Size + mtime + hash of the first, middle and last chunk of the file
+        try:
+            stat = os.stat(path)
+            digest = hashlib.blake2b(digest_size=16)
+            with open(path, "rb") as f:
+                for offset in (0, max(0, stat.st_size // 2 - self.partial_hash_chunk_size // 2), max(0, stat.st_size - self.partial_hash_chunk_size)):
+                    f.seek(offset)
+                    digest.update(f.read(self.partial_hash_chunk_size))
+        except OSError as e:
+            logging.warning("Failed to compute signature cache key of {}: {}".format(path, e))
+            return None
+        content_key = "{}-{}-{}".format(stat.st_size, stat.st_mtime_ns, digest.hexdigest())
+        return content_key if self.variant == None else "{}-{}".format(content_key, self.variant)
+
+    def get_hash(self, content_key: str):
+        row = self._get(content_key, "hash, hash_hex, bits_in_hash", "hash")
+        self._count("hash", row)
+        return row
+
+    def get_fingerprint(self, content_key: str):
+        row = self._get(content_key, "fingerprint", "fingerprint")
+        self._count("fingerprint", row)
+        return None if row is None else row[0]
+
+    def get_segment_thumbnail(self, content_key: str):
+        row = self._get(content_key, "segment_thumbnail", "segment_thumbnail")
+        self._count("segment", row)
+        return None if row is None else np.frombuffer(row[0], dtype=np.uint8).reshape(-1, 64)
+
+    def put_hash(self, content_key: str, path: str, video_hash: str, hash_hex: str, bits_in_hash) -> None:
+        self.connection.execute("INSERT INTO signature (content_key, path, hash, hash_hex, bits_in_hash, last_access) VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(content_key) DO UPDATE SET path=excluded.path, hash=excluded.hash, hash_hex=excluded.hash_hex, bits_in_hash=excluded.bits_in_hash, last_access=excluded.last_access", (content_key, path, video_hash, hash_hex, str(bits_in_hash), time.time()))
+        self.connection.commit()
+
+    def put_fingerprint(self, content_key: str, path: str, fingerprint: str) -> None:
+        self.connection.execute("INSERT INTO signature (content_key, path, fingerprint, last_access) VALUES (?, ?, ?, ?) ON CONFLICT(content_key) DO UPDATE SET path=excluded.path, fingerprint=excluded.fingerprint, last_access=excluded.last_access", (content_key, path, fingerprint, time.time()))
+        self.connection.commit()
+
+    def put_segment_thumbnail(self, content_key: str, path: str, thumbnail: np.ndarray) -> None:
+        self.connection.execute("INSERT INTO signature (content_key, path, segment_thumbnail, last_access) VALUES (?, ?, ?, ?) ON CONFLICT(content_key) DO UPDATE SET path=excluded.path, segment_thumbnail=excluded.segment_thumbnail, last_access=excluded.last_access", (content_key, path, thumbnail.astype(np.uint8).tobytes(), time.time()))
+        self.connection.commit()
+
+    def invalidate(self) -> None:
+        #* Drop every cached signature
+        removed = self.connection.execute("DELETE FROM signature").rowcount
+        self.connection.commit()
+        logging.info("Invalidated signature cache, removed {} entries.".format(removed))
+
+    def evict(self) -> None:
+        #* Drop entries not used for max_age_days, then keep only the max_entries most recently used
+        removed = 0
+        if self.max_age_days != None:
+            removed += self.connection.execute("DELETE FROM signature WHERE last_access < ?", (time.time() - self.max_age_days * 86400,)).rowcount
+        if self.max_entries != None:
+            removed += self.connection.execute("DELETE FROM signature WHERE content_key NOT IN (SELECT content_key FROM signature ORDER BY last_access DESC LIMIT ?)", (self.max_entries,)).rowcount
+        self.connection.commit()
+        logging.info("Evicted {} entries from signature cache.".format(removed))
+
+    def log_statistics(self) -> None:
+        for kind in ("hash", "fingerprint", "segment"):
+            logging.info("Signature cache {} lookup: {} hits, {} misses.".format(kind, self.hit_count[kind], self.miss_count[kind]))
+        print("Signature cache: hash {} hits/{} misses, fingerprint {} hits/{} misses, segment {} hits/{} misses.".format(self.hit_count["hash"], self.miss_count["hash"], self.hit_count["fingerprint"], self.miss_count["fingerprint"], self.hit_count["segment"], self.miss_count["segment"]))
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def _get(self, content_key: str, columns: str, required_column: str):
+        if content_key == None:
+            return None
+        row = self.connection.execute("SELECT {} FROM signature WHERE content_key = ? AND {} IS NOT NULL".format(columns, required_column), (content_key,)).fetchone()
+        if row != None:
+            self.connection.execute("UPDATE signature SET last_access = ? WHERE content_key = ?", (time.time(), content_key))
+            self.connection.commit()
+        return row
+
+    def _count(self, kind: str, row) -> None:
+        if row == None:
+            self.miss_count[kind] += 1
+        else:
+            self.hit_count[kind] += 1
+
+def _timed_job(job, *argument) -> tuple:
+    #* Run a per-video job and measure its latency where it runs, so waiting in the process pool queue is not counted
+    start_time = time.perf_counter()
+    result, failure_list = job(*argument)
+    return result, failure_list, time.perf_counter() - start_time
+
+def _download_job(url: str, path: str, retry: int, backoff: float) -> tuple:
+    #* Download one video to path, runs in a download thread, waits backoff * 2^try seconds between tries
+    _import_video_library()
+    failure_list = []
+    for count in range(retry):
+        if count != 0:
+            time.sleep(backoff * 2 ** (count - 1))
+        try:
+            hostname = urllib.parse.urlparse(url).hostname or ""
+            if hostname.endswith("youtube.com") or hostname.endswith("youtu.be"):
+                yt = YouTube(url)
+                yt.streams.filter(progressive=True, file_extension="mp4").order_by("resolution").desc().first().download(filename=path)
+                return yt.title, failure_list
+            #* Direct link to a video file, written under a temporary name so only complete files land in cache folder
+            with urllib.request.urlopen(url, timeout=60) as response, open(path + ".part", "wb") as f:
+                shutil.copyfileobj(response, f)
+            os.replace(path + ".part", path)
+            return os.path.basename(urllib.parse.urlparse(url).path), failure_list
+        except Exception as e:
+            failure_list.append(str(e))
+            if not _is_transient_download_error(e):
+                break
+    return None, failure_list
+
+def _is_transient_download_error(e: Exception) -> bool:
+    #* Server errors, throttling and network timeouts may pass on the next try, anything else (404, bad URL, unavailable video) will not
+    if isinstance(e, urllib.error.HTTPError):
+        return e.code >= 500 or e.code in (408, 429)
+    return isinstance(e, (urllib.error.URLError, TimeoutError, ConnectionError))
+
+def _hash_job(path: str, retry: int) -> tuple:
+    #* Hash one video, runs in a worker process when --workers is given
+    _import_video_library()
+    failure_list = []
+    for _ in range(retry):
+        try:
+            videohash = VideoHash(path)
+            return [videohash.hash, videohash.hash_hex, videohash.collage_path, videohash.bits_in_hash], failure_list
+        except FFmpegNotFound:
+            raise
+        except Exception as e:
+            failure_list.append(str(e))
+    return None, failure_list
+
+def _finger_print_job(path: str, retry: int) -> tuple:
+    #* Fingerprint one video, runs in a worker process when --workers is given
+    _import_video_library()
+    failure_list = []
+    for _ in range(retry):
+        try:
+            #* Luminance of the previous frame is class state of videofingerprint, a worker process would carry it over from its previous video
+            vfp.VideoFingerprint.previous_color = 0
+            vp = vfp.VideoFingerprint(path)
+            return vp.fingerprint, failure_list
+        except Exception as e:
+            failure_list.append(str(e))
+    return None, failure_list
+
+def _detect_crop(path: str, keyframe_only=False) -> str:
+    #* Same black bar detection as videohash/videofingerprint FramesExtractor.detect_crop
+    #* keyframe_only runs cropdetect once over the keyframes instead of seeking 12 times
+    crop_list = []
+    if keyframe_only == True:
+        command_list = [["ffmpeg", "-nostdin", "-skip_frame", "nokey", "-i", path, "-vf", "cropdetect=skip=0", "-f", "null", "-"]]
+    else:
+        command_list = [["ffmpeg", "-ss", str(start_time), "-i", path, "-vframes", "3", "-vf", "cropdetect", "-f", "null", "-"] for start_time in [2, 5, 10, 20, 40, 100, 300, 600, 1200, 2400, 7200, 14400]]
+    for command in command_list:
+        process = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        crop_list.extend(re.findall(r"crop\=[0-9]{1,4}:[0-9]{1,4}:[0-9]{1,4}:[0-9]{1,4}", (process.stdout + process.stderr).decode(errors="ignore")))
+    if len(crop_list) == 0:
+        return ""
+    return max(crop_list, key=crop_list.count)
+
+def _decode_frames(path: str, frame_size_list: list, crop: str) -> list:
+    #* Decode the video once, one frame per second, into one JPEG stream per frame size (same encoding as the frames of FramesExtractor)
+    command = ["ffmpeg", "-nostdin", "-loglevel", "quiet", "-i", path]
+    for frame_size, pipe in zip(frame_size_list, ["pipe:1", "pipe:2"]):
+        if crop != "":
+            command += ["-vf", crop]
+        command += ["-s", "{}x{}".format(frame_size, frame_size), "-r", "1", "-f", "image2pipe", "-c:v", "mjpeg", pipe]
+    process = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    frames_list = []
+    for stream in [process.stdout, process.stderr][:len(frame_size_list)]:
+        frames = []
+        start = 0
+        end = stream.find(b"\xff\xd9", start)
+        while end != -1:
+            frames.append(np.asarray(Image.open(io.BytesIO(stream[start:end+2])).convert("RGB")))
+            start = end + 2
+            end = stream.find(b"\xff\xd9", start)
+        if len(frames) == 0:
+            raise RuntimeError("FFmpeg could not extract any frames from {}.".format(path))
+        frames_list.append(np.stack(frames))
+    return frames_list
+
+#* Frame sizes of fast decode (hash, fingerprint), fingerprint colors are classified on 16x16 anyway, the hash collage needs full size frames
+FAST_DECODE_FRAME_SIZE_LIST = [144, 16]
+
+def _decode_raw_frames(path: str, frame_size_list: list, crop: str, fast_decode: str) -> list:
+    #* Fast decode: only keyframes ("keyframe") or frames at a fixed rate (frames per second), scaled down while decoding and piped as raw RGB straight into NumPy
+    command = ["ffmpeg", "-nostdin", "-loglevel", "quiet"]
+    if fast_decode == "keyframe":
+        command += ["-skip_frame", "nokey"]
+    command += ["-i", path]
+    for frame_size, pipe in zip(frame_size_list, ["pipe:1", "pipe:2"]):
+        video_filter = ([crop] if crop != "" else []) + ["scale={0}:{0}:flags=area".format(frame_size), "format=rgb24"]
+        #* Output rate like "-r 1" of FramesExtractor so that the same frames are sampled, keyframes are passed through as decoded
+        rate_option = ["-fps_mode", "passthrough"] if fast_decode == "keyframe" else ["-r", str(fast_decode)]
+        command += ["-vf", ",".join(video_filter)] + rate_option + ["-f", "rawvideo", pipe]
+    process = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    frames_list = []
+    for frame_size, stream in zip(frame_size_list, [process.stdout, process.stderr]):
+        frame_byte_count = frame_size * frame_size * 3
+        if len(stream) < frame_byte_count:
+            raise RuntimeError("FFmpeg could not extract any frames from {}.".format(path))
+        frames_list.append(np.frombuffer(stream, dtype=np.uint8)[:len(stream) // frame_byte_count * frame_byte_count].reshape(-1, frame_size, frame_size, 3))
+    return frames_list
+
+def _dominant_color(image) -> str:
+    #* Same classification as imagedominantcolor.DominantColor (16x16 resize, 10% margin)
+    pixels = np.asarray(image.resize((16, 16), Image.LANCZOS).convert("RGB"), dtype=np.int16).reshape(-1, 3)
+    r, g, b = pixels[:, 0], pixels[:, 1], pixels[:, 2]
+    count = {"r": int(np.sum((r > g) & (r > b))), "g": int(np.sum((g > b) & (g > r))), "b": int(np.sum((b > r) & (b > g)))}
+    count["l"] = pixels.shape[0] - count["r"] - count["g"] - count["b"]
+    #* Ties between "l" and another color are order dependent in the original, treat them as not "l"
+    if count["l"] > max(count["r"], count["g"], count["b"]):
+        return "l"
+    mpd = int(pixels.shape[0] * 0.1)
+    if (count["r"] - mpd) > count["g"] and (count["r"] - mpd) > count["b"]:
+        return "r"
+    if (count["g"] - mpd) > count["b"] and (count["g"] - mpd) > count["r"]:
+        return "g"
+    if (count["b"] - mpd) > count["r"] and (count["b"] - mpd) > count["g"]:
+        return "b"
+    return "n"
+
+def _collage_hash(frames: np.ndarray) -> list:
+    #* Same construction as VideoHash: wavelet hash of the frame collage XOR dominant colors of 64 tiles of the frame strip
+    frame_count, frame_height, frame_width = frames.shape[0], frames.shape[1], frames.shape[2]
+    images_per_row = int(round(math.sqrt(frame_count)))
+    scale = 1024 / (images_per_row * frame_width)
+    scaled_width, scaled_height = math.ceil(frame_width * scale), math.ceil(frame_height * scale)
+    collage = Image.new("RGB", (1024, math.ceil(scale * frame_height * math.ceil(frame_count / images_per_row))))
+    for count in range(frame_count):
+        frame = Image.fromarray(frames[count])
+        frame.thumbnail((scaled_width, scaled_height), Image.LANCZOS)
+        collage.paste(frame, ((count % images_per_row) * scaled_width, (count // images_per_row) * scaled_height))
+    #* The wavelet hash is taken from the JPEG encoded collage, kept in memory instead of the temp directory
+    collage_buffer = io.BytesIO()
+    collage.save(collage_buffer, format="JPEG")
+    whash_bitlist = imagehash.whash(Image.open(collage_buffer)).hash.astype(int).flatten().tolist()
+    #* Tiles of the horizontal frame strip, row by row like the sorted tile file names of videohash
+    strip = np.concatenate(list(frames), axis=1)
+    tile_width, tile_height = strip.shape[1] // 8, strip.shape[0] // 8
+    dominant_color_list = []
+    for row in range(8):
+        for column in range(8):
+            dominant_color_list.append(_dominant_color(Image.fromarray(strip[row*tile_height:(row+1)*tile_height, column*tile_width:(column+1)*tile_width])))
+    pattern = ["r"] * 16 + ["g"] * 16 + ["b"] * 16 + ["l"] * 16
+    bitlist = [int((pattern[i] == dominant_color_list[i]) != bool(whash_bitlist[i])) for i in range(64)]
+    video_hash = "0b" + "".join(str(bit) for bit in bitlist)
+    return [video_hash, str(hex(int(video_hash, 2))), "", 64]
+
+def _finger_print_frames(frames: np.ndarray) -> str:
+    #* Same construction as videofingerprint: dominant color per frame, upper case when darker than previous frame
+    fingerprint = ""
+    previous_luminance = 0
+    for count in range(frames.shape[0]):
+        frame = Image.fromarray(frames[count])
+        dominant_color = _dominant_color(frame)
+        luminance = list(frame.convert("L").resize((1, 1), Image.LANCZOS).getdata())[0]
+        fingerprint += dominant_color.upper() if previous_luminance > luminance else dominant_color
+        previous_luminance = luminance
+    return fingerprint
+
+def _signature_job(path: str, retry: int, fast_decode=None) -> tuple:
+    #* Decode one video once and compute both hash and fingerprint from the shared frames
+    _import_video_library()
+    failure_list = []
+    for _ in range(retry):
+        try:
+            if fast_decode == None:
+                hash_frames, finger_print_frames = _decode_frames(path, [144, 64], _detect_crop(path))
+            else:
+                hash_frames, finger_print_frames = _decode_raw_frames(path, FAST_DECODE_FRAME_SIZE_LIST, _detect_crop(path, keyframe_only=fast_decode == "keyframe"), fast_decode)
+            return _collage_hash(hash_frames) + [_finger_print_frames(finger_print_frames)], failure_list
+        except FileNotFoundError:
+            raise FFmpegNotFound("FFmpeg is not on the system path.")
+        except Exception as e:
+            failure_list.append(str(e))
+    return None, failure_list
+
+def _segment_thumbnail_job(path: str, retry: int) -> tuple:
+    #* 8x8 gray thumbnail of every second of the video (64 bytes per row), segment hashes of any window length are built from it
+    _import_video_library()
+    failure_list = []
+    for _ in range(retry):
+        try:
+            crop = _detect_crop(path)
+            video_filter = ",".join(([crop] if crop != "" else []) + ["fps=1", "scale=8:8:flags=area", "format=gray"])
+            process = subprocess.run(["ffmpeg", "-nostdin", "-loglevel", "quiet", "-i", path, "-vf", video_filter, "-f", "rawvideo", "pipe:1"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            thumbnail = np.frombuffer(process.stdout, dtype=np.uint8)
+            if thumbnail.shape[0] < 64:
+                raise RuntimeError("FFmpeg could not extract any frames from {}.".format(path))
+            return thumbnail[:thumbnail.shape[0] // 64 * 64].reshape(-1, 64), failure_list
+        except FileNotFoundError:
+            raise FFmpegNotFound("FFmpeg is not on the system path.")
+        except Exception as e:
+            failure_list.append(str(e))
+    return None, failure_list
+
+def _segment_hash(thumbnail: np.ndarray, segment_length: int) -> tuple:
+    #* 64-bit hash of every window of segment_length seconds, one window per second: bits of the mean thumbnail above its median
+    #* Returns (hash, informative), flat windows (black screen, single color) are not informative because they match everything
+    if thumbnail.shape[0] < segment_length:
+        return np.empty(0, dtype=np.uint64), np.empty(0, dtype=bool)
+    cumulative = np.concatenate([np.zeros((1, 64)), np.cumsum(thumbnail, axis=0, dtype=float)])
+    mean = (cumulative[segment_length:] - cumulative[:-segment_length]) / segment_length
+    bits = mean > np.median(mean, axis=1, keepdims=True)
+    informative = (mean.max(axis=1) - mean.min(axis=1)) >= 2
+    return np.packbits(bits, axis=1).view(">u8").ravel().astype(np.uint64), informative
+
+class SegmentIndex:
+    #* Inverted index from bit-bands of segment hashes to (video, offset): two segments within Hamming distance band_count-1 share at least one band exactly
+    def __init__(self, thumbnail_list: list, segment_length: int, band_count=4, max_bucket=64) -> None:
+        self.segment_length = segment_length
+        self.band_count = band_count
+        self.max_bucket = max_bucket
+        video_block_list, offset_block_list, hash_block_list = [np.empty(0, dtype=int)], [np.empty(0, dtype=int)], [np.empty(0, dtype=np.uint64)]
+        self.segment_count = np.zeros(len(thumbnail_list), dtype=int)
+        for i, thumbnail in enumerate(thumbnail_list):
+            if thumbnail is None:
+                continue
+            segment_hash, informative = _segment_hash(thumbnail, segment_length)
+            offset = np.flatnonzero(informative)
+            self.segment_count[i] = offset.shape[0]
+            video_block_list.append(np.full(offset.shape[0], i, dtype=int))
+            offset_block_list.append(offset)
+            hash_block_list.append(segment_hash[offset])
+        self.video = np.concatenate(video_block_list)
+        self.offset = np.concatenate(offset_block_list)
+        self.hash = np.concatenate(hash_block_list)
+        bound = np.linspace(0, 64, band_count + 1).astype(int)
+        self.band_list = [(self.hash >> np.uint64(bound[t])) & np.uint64((1 << int(bound[t+1] - bound[t])) - 1) for t in range(band_count)]
+        logging.info("Built segment index of {} segments of {} videos with {} bands.".format(self.hash.shape[0], len(thumbnail_list), band_count))
+
+    def candidate(self) -> tuple:
+        #* (segment a, segment b) of different videos that share a band and are within band_count-1 bits, every pair once
+        segment_a_block_list, segment_b_block_list = [np.empty(0, dtype=int)], [np.empty(0, dtype=int)]
+        for t, band in enumerate(self.band_list):
+            order = np.argsort(band, kind="stable")
+            sorted_band = band[order]
+            start = np.flatnonzero(np.concatenate([[True], sorted_band[1:] != sorted_band[:-1]]))
+            bucket_size = np.diff(np.concatenate([start, [sorted_band.shape[0]]]))
+            #* Buckets shared by too many segments (static, repeated content) would dominate the candidates
+            usable = np.repeat(bucket_size <= self.max_bucket, bucket_size)
+            #* Members of a bucket are contiguous after sorting, so pairs at distance lag exist only while some bucket is larger than lag
+            for lag in range(1, self.max_bucket):
+                same = (sorted_band[lag:] == sorted_band[:-lag]) & usable[lag:]
+                if not same.any():
+                    break
+                segment_a, segment_b = order[:-lag][same], order[lag:][same]
+                keep = self.video[segment_a] != self.video[segment_b]
+                for earlier in range(t):
+                    keep &= self.band_list[earlier][segment_a] != self.band_list[earlier][segment_b]
+                keep &= _popcount64(self.hash[segment_a] ^ self.hash[segment_b]) <= self.band_count - 1
+                segment_a_block_list.append(segment_a[keep])
+                segment_b_block_list.append(segment_b[keep])
+        return np.concatenate(segment_a_block_list), np.concatenate(segment_b_block_list)
+
+    def matches(self, min_segment=2) -> pd.DataFrame:
+        #* Per video pair: segments aligned on the most common time offset (+-1 second), with matched time ranges in seconds
+        segment_a, segment_b = self.candidate()
+        swap = self.video[segment_a] > self.video[segment_b]
+        segment_a, segment_b = np.where(swap, segment_b, segment_a), np.where(swap, segment_a, segment_b)
+        match = pd.DataFrame({"vid1_idx": self.video[segment_a], "vid2_idx": self.video[segment_b], "vid1_offset": self.offset[segment_a], "vid2_offset": self.offset[segment_b]})
+        match["delta"] = match["vid2_offset"] - match["vid1_offset"]
+        delta_count = match.groupby(["vid1_idx", "vid2_idx", "delta"]).size().reset_index(name="count")
+        best = delta_count.sort_values(["vid1_idx", "vid2_idx", "count", "delta"], ascending=[True, True, False, True]).drop_duplicates(["vid1_idx", "vid2_idx"])
+        match = match.merge(best[["vid1_idx", "vid2_idx", "delta"]].rename(columns={"delta": "best_delta"}), on=["vid1_idx", "vid2_idx"])
+        match = match[(match["delta"] - match["best_delta"]).abs() <= 1]
+        result = match.groupby(["vid1_idx", "vid2_idx"]).agg(matched_segment_count=("vid1_offset", "nunique"), vid1_start=("vid1_offset", "min"), vid1_end=("vid1_offset", "max"), vid2_start=("vid2_offset", "min"), vid2_end=("vid2_offset", "max")).reset_index()
+        result = result[result["matched_segment_count"] >= min_segment]
+        result["vid1_end"] += self.segment_length
+        result["vid2_end"] += self.segment_length
+        vid1_idx, vid2_idx = result["vid1_idx"].to_numpy(dtype=int), result["vid2_idx"].to_numpy(dtype=int)
+        result.insert(2, "mix_idx", _mix_idx(vid1_idx, vid2_idx))
+        #* Share of the shorter video covered by matched segments
+        result.insert(3, "segment_similarity", np.minimum(result["matched_segment_count"].to_numpy() / np.maximum(np.minimum(self.segment_count[vid1_idx], self.segment_count[vid2_idx]), 1), 1.0))
+        return result.sort_values(["vid1_idx", "vid2_idx"]).reset_index(drop=True)
+
+def _compare_code(vid1_code: str, vid2_code: str) -> float:
+    #* Check two code should be same length
+    if len(vid1_code) != len(vid2_code):
+        """
+        Perform bigram comparison between two strings
+        and return a percentage match in decimal form.
+        """
+        pairs1 = _get_bigrams(vid1_code)
+        pairs2 = _get_bigrams(vid2_code)
+        union  = len(pairs1) + len(pairs2)
+        hit_count = 0
+        for x in pairs1:
+            for y in pairs2:
+                if x == y:
+                    hit_count += 1
+                    break
+        return (2.0 * hit_count) / union
+    else:
+        #* Compare two code
+        diffcnt = 0
+        for i in range(len(vid1_code)):
+            if vid1_code[i] != vid2_code[i]:
+                diffcnt += 1
+        return (len(vid1_code) - diffcnt) / len(vid1_code)
+
+def _get_bigrams(string):
+    """
+    Take a string and return a list of bigrams.
+    """
+    s = string.lower()
+    return [s[i:i+2] for i in list(range(len(s) - 1))]
+
+class TopKCollector:
+    #* Best k pairs of every video by avg_similarity, kept in fixed size arrays of video count x k
+    def __init__(self, video_count: int, k: int, chunk_size=2**16) -> None:
+        self.k = k
+        self.chunk_size = chunk_size
+        self.partner = np.full((video_count, k), -1, dtype=np.int64)
+        self.value = np.full((video_count, k, 3), -np.inf, dtype=float)
+
+    def add(self, vid1_idx: np.ndarray, vid2_idx: np.ndarray, avg_similarity: np.ndarray, hash_similarity: np.ndarray, fingerprint_similarity: np.ndarray) -> None:
+        #* Small chunks raise the k-th best value of most videos early, so that most pairs of a block are dropped before sorting
+        for start in range(0, vid1_idx.shape[0], self.chunk_size):
+            chunk = slice(start, start + self.chunk_size)
+            self._add_chunk(vid1_idx[chunk].astype(np.int64), vid2_idx[chunk].astype(np.int64), np.stack([avg_similarity[chunk], hash_similarity[chunk], fingerprint_similarity[chunk]], axis=1))
+
+    def _add_chunk(self, vid1_idx: np.ndarray, vid2_idx: np.ndarray, block_value: np.ndarray) -> None:
+        #* A pair below the current k-th best value of both of its videos can not enter either list, the k-th best value only grows
+        kth_value = self.value[:, self.k - 1, 0]
+        keep = (block_value[:, 0] >= kth_value[vid1_idx]) | (block_value[:, 0] >= kth_value[vid2_idx])
+        vid1_idx, vid2_idx, block_value = vid1_idx[keep], vid2_idx[keep], block_value[keep]
+        if vid1_idx.shape[0] == 0:
+            return
+        #* Every pair is a candidate for both of its videos, merged with the current best pairs of the affected videos
+        video = np.concatenate([vid1_idx, vid2_idx])
+        affected = np.unique(video)
+        video = np.concatenate([np.repeat(affected, self.k), video])
+        partner = np.concatenate([self.partner[affected].ravel(), vid2_idx, vid1_idx])
+        value = np.concatenate([self.value[affected].reshape(-1, 3), block_value, block_value])
+        order = np.lexsort((partner, -value[:, 0], video))
+        video, partner, value = video[order], partner[order], value[order]
+        first = np.searchsorted(video, video, side="left")
+        rank = np.arange(video.shape[0]) - first
+        keep = rank < self.k
+        self.partner[video[keep], rank[keep]] = partner[keep]
+        self.value[video[keep], rank[keep]] = value[keep]
+
+    def dataframe(self, columns) -> pd.DataFrame:
+        #* Pairs kept by any of its two videos, each pair once, in itertools.combinations order
+        video, rank = np.nonzero(self.partner >= 0)
+        partner, value = self.partner[video, rank], self.value[video, rank]
+        vid1_idx, vid2_idx = np.minimum(video, partner), np.maximum(video, partner)
+        unique_pair, unique_index = np.unique(np.stack([vid1_idx, vid2_idx], axis=1), axis=0, return_index=True)
+        block_dataframe = pd.DataFrame(columns=columns)
+        block_dataframe["vid1_idx"] = unique_pair[:, 0]
+        block_dataframe["vid2_idx"] = unique_pair[:, 1]
+        block_dataframe["mix_idx"] = _mix_idx(unique_pair[:, 0], unique_pair[:, 1])
+        block_dataframe["hash_similarity"] = value[unique_index, 1]
+        block_dataframe["fingerprint_similarity"] = value[unique_index, 2]
+        block_dataframe["avg_similarity"] = value[unique_index, 0]
+        return block_dataframe
+
+def _normalize_fingerprint_similarity(fingerprint_similarity: np.ndarray, fingerprint_similarity_range) -> np.ndarray:
+    #* Raw fingerprint similarity (bigram Dice can exceed 1) mapped to 0-1 with the range of all compared pairs
+    if fingerprint_similarity_range == None or fingerprint_similarity_range[1] <= fingerprint_similarity_range[0]:
+        #* No spread to normalize with (no pair or all pairs equal), raw similarity is only clipped
+        return np.clip(fingerprint_similarity, 0, 1)
+    return (fingerprint_similarity - fingerprint_similarity_range[0]) / (fingerprint_similarity_range[1] - fingerprint_similarity_range[0])
+
+def _read_fingerprint_similarity_range(range_path: str):
+    #* [min, max] written next to comparison_result.csv, None when that result has no pair
+    with open(range_path, "r") as f:
+        fingerprint_similarity_range = json.load(f)
+    if fingerprint_similarity_range["fingerprint_similarity_min"] == None or fingerprint_similarity_range["fingerprint_similarity_max"] == None:
+        return None
+    return [fingerprint_similarity_range["fingerprint_similarity_min"], fingerprint_similarity_range["fingerprint_similarity_max"]]
+
+def _mix_idx(vid1_idx: np.ndarray, vid2_idx: np.ndarray) -> np.ndarray:
+    return np.char.add(np.char.add(vid1_idx.astype(str), "-"), vid2_idx.astype(str))
+
+def _pack_hash(hash_list) -> tuple:
+    #* Only "0b" + 64 bits hashes are packed into uint64, anything else (failed video) goes to the fallback comparison
+    packed_hash = np.zeros(len(hash_list), dtype=np.uint64)
+    packed = np.zeros(len(hash_list), dtype=bool)
+    for i, video_hash in enumerate(hash_list):
+        if len(video_hash) == 66 and video_hash.startswith("0b"):
+            packed_hash[i] = int(video_hash, 2)
+            packed[i] = True
+    return packed_hash, packed
+
+class HashComparisonEngine:
+    #* Vectorized all-pairs hash similarity, 64-bit VideoHash values are packed into uint64 and compared with XOR + popcount
+    def __init__(self, hash_list, fallback, block_pair=2**22, packed_hash=None, packed=None) -> None:
+        self.hash_list = hash_list
+        self.fallback = fallback
+        #* Rows per block so that a block holds about block_pair pairs
+        self.block_size = max(1, block_pair // max(len(hash_list), 1))
+        #* Packed hashes can be given directly, e.g. from a SignatureIndex
+        if packed_hash is None:
+            packed_hash, packed = _pack_hash(hash_list)
+        self.packed_hash = packed_hash
+        self.packed = packed
+        logging.info("Packed {} of {} hashes into uint64.".format(int(self.packed.sum()), len(hash_list)))
+
+    def similarity(self, vid1_idx: np.ndarray, vid2_idx: np.ndarray) -> np.ndarray:
+        #* Same value as comparing the "0b..." strings character by character: (66 - different bits) / 66
+        result = (66 - _popcount64(self.packed_hash[vid1_idx] ^ self.packed_hash[vid2_idx])) / 66
+        fallback_mask = ~(self.packed[vid1_idx] & self.packed[vid2_idx])
+        for k in np.flatnonzero(fallback_mask):
+            result[k] = self.fallback(int(vid1_idx[k]), int(vid2_idx[k]))
+        return result
+
+    def similarity_to(self, video_hash: str, vid_idx: np.ndarray) -> np.ndarray:
+        #* Hash similarity of a hash that is not in the list to the given videos
+        result = np.empty(vid_idx.shape[0], dtype=float)
+        if len(video_hash) == 66 and video_hash.startswith("0b"):
+            result[:] = (66 - _popcount64(self.packed_hash[vid_idx] ^ np.uint64(int(video_hash, 2)))) / 66
+            fallback_mask = ~self.packed[vid_idx]
+        else:
+            fallback_mask = np.ones(vid_idx.shape[0], dtype=bool)
+        for k in np.flatnonzero(fallback_mask):
+            try:
+                result[k] = _compare_code(video_hash, self.hash_list[vid_idx[k]])
+            except Exception:
+                result[k] = 0
+        return result
+
+    def append(self, video_hash: str) -> None:
+        #* Add one video after the last one, hash_list has to be a list
+        packed_hash, packed = _pack_hash([video_hash])
+        self.hash_list.append(video_hash)
+        self.packed_hash = np.concatenate([self.packed_hash, packed_hash])
+        self.packed = np.concatenate([self.packed, packed])
+
+    def iter_block(self, first_new=0):
+        #* Yield (vid1_idx, vid2_idx, hash_similarity) for blocks of rows of the upper triangle, in itertools.combinations order
+        #* Only pairs whose second video index is at least first_new are generated (incremental mode)
+        video_count = len(self.hash_list)
+        for start in range(0, max(video_count - 1, 0), self.block_size):
+            stop = min(start + self.block_size, video_count - 1)
+            row = np.arange(start, stop)
+            column = np.arange(max(start + 1, first_new), video_count)
+            mask = column[None, :] > row[:, None]
+            vid1_idx = np.broadcast_to(row[:, None], mask.shape)[mask]
+            vid2_idx = np.broadcast_to(column[None, :], mask.shape)[mask]
+            yield vid1_idx, vid2_idx, self.similarity(vid1_idx, vid2_idx)
+
+class HashIndex:
+    #* Multi-index hashing over packed 64-bit hashes: with d+1 disjoint bit substrings, two hashes within Hamming distance d share at least one substring exactly
+    def __init__(self, hash_engine: HashComparisonEngine, threshold: float) -> None:
+        self.engine = hash_engine
+        self.threshold = threshold
+        self.max_distance = -1
+        for distance in range(65):
+            if (66 - distance) / 66 >= threshold:
+                self.max_distance = distance
+        self.substring_count = self.max_distance + 1
+        self.packed_idx = np.flatnonzero(self.engine.packed)
+        self.key_list = []
+        self.table_list = []
+        if self.substring_count < 1 or self.substring_count > 16:
+            #* Substrings shorter than 4 bits put nearly every video in the same bucket, use blocked brute force instead
+            logging.info("Hash index disabled for max Hamming distance {}, using blocked brute force.".format(self.max_distance))
+            return
+        bound = np.linspace(0, 64, self.substring_count + 1).astype(int)
+        self.shift_list = [np.uint64(bound[t]) for t in range(self.substring_count)]
+        self.mask_list = [np.uint64((1 << int(bound[t+1] - bound[t])) - 1) for t in range(self.substring_count)]
+        for t in range(self.substring_count):
+            key = self._key(self.engine.packed_hash, t)
+            self.key_list.append(key)
+            table = {}
+            for i in self.packed_idx:
+                table.setdefault(int(key[i]), []).append(i)
+            self.table_list.append(table)
+        logging.info("Built hash index with {} substring tables for max Hamming distance {}.".format(self.substring_count, self.max_distance))
+
+    def pairs_above(self, threshold=None, first_new=0):
+        #* All pairs with hash similarity >= threshold (and second video index >= first_new), sorted in itertools.combinations order
+        threshold = self.threshold if threshold == None else threshold
+        if len(self.table_list) == 0:
+            vid1_idx_block_list, vid2_idx_block_list, similarity_block_list = [np.empty(0, dtype=int)], [np.empty(0, dtype=int)], [np.empty(0, dtype=float)]
+            for vid1_idx, vid2_idx, similarity in self.engine.iter_block(first_new=first_new):
+                keep = similarity >= threshold
+                vid1_idx_block_list.append(vid1_idx[keep])
+                vid2_idx_block_list.append(vid2_idx[keep])
+                similarity_block_list.append(similarity[keep])
+            return np.concatenate(vid1_idx_block_list), np.concatenate(vid2_idx_block_list), np.concatenate(similarity_block_list)
+        #* Candidates are verified in batches, memory stays proportional to the batch and the result instead of every collision
+        result_list = [(np.empty(0, dtype=int), np.empty(0, dtype=int), np.empty(0, dtype=float))]
+        candidate_list, candidate_count = [], 0
+        for t, table in enumerate(self.table_list):
+            for member in table.values():
+                if len(member) < 2:
+                    continue
+                member = np.array(member)
+                row, column = np.triu_indices(member.shape[0], k=1)
+                vid1_idx, vid2_idx = member[row], member[column]
+                #* A pair is only reported by the first table it collides in
+                first = np.ones(vid1_idx.shape[0], dtype=bool)
+                for earlier in range(t):
+                    first &= self.key_list[earlier][vid1_idx] != self.key_list[earlier][vid2_idx]
+                candidate_list.append((vid1_idx[first], vid2_idx[first]))
+                candidate_count += int(first.sum())
+                if candidate_count >= 2**22:
+                    result_list.append(self._verify(candidate_list, threshold, first_new))
+                    candidate_list, candidate_count = [], 0
+        #* Videos whose hash is not packed are compared with everyone through the string fallback
+        for i in np.flatnonzero(~self.engine.packed):
+            other = np.delete(np.arange(self.engine.packed.shape[0]), i)
+            other = other[(other > i) | self.engine.packed[other]]
+            candidate_list.append((np.minimum(other, i), np.maximum(other, i)))
+        result_list.append(self._verify(candidate_list, threshold, first_new))
+        vid1_idx = np.concatenate([result[0] for result in result_list])
+        vid2_idx = np.concatenate([result[1] for result in result_list])
+        similarity = np.concatenate([result[2] for result in result_list])
+        order = np.lexsort((vid2_idx, vid1_idx))
+        return vid1_idx[order], vid2_idx[order], similarity[order]
+
+    def neighbours(self, video_hash: str, threshold=None):
+        #* Indices and hash similarity of indexed videos with hash similarity >= threshold to the given "0b..." hash
+        threshold = self.threshold if threshold == None else threshold
+        candidate = np.arange(self.engine.packed.shape[0])
+        if len(self.table_list) != 0 and len(video_hash) == 66 and video_hash.startswith("0b"):
+            value = np.uint64(int(video_hash, 2))
+            candidate_list = [np.flatnonzero(~self.engine.packed)]
+            for t, table in enumerate(self.table_list):
+                candidate_list.append(np.array(table.get(int(self._key(value, t)), []), dtype=int))
+            candidate = np.unique(np.concatenate(candidate_list))
+        similarity = self.engine.similarity_to(video_hash, candidate)
+        keep = similarity >= threshold
+        return candidate[keep], similarity[keep]
+
+    def _verify(self, candidate_list: list, threshold: float, first_new: int) -> tuple:
+        vid1_idx = np.concatenate([np.empty(0, dtype=int)] + [candidate[0] for candidate in candidate_list])
+        vid2_idx = np.concatenate([np.empty(0, dtype=int)] + [candidate[1] for candidate in candidate_list])
+        new = vid2_idx >= first_new
+        vid1_idx, vid2_idx = vid1_idx[new], vid2_idx[new]
+        similarity = self.engine.similarity(vid1_idx, vid2_idx)
+        keep = similarity >= threshold
+        return vid1_idx[keep], vid2_idx[keep], similarity[keep]
+
+    def _key(self, packed_hash, t: int):
+        return (packed_hash >> self.shift_list[t]) & self.mask_list[t]
+
+class FingerprintComparisonEngine:
+    #* Vectorized fingerprint similarity, bigram count profiles are built once per video and pairs are scored in chunks
+    def __init__(self, finger_print_list, fallback, chunk_element=2**24, code=None, length=None) -> None:
+        self.finger_print_list = finger_print_list
+        self.fallback = fallback
+        #* Character codes for the position by position comparison of equal length fingerprints, stored ragged (all codes in one array, video i starts at code_offset[i])
+        #* so that one long video does not widen every row, code has spare capacity at the end for append
+        #* Codes and lengths can be given directly, e.g. from a SignatureIndex
+        if code is None:
+            code = np.frombuffer("".join(finger_print_list).encode("utf-32-le"), dtype=np.uint32)
+            length = [len(finger_print) for finger_print in finger_print_list]
+        self.length = np.array(length, dtype=np.int64)
+        self.code_offset = np.concatenate([[0], np.cumsum(self.length)[:-1]]).astype(np.int64) if self.length.shape[0] != 0 else np.empty(0, dtype=np.int64)
+        self.code_size = int(self.length.sum())
+        self.code = np.array(code, dtype=np.uint32)
+        #* Bigram multiset of each lower case fingerprint as a count vector over the bigram vocabulary
+        if self.code_size == 0 or self.code.max() < 128:
+            self.vocabulary, self.bigram_count = self._ascii_bigram_count(chunk_element)
+        else:
+            self.vocabulary, self.bigram_count = self._string_bigram_count()
+        self.bigram_exist = (self.bigram_count > 0).astype(np.float32)
+        self.bigram_total = self.bigram_count.sum(axis=1)
+        self.chunk_element = chunk_element
+        self.pair_chunk = max(1, chunk_element // self.bigram_count.shape[1])
+        logging.info("Built bigram profiles of {} fingerprints over {} bigrams.".format(self.length.shape[0], len(self.vocabulary)))
+
+    def _ascii_bigram_count(self, chunk_element: int) -> tuple:
+        #* Bigrams of ASCII fingerprints are counted on the code array directly, a bigram is two neighbouring codes of the same video
+        video = np.repeat(np.arange(self.length.shape[0]), self.length)
+        same_video = video[:-1] == video[1:]
+        lower_code = ASCII_LOWER[self.code].astype(np.int64)
+        key = (lower_code[:-1] * 128 + lower_code[1:])[same_video]
+        video = video[:-1][same_video]
+        #* Every possible ASCII bigram has a key below 128 * 128, the keys that occur become the columns
+        present = np.bincount(key, minlength=128 * 128) > 0
+        column = np.cumsum(present) - 1
+        vocabulary = {chr(bigram_key // 128) + chr(bigram_key % 128): int(column[bigram_key]) for bigram_key in np.flatnonzero(present).tolist()}
+        bigram_count = np.zeros((self.length.shape[0], max(len(vocabulary), 1)), dtype=np.float32)
+        #* Codes are ordered by video, so a range of videos is a range of bigrams, counted in chunks of about chunk_element values
+        row_chunk = max(1, chunk_element // bigram_count.shape[1])
+        for start in range(0, bigram_count.shape[0], row_chunk):
+            first, last = np.searchsorted(video, [start, start + row_chunk])
+            flat = (video[first:last] - start) * bigram_count.shape[1] + column[key[first:last]]
+            row_count = min(row_chunk, bigram_count.shape[0] - start)
+            bigram_count[start:start + row_count] = np.bincount(flat, minlength=row_count * bigram_count.shape[1]).reshape(row_count, -1)
+        return vocabulary, bigram_count
+
+    def _string_bigram_count(self) -> tuple:
+        #* Lower case of other characters may change the string length, they are counted string by string
+        bigram_list = [_get_bigrams(finger_print) for finger_print in self.finger_print_list]
+        vocabulary = {}
+        for bigrams in bigram_list:
+            for bigram in bigrams:
+                vocabulary.setdefault(bigram, len(vocabulary))
+        bigram_count = np.zeros((len(bigram_list), max(len(vocabulary), 1)), dtype=np.float32)
+        for i, bigrams in enumerate(bigram_list):
+            for bigram in bigrams:
+                bigram_count[i, vocabulary[bigram]] += 1
+        return vocabulary, bigram_count
+
+    def similarity(self, vid1_idx: np.ndarray, vid2_idx: np.ndarray) -> np.ndarray:
+        result = np.empty(vid1_idx.shape[0], dtype=float)
+        for start in range(0, vid1_idx.shape[0], self.pair_chunk):
+            result[start:start+self.pair_chunk] = self._similarity_chunk(vid1_idx[start:start+self.pair_chunk], vid2_idx[start:start+self.pair_chunk])
+        return result
+
+    def similarity_to(self, finger_print: str, vid_idx: np.ndarray) -> np.ndarray:
+        #* Fingerprint similarity of the given videos to a fingerprint that is not in the list, which takes the second place of every pair
+        result = np.zeros(vid_idx.shape[0], dtype=float)
+        bigrams = _get_bigrams(finger_print)
+        bigram_exist = np.zeros(self.bigram_count.shape[1], dtype=np.float32)
+        for bigram in bigrams:
+            if bigram in self.vocabulary:
+                bigram_exist[self.vocabulary[bigram]] = 1
+        length = self.length[vid_idx]
+        bigram = length != len(finger_print)
+        union = self.bigram_total[vid_idx] + len(bigrams)
+        dice = bigram & (union > 0)
+        #* One matrix-vector product over every profile is cheaper than gathering the rows of vid_idx first
+        hit_count = (self.bigram_count @ bigram_exist)[vid_idx[dice]]
+        result[dice] = (2.0 * hit_count.astype(float)) / union[dice]
+        position = (~bigram) & (length > 0)
+        if position.any():
+            code = np.frombuffer(finger_print.encode("utf-32-le"), dtype=np.uint32)
+            #* Only videos of the same length are compared position by position, their codes are gathered into a rows x length block
+            position_idx = np.flatnonzero(position)
+            for start in range(0, position_idx.shape[0], max(1, self.chunk_element // len(finger_print))):
+                chunk = position_idx[start:start + max(1, self.chunk_element // len(finger_print))]
+                diffcnt = np.count_nonzero(self.code[self.code_offset[vid_idx[chunk]][:, None] + np.arange(len(finger_print))] != code, axis=1)
+                result[chunk] = (len(finger_print) - diffcnt) / len(finger_print)
+        for k in np.flatnonzero(~(dice | position)):
+            try:
+                result[k] = _compare_code(self.finger_print_list[vid_idx[k]], finger_print)
+            except Exception:
+                result[k] = 0
+        return result
+
+    def append(self, finger_print: str) -> None:
+        #* Add one video after the last one, finger_print_list has to be a list, new bigrams widen the profiles
+        bigrams = _get_bigrams(finger_print)
+        for bigram in bigrams:
+            self.vocabulary.setdefault(bigram, len(self.vocabulary))
+        if len(self.vocabulary) > self.bigram_count.shape[1]:
+            self.bigram_exist = np.pad(self.bigram_exist, ((0, 0), (0, len(self.vocabulary) - self.bigram_count.shape[1])))
+            self.bigram_count = np.pad(self.bigram_count, ((0, 0), (0, len(self.vocabulary) - self.bigram_count.shape[1])))
+        bigram_count = np.zeros((1, self.bigram_count.shape[1]), dtype=np.float32)
+        for bigram in bigrams:
+            bigram_count[0, self.vocabulary[bigram]] += 1
+        if self.code_size + len(finger_print) > self.code.shape[0]:
+            #* Capacity doubles, so adding videos one by one copies the codes a logarithmic number of times
+            self.code = np.concatenate([self.code[:self.code_size], np.zeros(max(self.code_size, len(finger_print)), dtype=np.uint32)])
+        self.code[self.code_size:self.code_size + len(finger_print)] = np.frombuffer(finger_print.encode("utf-32-le"), dtype=np.uint32)
+        self.code_offset = np.append(self.code_offset, self.code_size)
+        self.code_size += len(finger_print)
+        self.finger_print_list.append(finger_print)
+        self.length = np.append(self.length, len(finger_print))
+        self.bigram_count = np.concatenate([self.bigram_count, bigram_count])
+        self.bigram_exist = np.concatenate([self.bigram_exist, (bigram_count > 0).astype(np.float32)])
+        self.bigram_total = np.append(self.bigram_total, bigram_count.sum())
+
+    def _similarity_chunk(self, vid1_idx: np.ndarray, vid2_idx: np.ndarray) -> np.ndarray:
+        result = np.zeros(vid1_idx.shape[0], dtype=float)
+        length1, length2 = self.length[vid1_idx], self.length[vid2_idx]
+        #* Unequal length: Dice coefficient, every bigram of the first fingerprint that exists in the second counts as a hit
+        bigram = length1 != length2
+        union = self.bigram_total[vid1_idx] + self.bigram_total[vid2_idx]
+        dice = bigram & (union > 0)
+        hit_count = np.einsum("ij,ij->i", self.bigram_count[vid1_idx[dice]], self.bigram_exist[vid2_idx[dice]])
+        result[dice] = (2.0 * hit_count.astype(float)) / union[dice]
+        #* Equal length: share of equal characters at the same position
+        position = (~bigram) & (length1 > 0)
+        result[position] = self._position_similarity(vid1_idx[position], vid2_idx[position])
+        #* Empty fingerprints can not be compared, same as the division by zero of the string comparison
+        for k in np.flatnonzero(~(dice | position)):
+            result[k] = self.fallback(int(vid1_idx[k]), int(vid2_idx[k]))
+        return result
+
+    def _position_similarity(self, vid1_idx: np.ndarray, vid2_idx: np.ndarray) -> np.ndarray:
+        #* Share of equal characters of equal length pairs, pairs are grouped by length and gathered into rows x length blocks, so memory follows the compared lengths, not the longest video
+        result = np.empty(vid1_idx.shape[0], dtype=float)
+        length = self.length[vid1_idx]
+        for group_length in np.unique(length):
+            group = np.flatnonzero(length == group_length)
+            character = np.arange(group_length)
+            row_chunk = max(1, self.chunk_element // int(group_length))
+            for start in range(0, group.shape[0], row_chunk):
+                chunk = group[start:start + row_chunk]
+                diffcnt = np.count_nonzero(self.code[self.code_offset[vid1_idx[chunk]][:, None] + character] != self.code[self.code_offset[vid2_idx[chunk]][:, None] + character], axis=1)
+                result[chunk] = (group_length - diffcnt) / group_length
+        return result
+
+class FingerprintLSH:
+    #* MinHash signatures of the fingerprint bigram multisets with banding: videos whose bigram Jaccard similarity is likely at or above threshold share a band
+    #* The k-th occurrence of a bigram is its own element, so the Jaccard similarity of the sets is the weighted Jaccard similarity of the bigram counts
+    def __init__(self, finger_print_engine: FingerprintComparisonEngine, threshold: float, permutation_count=128, seed=20231018) -> None:
+        self.engine = finger_print_engine
+        self.threshold = threshold
+        self.prime = (1 << 31) - 1
+        #* Most rows per band that still keeps the probability of a pair exactly at threshold becoming a candidate at 0.95 or above
+        self.row_count = 1
+        for row_count in range(1, permutation_count + 1):
+            if 1 - (1 - threshold ** row_count) ** (permutation_count // row_count) >= 0.95:
+                self.row_count = row_count
+        self.band_count = permutation_count // self.row_count
+        self.candidate_probability = 1 - (1 - threshold ** self.row_count) ** self.band_count
+        count = self.engine.bigram_count.astype(np.int64)
+        #* Empty fingerprints have no elements, they never become candidates
+        self.indexed = count.sum(axis=1) > 0
+        max_count = max(int(count.max(initial=0)), 1)
+        rng = np.random.default_rng(seed)
+        a = rng.integers(1, self.prime, size=permutation_count, dtype=np.int64)
+        b = rng.integers(0, self.prime, size=permutation_count, dtype=np.int64)
+        self.signature = np.full((count.shape[0], permutation_count), self.prime, dtype=np.int64)
+        chunk = max(1, int(2**24 // (permutation_count * max(float(count.sum(axis=1).mean()) if count.shape[0] != 0 else 1, 1))))
+        for start in range(0, count.shape[0], chunk):
+            owner, bigram = np.nonzero(count[start:start+chunk])
+            if owner.shape[0] == 0:
+                continue
+            repeat = count[start:start+chunk][owner, bigram]
+            occurrence = np.arange(int(repeat.sum())) - np.repeat(np.cumsum(repeat) - repeat, repeat)
+            owner, element = np.repeat(owner, repeat), np.repeat(bigram, repeat) * max_count + occurrence
+            value = (element[:, None] * a[None, :] + b[None, :]) % self.prime
+            first = np.flatnonzero(np.r_[True, owner[1:] != owner[:-1]])
+            self.signature[start + owner[first]] = np.minimum.reduceat(value, first, axis=0)
+        #* One 64-bit key per band and video, a false key collision is removed by the exact verification
+        multiplier = rng.integers(1, 2**63, size=self.row_count, dtype=np.uint64) | np.uint64(1)
+        self.key_list = [(self.signature[:, band*self.row_count:(band+1)*self.row_count].astype(np.uint64) * multiplier[None, :]).sum(axis=1, dtype=np.uint64) for band in range(self.band_count)]
+        self.candidate_count = 0
+        logging.info("Built fingerprint MinHash LSH of {} fingerprints with {} bands of {} rows, candidate probability {:.3f} at Jaccard {}.".format(int(self.indexed.sum()), self.band_count, self.row_count, self.candidate_probability, threshold))
+
+    def pairs_above(self, first_new=0) -> tuple:
+        #* (vid1_idx, vid2_idx) with exact bigram Jaccard similarity >= threshold among the candidates (and second video index >= first_new), sorted in itertools.combinations order
+        indexed_idx = np.flatnonzero(self.indexed)
+        result_list = [(np.empty(0, dtype=int), np.empty(0, dtype=int))]
+        candidate_list, candidate_count = [], 0
+        for band, key in enumerate(self.key_list):
+            order = indexed_idx[np.argsort(key[indexed_idx], kind="stable")]
+            #* Pairs of the same bucket are order[i], order[i+lag], every lag up to the largest bucket
+            lag = 1
+            while lag < order.shape[0]:
+                same = key[order[:-lag]] == key[order[lag:]]
+                if not same.any():
+                    break
+                vid1_idx, vid2_idx = order[:-lag][same], order[lag:][same]
+                vid1_idx, vid2_idx = np.minimum(vid1_idx, vid2_idx), np.maximum(vid1_idx, vid2_idx)
+                #* A pair is only reported by the first band it collides in
+                first = vid2_idx >= first_new
+                for earlier in range(band):
+                    first &= self.key_list[earlier][vid1_idx] != self.key_list[earlier][vid2_idx]
+                candidate_list.append((vid1_idx[first], vid2_idx[first]))
+                candidate_count += int(first.sum())
+                if candidate_count >= 2**22:
+                    result_list.append(self._verify(candidate_list))
+                    self.candidate_count += candidate_count
+                    candidate_list, candidate_count = [], 0
+                lag += 1
+        result_list.append(self._verify(candidate_list))
+        self.candidate_count += candidate_count
+        vid1_idx = np.concatenate([result[0] for result in result_list])
+        vid2_idx = np.concatenate([result[1] for result in result_list])
+        order = np.lexsort((vid2_idx, vid1_idx))
+        return vid1_idx[order], vid2_idx[order]
+
+    def jaccard(self, vid1_idx: np.ndarray, vid2_idx: np.ndarray) -> np.ndarray:
+        result = np.zeros(vid1_idx.shape[0], dtype=float)
+        for start in range(0, vid1_idx.shape[0], self.engine.pair_chunk):
+            count1, count2 = self.engine.bigram_count[vid1_idx[start:start+self.engine.pair_chunk]], self.engine.bigram_count[vid2_idx[start:start+self.engine.pair_chunk]]
+            union = np.maximum(count1, count2).sum(axis=1)
+            result[start:start+self.engine.pair_chunk] = np.minimum(count1, count2).sum(axis=1) / np.maximum(union, 1)
+        return result
+
+    def recall(self, vid1_idx: np.ndarray, vid2_idx: np.ndarray, sample_size=2000, first_new=0, seed=20231018) -> tuple:
+        #* Share of the pairs at or above threshold that were found, measured exactly among a random sample of videos: (recall or None, pair count above threshold in sample)
+        #* Recall is of bigram Jaccard similarity, the selection criterion, not of the fingerprint_similarity reported for a pair (position by position for equal lengths, Dice otherwise)
+        indexed_idx = np.flatnonzero(self.indexed)
+        sample = np.sort(np.random.default_rng(seed).choice(indexed_idx, size=min(sample_size, indexed_idx.shape[0]), replace=False))
+        row, column = np.triu_indices(sample.shape[0], k=1)
+        sample_vid1_idx, sample_vid2_idx = sample[row], sample[column]
+        new = sample_vid2_idx >= first_new
+        true_count = int(np.count_nonzero(self.jaccard(sample_vid1_idx[new], sample_vid2_idx[new]) >= self.threshold))
+        found_count = int(np.count_nonzero(np.isin(vid1_idx, sample) & np.isin(vid2_idx, sample)))
+        return (found_count / true_count if true_count != 0 else None), true_count
+
+    def _verify(self, candidate_list: list) -> tuple:
+        vid1_idx = np.concatenate([np.empty(0, dtype=int)] + [candidate[0] for candidate in candidate_list])
+        vid2_idx = np.concatenate([np.empty(0, dtype=int)] + [candidate[1] for candidate in candidate_list])
+        keep = self.jaccard(vid1_idx, vid2_idx) >= self.threshold
+        return vid1_idx[keep], vid2_idx[keep]
+
+def _popcount64(value: np.ndarray) -> np.ndarray:
+    #* Number of set bits of each uint64
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(value).astype(np.int64)
+    return POPCOUNT_TABLE[value.view(np.uint8).reshape(-1, 8)].sum(axis=1, dtype=np.int64).reshape(value.shape)
+
+POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+ASCII_LOWER = np.array([ord(chr(i).lower()) for i in range(128)], dtype=np.uint32)
+
+class StringTable:
+    #* Read only list of strings stored as utf-8 bytes and offsets in two .npy files, opened as memory map
+    def __init__(self, index_path: str, name: str) -> None:
+        self.offset = np.load(os.path.join(index_path, name + "_offset.npy"), mmap_mode="r")
+        self.data = np.load(os.path.join(index_path, name + ".npy"), mmap_mode="r")
+
+    def __len__(self) -> int:
+        return self.offset.shape[0] - 1
+
+    def __getitem__(self, i: int) -> str:
+        return bytes(self.data[self.offset[i]:self.offset[i+1]]).decode("utf-8")
+
+    def to_array(self) -> np.ndarray:
+        #* One copy of the memory map sliced as bytes, indexing the memory map string by string is much slower
+        data, offset = bytes(self.data), self.offset.tolist()
+        return np.array([data[start:end].decode("utf-8") for start, end in zip(offset[:-1], offset[1:])], dtype=str)
+
+    @staticmethod
+    def write(index_path: str, name: str, string_list) -> None:
+        encoded_list = [str(string).encode("utf-8") for string in string_list]
+        offset = np.zeros(len(encoded_list) + 1, dtype=np.int64)
+        offset[1:] = np.cumsum([len(encoded) for encoded in encoded_list])
+        np.save(os.path.join(index_path, name + "_offset.npy"), offset)
+        np.save(os.path.join(index_path, name + ".npy"), np.frombuffer(b"".join(encoded_list), dtype=np.uint8))
+
+class SignatureIndex:
+    #* Binary signature index written next to video_detail.csv: packed uint64 hashes, offset indexed fingerprint, hash and path tables
+    #* Every array is a .npy file opened with np.load(mmap_mode="r"), so loading is instant and processes share the page cache
+    def __init__(self, index_path: str) -> None:
+        self.index_path = index_path
+        self.packed_hash = np.load(os.path.join(index_path, "hash.npy"), mmap_mode="r")
+        self.packed = np.load(os.path.join(index_path, "packed.npy"), mmap_mode="r")
+        self.HASH_list = StringTable(index_path, "hash_text")
+        self.FINGER_PRINT_list = StringTable(index_path, "finger_print")
+        self.PATH_list = StringTable(index_path, "path")
+        logging.info("Opened signature index of {} videos at {}.".format(len(self), index_path))
+
+    def __len__(self) -> int:
+        return self.packed_hash.shape[0]
+
+    def hash_engine(self, fallback, hash_list=None) -> HashComparisonEngine:
+        #* hash_list replaces the hash table, e.g. a python list to append to
+        return HashComparisonEngine(self.HASH_list if hash_list is None else hash_list, fallback=fallback, packed_hash=self.packed_hash, packed=self.packed)
+
+    def finger_print_engine(self, fallback, finger_print_list=None) -> FingerprintComparisonEngine:
+        #* utf-8 bytes of ASCII fingerprints are their character codes, other fingerprints are encoded again from the strings
+        if finger_print_list is None:
+            finger_print_list = self.FINGER_PRINT_list.to_array()
+        data = self.FINGER_PRINT_list.data
+        if data.shape[0] != 0 and data.max() >= 128:
+            return FingerprintComparisonEngine(finger_print_list, fallback=fallback)
+        return FingerprintComparisonEngine(finger_print_list, fallback=fallback, code=data, length=np.diff(self.FINGER_PRINT_list.offset))
+
+    @staticmethod
+    def write(index_path: str, PATH_list, HASH_list, FINGER_PRINT_list) -> None:
+        #* Write into a temporary folder first, so readers never see a half written index
+        tmp_index_path = index_path + ".tmp"
+        shutil.rmtree(tmp_index_path, ignore_errors=True)
+        os.makedirs(tmp_index_path)
+        packed_hash, packed = _pack_hash(HASH_list)
+        np.save(os.path.join(tmp_index_path, "hash.npy"), packed_hash)
+        np.save(os.path.join(tmp_index_path, "packed.npy"), packed)
+        StringTable.write(tmp_index_path, "hash_text", HASH_list)
+        StringTable.write(tmp_index_path, "finger_print", FINGER_PRINT_list)
+        StringTable.write(tmp_index_path, "path", PATH_list)
+        shutil.rmtree(index_path, ignore_errors=True)
+        os.replace(tmp_index_path, index_path)
+
+def _code_fallback(code_list):
+    #* String comparison fallback of the comparison engines outside of VideoSimilarityTester, pairs that can not be compared score 0
+    def fallback(cmp_obj_1: int, cmp_obj_2: int) -> float:
+        try:
+            return _compare_code(code_list[cmp_obj_1], code_list[cmp_obj_2])
+        except Exception as e:
+            logging.warning("Failed to compare {}th video with {}th video: {}".format(cmp_obj_1+1, cmp_obj_2+1, e))
+            return 0
+    return fallback
+
+class ComparisonShard:
+    #* Upper triangle of the pair matrix split into square tiles, planned into a manifest in a shared folder
+    #* Any number of worker processes, on one or several hosts sharing the folder, claim tiles with exclusive file creation and write raw results per tile
+    def __init__(self, shard_path: str) -> None:
+        self.shard_path = shard_path
+        with open(os.path.join(shard_path, "manifest.json"), "r") as f:
+            self.manifest = json.load(f)
+        self.tile_list = [tuple(tile) for tile in self.manifest["tile_list"]]
+        logging.info("Opened comparison shard manifest of {} tiles at {}.".format(len(self.tile_list), shard_path))
+
+    @staticmethod
+    def plan(shard_path: str, video_count: int, tile_size: int, first_new=0, hash_threshold=None, claim_timeout=3600) -> None:
+        #* Tiles are (row_start, row_stop, column_start, column_stop), tiles without any pair with second video index at least first_new are left out
+        tile_list = []
+        for row_start in range(0, max(video_count - 1, 0), tile_size):
+            for column_start in range(row_start, video_count, tile_size):
+                row_stop, column_stop = min(row_start + tile_size, video_count - 1), min(column_start + tile_size, video_count)
+                if column_stop > max(first_new, row_start + 1):
+                    tile_list.append((row_start, row_stop, column_start, column_stop))
+        shutil.rmtree(shard_path, ignore_errors=True)
+        os.makedirs(shard_path)
+        manifest = {"video_count": video_count, "tile_size": tile_size, "first_new": first_new, "hash_threshold": hash_threshold, "claim_timeout": claim_timeout, "created": time.time(), "tile_list": tile_list}
+        with open(os.path.join(shard_path, "manifest.json.tmp"), "w") as f:
+            json.dump(manifest, f)
+        os.replace(os.path.join(shard_path, "manifest.json.tmp"), os.path.join(shard_path, "manifest.json"))
+        logging.info("Planned {} comparison shard tiles of {} videos at {}.".format(len(tile_list), video_count, shard_path))
+
+    def tile_pair(self, tile: int) -> tuple:
+        #* (vid1_idx, vid2_idx) of one tile in itertools.combinations order
+        row_start, row_stop, column_start, column_stop = self.tile_list[tile]
+        row = np.arange(row_start, row_stop)
+        column = np.arange(max(column_start, self.manifest["first_new"]), column_stop)
+        mask = column[None, :] > row[:, None]
+        return np.broadcast_to(row[:, None], mask.shape)[mask], np.broadcast_to(column[None, :], mask.shape)[mask]
+
+    def result_path(self, tile: int) -> str:
+        return os.path.join(self.shard_path, "tile_{}.npz".format(tile))
+
+    def claim(self, tile: int) -> bool:
+        #* Exclusive creation is atomic on local and network file systems, a claim older than claim_timeout without result is taken over
+        claim_path = os.path.join(self.shard_path, "tile_{}.claim".format(tile))
+        #* Every claim is unique, so that a takeover can name the exact claim it replaces
+        claim = json.dumps({"host": socket.gethostname(), "pid": os.getpid(), "time": time.time(), "token": os.urandom(8).hex()})
+        try:
+            fd = os.open(claim_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return self._take_over(tile, claim_path, claim)
+        with os.fdopen(fd, "w") as f:
+            f.write(claim)
+        return True
+
+    def _take_over(self, tile: int, claim_path: str, claim: str) -> bool:
+        #* Only the worker that creates the takeover lock named after the content of a stale claim may replace that claim, the lock is created exclusively
+        #* The new claim is renamed over the stale one, so the claim file never disappears and no other worker can create it in between
+        try:
+            with open(claim_path, "rb") as f:
+                #* Age and content come from the same opened file, a claim replaced meanwhile is a new file, its modification time tells empty claims of crashed workers apart
+                if time.time() - os.fstat(f.fileno()).st_mtime < self.manifest["claim_timeout"] or os.path.exists(self.result_path(tile)):
+                    return False
+                stale_claim = f.read() + str(os.fstat(f.fileno()).st_mtime_ns).encode("utf-8")
+            os.close(os.open("{}.takeover-{}".format(claim_path, hashlib.sha1(stale_claim).hexdigest()), os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except OSError:
+            return False
+        tmp_claim_path = "{}.{}-{}.tmp".format(claim_path, socket.gethostname(), os.getpid())
+        with open(tmp_claim_path, "w") as f:
+            f.write(claim)
+        os.replace(tmp_claim_path, claim_path)
+        logging.warning("Took over stale claim of comparison shard tile {}.".format(tile))
+        return True
+
+    def write(self, tile: int, vid1_idx: np.ndarray, vid2_idx: np.ndarray, hash_similarity: np.ndarray, fingerprint_similarity: np.ndarray) -> None:
+        #* Raw fingerprint similarity is kept, normalization needs the range of every tile and happens in the merge
+        tmp_result_path = "{}.{}-{}.tmp".format(self.result_path(tile), socket.gethostname(), os.getpid())
+        with open(tmp_result_path, "wb") as f:
+            np.savez(f, vid1_idx=vid1_idx, vid2_idx=vid2_idx, hash_similarity=hash_similarity, fingerprint_similarity=fingerprint_similarity)
+        os.replace(tmp_result_path, self.result_path(tile))
+
+    def missing_tile_list(self) -> list:
+        return [tile for tile in range(len(self.tile_list)) if not os.path.exists(self.result_path(tile))]
+
+    def iter_block(self):
+        #* Yield (vid1_idx, vid2_idx, hash_similarity, raw fingerprint_similarity) per row of tiles, sorted like the blocks of HashComparisonEngine.iter_block
+        tile_index = {}
+        for tile, (row_start, row_stop, column_start, column_stop) in enumerate(self.tile_list):
+            tile_index.setdefault(row_start, []).append(tile)
+        for row_start in sorted(tile_index):
+            block_list = []
+            for tile in tile_index[row_start]:
+                with np.load(self.result_path(tile)) as result:
+                    block_list.append([result["vid1_idx"], result["vid2_idx"], result["hash_similarity"], result["fingerprint_similarity"]])
+            vid1_idx, vid2_idx, hash_similarity, fingerprint_similarity = [np.concatenate(column) for column in zip(*block_list)]
+            order = np.lexsort((vid2_idx, vid1_idx))
+            yield vid1_idx[order], vid2_idx[order], hash_similarity[order], fingerprint_similarity[order]
+
+def _comparison_shard_job(shard_path: str, index_path: str) -> tuple:
+    #* Claim and compute tiles until none is left, runs in every shard worker process, returns (tile count, pair count) computed here
+    comparison_shard = ComparisonShard(shard_path)
+    signature_index = SignatureIndex(index_path)
+    if len(signature_index) != comparison_shard.manifest["video_count"]:
+        raise ValueError("Signature index has {} videos, comparison shard manifest was planned for {}.".format(len(signature_index), comparison_shard.manifest["video_count"]))
+    hash_engine = signature_index.hash_engine(fallback=_code_fallback(signature_index.HASH_list))
+    finger_print_list = signature_index.FINGER_PRINT_list.to_array()
+    finger_print_engine = signature_index.finger_print_engine(fallback=_code_fallback(finger_print_list), finger_print_list=finger_print_list)
+    hash_threshold = comparison_shard.manifest["hash_threshold"]
+    tile_count, pair_count = 0, 0
+    for tile in range(len(comparison_shard.tile_list)):
+        if os.path.exists(comparison_shard.result_path(tile)) or not comparison_shard.claim(tile):
+            continue
+        vid1_idx, vid2_idx = comparison_shard.tile_pair(tile)
+        hash_similarity = hash_engine.similarity(vid1_idx, vid2_idx)
+        if hash_threshold != None:
+            keep = hash_similarity >= hash_threshold
+            vid1_idx, vid2_idx, hash_similarity = vid1_idx[keep], vid2_idx[keep], hash_similarity[keep]
+        comparison_shard.write(tile, vid1_idx, vid2_idx, hash_similarity, finger_print_engine.similarity(vid1_idx, vid2_idx))
+        logging.info("Computed comparison shard tile {} of {} pairs.".format(tile, vid1_idx.shape[0]))
+        tile_count += 1
+        pair_count += vid1_idx.shape[0]
+    return tile_count, pair_count
+
+class RunJournal:
+    #* Append-only journal of one run in cache folder, every completed download, per-video result and comparison checkpoint is one JSON line synced to disk
+    #* A run with --resume and the same header reuses the entries of the interrupted run, a finished run removes its journal
+    def __init__(self, cache_path: str, header: dict, resume=False) -> None:
+        self.journal_path = os.path.abspath(os.path.join(cache_path, "run_journal"))
+        self.entry = {}
+        entry_path = os.path.join(self.journal_path, "journal.jsonl")
+        resumed = False
+        if resume == True and os.path.exists(entry_path):
+            entry_list = []
+            with open(entry_path, "r") as f:
+                for line in f:
+                    try:
+                        entry_list.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        #* Last line of a killed run may be cut off
+                        break
+            if len(entry_list) != 0 and entry_list[0] == {"kind": "header", **header}:
+                for entry in entry_list[1:]:
+                    self.entry[(entry["kind"], entry["key"])] = entry
+                resumed = True
+                logging.info("Resuming run from journal {} with {} entries.".format(entry_path, len(self.entry)))
+                print("Resuming interrupted run, {} journal entries.".format(len(self.entry)))
+            else:
+                logging.warning("Run journal at {} belongs to another run, starting over.".format(entry_path))
+                vst_warning.general_warning("Run journal in cache folder belongs to another run, starting over")
+        elif resume == True:
+            logging.warning("No run journal found at {}, starting over.".format(entry_path))
+            vst_warning.general_warning("No run journal found in cache folder, starting over")
+        if resumed == False:
+            shutil.rmtree(self.journal_path, ignore_errors=True)
+            os.makedirs(self.journal_path)
+        self.file = open(entry_path, "a")
+        if resumed == False:
+            self._append({"kind": "header", **header})
+
+    def _append(self, entry: dict) -> None:
+        self.file.write(json.dumps(entry, default=str) + "\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def record(self, kind: str, key, **value) -> None:
+        entry = {"kind": kind, "key": key, **value}
+        self._append(entry)
+        self.entry[(kind, key)] = json.loads(json.dumps(entry, default=str))
+
+    def get(self, kind: str, key):
+        return self.entry.get((kind, key))
+
+    def write_array(self, name: str, **array) -> None:
+        #* Arrays are written beside the journal before the entry that refers to them
+        array_path = os.path.join(self.journal_path, name + ".npz")
+        with open(array_path + ".tmp", "wb") as f:
+            np.savez(f, **array)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(array_path + ".tmp", array_path)
+
+    def read_array(self, name: str) -> dict:
+        with np.load(os.path.join(self.journal_path, name + ".npz")) as array:
+            return {key: array[key] for key in array.files}
+
+    def close(self, complete=False) -> None:
+        self.file.close()
+        if complete == True:
+            shutil.rmtree(self.journal_path, ignore_errors=True)
+            logging.info("Run complete, removed run journal {}.".format(self.journal_path))
+
 class VideoSimilarityTester:
     #* Class to test similarity between videos
-    def __init__(self, cache_path:str, URL_list_filepath=None, PATH_list_filepath=None, download_resolution=0, export_video_detail=False, export_comparison_result=False, remove_cache=True, method_weight=[0.7, 0.3]) -> None:
+    def __init__(self, cache_path:str, URL_list_filepath=None, PATH_list_filepath=None, download_resolution=0, export_video_detail=False, export_comparison_result=False, remove_cache=True, method_weight=[0.7, 0.3], signature_cache=True, clear_signature_cache=False, signature_cache_max_age=None, signature_cache_max_entries=None, workers=1, single_decode=False, hash_threshold=None, incremental=False, stream_result=False, top_k=None, min_similarity=None, download_workers=4, profile_phase_list=None, segment_length=None, fast_decode=None, shard_tile_size=None, shard_worker=False, shard_merge=False, fingerprint_threshold=None, rescore=False, resume=False, run=True) -> None:
         #* Check input method (URL list or PATH list)
         if URL_list_filepath == None and PATH_list_filepath == None:
             logging.critical("URL list or PATH list must be provided.")
             vst_error.argument_not_enough()
         self.input_method = "URL_list" if URL_list_filepath != None else "PATH_list"
+        self.input_filepath = URL_list_filepath if URL_list_filepath != None else PATH_list_filepath
         #* Initialize class
         self.URL_list_filepath = URL_list_filepath
         self.PATH_list_filepath = PATH_list_filepath
@@ -90,6 +1393,25 @@ class VideoSimilarityTester:
         self.export_comparison_result = export_comparison_result
         self.remove_cache = remove_cache
         self.method_weight = method_weight
+        self.signature_cache = signature_cache
+        self.workers = workers
+        self.download_workers = download_workers
+        self.rescore = rescore
+        self.resume = resume
+        self.segment_length = segment_length
+        self.shard_tile_size = shard_tile_size
+        self.shard_worker = shard_worker
+        self.shard_merge = shard_merge
+        #* Fast decode extracts both signatures from the same frames like single decode
+        self.fast_decode = fast_decode
+        self.single_decode = single_decode or fast_decode != None
+        self.hash_threshold = hash_threshold
+        self.fingerprint_threshold = fingerprint_threshold
+        self.fingerprint_lsh_report = None
+        self.incremental = incremental
+        self.stream_result = stream_result or top_k != None or min_similarity != None
+        self.top_k = top_k
+        self.min_similarity = min_similarity
         #* Check if path is valid
         if self.input_method == "URL_list":
             if not os.path.exists(self.URL_list_filepath):
@@ -112,38 +1434,152 @@ class VideoSimilarityTester:
                 vst_error.path_not_exist(self.export_comparison_result)
         #* Create variable
         self.download_retry = 5
+        self.download_backoff = 1
         self.videohash_retry = 3
         self.fingerprint_retry = 3
         self.URL_list = np.empty(0, dtype=str)
         self.video_detail_dataframe = pd.DataFrame(columns=["URL", "TITLE", "PATH", "HASH", "HASH_HEX", "COLLAGE_PATH", "BITS_IN_HASH", "FINGER_PRINT"])
         self.PATH_list = np.empty(0, dtype=str)
         self.TITLE_list = np.empty(0, dtype=str)
-        self.VideoHash_list = []
         self.HASH_list = np.empty(0, dtype=str)
         self.HASH_HEX_list = np.empty(0, dtype=str)
         self.COLLAGE_PATH_list = np.empty(0, dtype=str)
         self.BITS_IN_HASH_list = np.empty(0, dtype=str)
         self.FINGER_PRINT_list = np.empty(0, dtype=str)
+        self.CONTENT_KEY_list = []
+        self.hash_result = {}
+        self.fingerprint_result = {}
+        self.segment_result = {}
+        self.previous_segment_result = {}
+        #* Extra arguments of per-video jobs after (path, retry)
+        self.job_argument = {_signature_job: (self.fast_decode,)}
+        self.metrics = RunMetrics(profile_phase_list)
+        self.index_offset = 0
+        self.previous_video_detail_dataframe = None
+        self.signature_index = None
+        self.previous_comparison_result_path = None
+        self.previous_fingerprint_similarity_range = None
+        self.comparison_shard = None
+        self.candidate_pair = None
+        self.journal = None
+        self.comparison_journal_key = None
         self.comparison_dataframe = pd.DataFrame(columns=["vid1_idx", "vid2_idx", "mix_idx", "hash_similarity", "fingerprint_similarity", "avg_similarity"])
         self.comparison_vid1_idx_list = np.empty(0, dtype=int)
         self.comparison_vid2_idx_list = np.empty(0, dtype=int)
         self.comparison_mix_idx_list = np.empty(0, dtype=str)
         self.comparison_result_list1 = np.empty(0, dtype=float)
         self.comparison_result_list2 = np.empty(0, dtype=float)
-        #* Call next function on the line
+        #* Open signature cache
+        if self.signature_cache == True:
+            self.signature_cache = SignatureCache(self.cache_path, max_age_days=signature_cache_max_age, max_entries=signature_cache_max_entries, variant=None if self.fast_decode == None else "fast_decode={}".format(self.fast_decode))
+            if clear_signature_cache == True:
+                self.signature_cache.invalidate()
+        else:
+            self.signature_cache = None
+        #* Video libraries are only needed when videos are downloaded or decoded
+        if self.rescore == False and self.shard_worker == False and self.shard_merge == False:
+            _import_video_library()
+        #* Call next function on the line, run=False leaves the phases to the caller (benchmark)
+        if run == False:
+            return
+        if self.shard_worker == True:
+            with self.metrics.phase("work_comparison_shard"):
+                self._work_comparison_shard()
+            self._write_run_metrics()
+            return
+        if self.shard_merge == True:
+            with self.metrics.phase("load_exported_signature"):
+                self._load_exported_signature()
+            with self.metrics.phase("load_comparison_shard"):
+                self._load_comparison_shard()
+            with self.metrics.phase("generate_result"):
+                self._generate_result()
+            self._write_run_metrics()
+            return
+        if self.rescore == True:
+            with self.metrics.phase("load_exported_signature"):
+                self._load_exported_signature()
+            if self.shard_tile_size != None:
+                with self.metrics.phase("plan_comparison_shard"):
+                    self._plan_comparison_shard()
+            else:
+                with self.metrics.phase("generate_result"):
+                    self._generate_result()
+            self._write_run_metrics()
+            return
+        self._open_journal()
         if self.input_method == "URL_list":
-            self.input_filepath = self.URL_list_filepath
-            self._load_URL_list()
-            self._download_video()
+            with self.metrics.phase("load_URL_list"):
+                self._load_URL_list()
+            if self.incremental == True:
+                with self.metrics.phase("load_previous_result"):
+                    self._load_previous_result()
+            with self.metrics.phase("download_and_extract_signature"):
+                self._download_and_extract_signature()
         elif self.input_method == "PATH_list":
-            self.input_filepath = self.PATH_list_filepath
-            self._load_PATH_list()
-        self._hash_video()
-        self._finger_print_video()
+            with self.metrics.phase("load_PATH_list"):
+                self._load_PATH_list()
+            if self.incremental == True:
+                with self.metrics.phase("load_previous_result"):
+                    self._load_previous_result()
+            with self.metrics.phase("load_content_key"):
+                self._load_content_key()
+            if self.single_decode == True:
+                with self.metrics.phase("extract_signature"):
+                    self._extract_signature()
+            else:
+                with self.metrics.phase("hash_video"):
+                    self._hash_video()
+                with self.metrics.phase("finger_print_video"):
+                    self._finger_print_video()
+            if self.segment_length != None:
+                with self.metrics.phase("segment_video"):
+                    self._segment_video()
+        if self.segment_length != None and self.previous_video_detail_dataframe is not None:
+            with self.metrics.phase("load_previous_segment_thumbnail"):
+                self._load_previous_segment_thumbnail()
+        with self.metrics.phase("close_signature_cache"):
+            self._close_signature_cache()
+        if self.previous_video_detail_dataframe is not None:
+            with self.metrics.phase("merge_previous_video_detail"):
+                self._merge_previous_video_detail()
         if self.export_video_detail != False:
-            self._write_video_detail()
-        self._generate_result()
-        self._remove_cache()
+            with self.metrics.phase("write_video_detail"):
+                self._write_video_detail()
+        if self.shard_tile_size != None:
+            with self.metrics.phase("plan_comparison_shard"):
+                self._plan_comparison_shard()
+        elif self.journal.get("phase", "generate_result") != None:
+            #* Comparison result of the interrupted run was already exported
+            logging.info("Comparison result of the interrupted run is complete, skipping comparison.")
+            print("Comparison result of the interrupted run is complete, skipping comparison.")
+        else:
+            with self.metrics.phase("generate_result"):
+                self._generate_result()
+            self.journal.record("phase", "generate_result")
+        if self.segment_length != None:
+            with self.metrics.phase("generate_segment_result"):
+                self._generate_segment_result()
+        with self.metrics.phase("remove_cache"):
+            self._remove_cache()
+        self._write_run_metrics()
+        self.journal.close(complete=True)
+
+    def _open_journal(self) -> None:
+        #* Journal entries are only reused by a run with the same input and options that change results
+        header = {"input_method": self.input_method, "input": os.path.abspath(self.input_filepath), "export_video_detail": self.export_video_detail if self.export_video_detail == False else os.path.abspath(self.export_video_detail), "export_comparison_result": self.export_comparison_result if self.export_comparison_result == False else os.path.abspath(self.export_comparison_result), "incremental": self.incremental, "single_decode": self.single_decode, "fast_decode": self.fast_decode, "segment_length": self.segment_length, "method_weight": list(self.method_weight), "hash_threshold": self.hash_threshold, "fingerprint_threshold": self.fingerprint_threshold, "stream_result": self.stream_result, "top_k": self.top_k, "min_similarity": self.min_similarity, "shard_tile_size": self.shard_tile_size}
+        self.journal = RunJournal(self.cache_path, json.loads(json.dumps(header, default=str)), resume=self.resume)
+
+    def _journal_entry(self, kind: str, i: int):
+        #* Entry of the interrupted run, only for the same video at the same position
+        entry = self.journal.get(kind, i) if self.journal != None else None
+        if entry == None or entry["path"] != self.PATH_list[i]:
+            return None
+        return entry
+
+    def _journal_record(self, kind: str, i: int, **value) -> None:
+        if self.journal != None:
+            self.journal.record(kind, i, path=self.PATH_list[i], **value)
 
     def _load_URL_list(self) -> None:
         with open(self.input_filepath, "r") as f:
@@ -166,77 +1602,366 @@ class VideoSimilarityTester:
         logging.info("Loaded PATH list from {} with {} {} files.".format(self.PATH_list_filepath, self.PATH_list.shape[0], self.PATH_list.shape))
         print("PATH list loading phase complete, loaded {} PATHs.".format(self.PATH_list.shape[0]))
 
-    def _download_video(self) -> None:
-        #* Download video from URL
-        for i, url in enumerate(self.URL_list):
-            logging.debug("Downloading video from {}.".format(url))
-            path = os.path.join(self.cache_path, str(i)+".mp4")
-            path = os.path.abspath(path)
-            logging.debug("Saving file is: ".format(path))
-            tmp_download_retry = self.download_retry
-            while (tmp_download_retry > 0):
-                try:
-                    #* Download video from URL & Save video to file
-                    yt = YouTube(url)
-                    yt.streams.filter(progressive=True, file_extension="mp4").order_by("resolution").desc().first().download(filename=path)
-                    #* Save data to list
-                    self.PATH_list = np.append(self.PATH_list, path)
-                    self.TITLE_list = np.append(self.TITLE_list, yt.title)
-                    break
-                except Exception as e:
-                    vst_warning.general_warning(e)
-                    logging.warning("Failed to download {}th video from {}. Try count: {}".format(i+1, url, self.download_retry-tmp_download_retry+1))
-                    print("Failed to download {}th video from {}. Try count: {}".format(i+1, url, self.download_retry-tmp_download_retry+1))
-                    tmp_download_retry -= 1
-                    if tmp_download_retry == 0:
-                        logging.warning("Failed to download {}th video from {} after {} retries.".format(i+1, url, self.download_retry))
-                        vst_warning.action_failed("download video")
-                        self.PATH_list = np.append(self.PATH_list, "")
-                        self.TITLE_list = np.append(self.TITLE_list, "")
-            print("Downloading {}/{} videos...".format(i+1, self.URL_list.shape[0]), end="\r")
-        print("Downloading {}/{} videos... OK".format(i+1, self.URL_list.shape[0]))
-        if self.PATH_list.shape[0] != self.URL_list.shape[0]:
-            logging.warning("Some videos are not downloaded.")
-            vst_warning.action_failed("download video")
+    def _download_and_extract_signature(self) -> None:
+        #* Download videos in download threads, each video is queued for hashing and fingerprinting as soon as it lands in cache folder
+        video_count = self.URL_list.shape[0]
+        self.PATH_list = np.array([os.path.abspath(os.path.join(self.cache_path, str(self.index_offset+i)+".mp4")) for i in range(video_count)], dtype=str)
+        self.TITLE_list = np.full(video_count, "", dtype=object)
+        self.CONTENT_KEY_list = [None] * video_count
+        if self.single_decode == True:
+            stage_list = [(_signature_job, self.videohash_retry, self._load_cached_signature, self._handle_signature_result)]
+        else:
+            stage_list = [(_hash_job, self.videohash_retry, self._load_cached_hash, self._handle_hash_result), (_finger_print_job, self.fingerprint_retry, self._load_cached_finger_print, self._handle_finger_print_result)]
+        if self.segment_length != None:
+            stage_list.append((_segment_thumbnail_job, self.videohash_retry, self._load_cached_segment_thumbnail, self._handle_segment_thumbnail_result))
+        handler = {job: handle_result for job, retry, load_cached, handle_result in stage_list}
+        download_count = [0]
+        logging.info("Downloading {} videos with {} download threads.".format(video_count, self.download_workers))
+        download_executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.download_workers)
+        try:
+            download_future_index = {}
+            resumed_download = set()
+            for i, url in enumerate(self.URL_list):
+                #* Download of the interrupted run is kept while the file is in cache folder, or when the cleanup already removed it after comparison
+                entry = self._journal_entry("download", i)
+                if entry != None and entry["url"] == url and ((os.path.exists(self.PATH_list[i]) and os.path.getsize(self.PATH_list[i]) == entry["size"]) or self.journal.get("phase", "generate_result") != None):
+                    future = concurrent.futures.Future()
+                    future.set_result((entry["title"], [], 0.0))
+                    resumed_download.add(i)
+                else:
+                    future = download_executor.submit(_timed_job, _download_job, url, self.PATH_list[i], self.download_retry, self.download_backoff)
+                download_future_index[future] = i
+            if len(resumed_download) != 0:
+                logging.info("Reusing {} downloads of the interrupted run.".format(len(resumed_download)))
+
+            def task_iter():
+                #* Yield signature jobs in download completion order
+                for future in concurrent.futures.as_completed(download_future_index):
+                    i = download_future_index[future]
+                    url = self.URL_list[i]
+                    title, failure_list, seconds = future.result()
+                    download_count[0] += 1
+                    if i not in resumed_download:
+                        self.metrics.video(_download_job.__name__, seconds)
+                        self.metrics.count("download_retry_count", len(failure_list))
+                        self.metrics.count("download_failed_count", int(title == None))
+                        for count, failure in enumerate(failure_list):
+                            vst_warning.general_warning(failure)
+                            logging.warning("Failed to download {}th video from {}. Try count: {}".format(i+1, url, count+1))
+                            print("Failed to download {}th video from {}. Try count: {}".format(i+1, url, count+1))
+                        if title == None:
+                            logging.warning("Failed to download {}th video from {} after {} retries.".format(i+1, url, self.download_retry))
+                            vst_warning.action_failed("download video")
+                            self.PATH_list[i] = ""
+                            self.hash_result[i] = ["", "", "", ""]
+                            self.fingerprint_result[i] = ""
+                            continue
+                        logging.debug("Downloaded {}th video from {} to {}.".format(i+1, url, self.PATH_list[i]))
+                        self.metrics.count("bytes_downloaded", os.path.getsize(self.PATH_list[i]))
+                        self._journal_record("download", i, url=url, title=title, size=os.path.getsize(self.PATH_list[i]))
+                    self.TITLE_list[i] = title
+                    if self.signature_cache != None and os.path.exists(self.PATH_list[i]):
+                        self.CONTENT_KEY_list[i] = self.signature_cache.content_key(self.PATH_list[i])
+                    for job, retry, load_cached, handle_result in stage_list:
+                        if not load_cached(i):
+                            yield job, i, retry
+                    print("Downloading {}/{} videos, extracted signature of {}...".format(download_count[0], video_count, len(self.fingerprint_result)), end="\r")
+
+            for job, i, result, failure_list in self._run_job(task_iter()):
+                handler[job](i, result, failure_list)
+                print("Downloading {}/{} videos, extracted signature of {}...".format(download_count[0], video_count, len(self.fingerprint_result)), end="\r")
+        except FFmpegNotFound:
+            vst_error.dependency_not_found("FFmpeg")
+        finally:
+            download_executor.shutdown(wait=False, cancel_futures=True)
+        print("Downloading {}/{} videos, extracted signature of {}... OK".format(download_count[0], video_count, len(self.fingerprint_result)))
+        self.TITLE_list = self.TITLE_list.astype(str)
         self.video_detail_dataframe["PATH"] = self.PATH_list
         self.video_detail_dataframe["TITLE"] = self.TITLE_list
         logging.debug("Downloaded video list: {}".format(self.PATH_list))
-        logging.info("Downloaded {} videos.".format(self.PATH_list.shape[0]))
-        print("Video downloading phase complete.")
+        logging.info("Downloaded {} videos.".format(int((self.PATH_list != "").sum())))
+        self._save_hash_result()
+        self._save_finger_print_result()
+        print("Video downloading and signature extraction phase complete.")
+
+    def _load_exported_signature(self) -> None:
+        #* Signatures of a previous run for re-scoring, from the binary signature index when present, else from video_detail.csv
+        video_detail_path = os.path.abspath(os.path.join(self.export_video_detail, "video_detail.csv")) if self.export_video_detail != False else ""
+        index_path = os.path.splitext(video_detail_path)[0] + "_index"
+        if os.path.exists(index_path):
+            self.signature_index = SignatureIndex(index_path)
+            self.PATH_list = self.signature_index.PATH_list.to_array()
+            self.HASH_list = self.signature_index.HASH_list.to_array()
+            self.FINGER_PRINT_list = self.signature_index.FINGER_PRINT_list.to_array()
+            source_path = index_path
+        elif os.path.exists(video_detail_path):
+            video_detail_dataframe = pd.read_csv(video_detail_path, dtype=str, keep_default_na=False)
+            self.PATH_list = video_detail_dataframe["PATH"].to_numpy(dtype=str)
+            self.HASH_list = video_detail_dataframe["HASH"].to_numpy(dtype=str)
+            self.FINGER_PRINT_list = video_detail_dataframe["FINGER_PRINT"].to_numpy(dtype=str)
+            source_path = video_detail_path
+        else:
+            logging.critical("No exported video detail to re-score.")
+            vst_error.file_not_exist(video_detail_path)
+        logging.info("Loaded exported signatures of {} videos from {}.".format(self.PATH_list.shape[0], source_path))
+        print("Exported signature loading phase complete, loaded {} videos.".format(self.PATH_list.shape[0]))
+
+    def _load_previous_result(self) -> None:
+        #* Load previously exported result and keep only input entries that are not in it
+        video_detail_path = os.path.abspath(os.path.join(self.export_video_detail, "video_detail.csv")) if self.export_video_detail != False else ""
+        comparison_result_path = os.path.abspath(os.path.join(self.export_comparison_result, "comparison_result.csv")) if self.export_comparison_result != False else ""
+        #* An interrupted run may have exported its own videos already, only the videos known when it started are previous
+        journal_entry = self.journal.get("previous_result", "video_detail") if self.journal != None else None
+        if not os.path.exists(video_detail_path) or not os.path.exists(comparison_result_path) or (journal_entry != None and journal_entry["video_count"] == 0):
+            logging.warning("No previous result found, comparing every video.")
+            vst_warning.general_warning("No previous result found in export result folder, comparing every video")
+            if self.journal != None and journal_entry == None:
+                self.journal.record("previous_result", "video_detail", video_count=0)
+            return
+        self.previous_video_detail_dataframe = pd.read_csv(video_detail_path, dtype=str, keep_default_na=False)
+        if journal_entry != None:
+            self.previous_video_detail_dataframe = self.previous_video_detail_dataframe.iloc[:journal_entry["video_count"]]
+        elif self.journal != None:
+            self.journal.record("previous_result", "video_detail", video_count=self.previous_video_detail_dataframe.shape[0])
+        self.previous_comparison_result_path = comparison_result_path
+        range_path = os.path.splitext(comparison_result_path)[0] + ".json"
+        if os.path.exists(range_path):
+            self.previous_fingerprint_similarity_range = _read_fingerprint_similarity_range(range_path)
+        self.index_offset = self.previous_video_detail_dataframe.shape[0]
+        #* Entries are identified by URL for URL list and by PATH for PATH list
+        if self.input_method == "URL_list":
+            new_mask = ~np.isin(self.URL_list, self.previous_video_detail_dataframe["URL"].to_numpy(dtype=str))
+            self.URL_list = self.URL_list[new_mask]
+            self.video_detail_dataframe = self.video_detail_dataframe.iloc[0:0]
+            self.video_detail_dataframe["URL"] = self.URL_list
+        else:
+            new_mask = ~np.isin(self.PATH_list, self.previous_video_detail_dataframe["PATH"].to_numpy(dtype=str))
+            self.PATH_list = self.PATH_list[new_mask]
+            self.video_detail_dataframe = self.video_detail_dataframe.iloc[0:0]
+            self.video_detail_dataframe["PATH"] = self.PATH_list
+        logging.info("Loaded previous result of {} videos from {}, {} new videos.".format(self.index_offset, video_detail_path, int(new_mask.sum())))
+        print("Previous result loading phase complete, {} known videos, {} new videos.".format(self.index_offset, int(new_mask.sum())))
+
+    def _merge_previous_video_detail(self) -> None:
+        #* Put new videos after the previous ones, new videos get index from index_offset
+        previous = self.previous_video_detail_dataframe
+        self.video_detail_dataframe = pd.concat([previous, self.video_detail_dataframe.fillna("").astype(str)], ignore_index=True)
+        self.PATH_list = np.concatenate([previous["PATH"].to_numpy(dtype=str), self.PATH_list.astype(str)])
+        self.HASH_list = np.concatenate([previous["HASH"].to_numpy(dtype=str), self.HASH_list.astype(str)])
+        self.HASH_HEX_list = np.concatenate([previous["HASH_HEX"].to_numpy(dtype=str), self.HASH_HEX_list.astype(str)])
+        self.COLLAGE_PATH_list = np.concatenate([previous["COLLAGE_PATH"].to_numpy(dtype=str), self.COLLAGE_PATH_list.astype(str)])
+        self.BITS_IN_HASH_list = np.concatenate([previous["BITS_IN_HASH"].to_numpy(dtype=str), self.BITS_IN_HASH_list.astype(str)])
+        self.FINGER_PRINT_list = np.concatenate([previous["FINGER_PRINT"].to_numpy(dtype=str), self.FINGER_PRINT_list.astype(str)])
+        logging.info("Merged {} previous videos with {} new videos.".format(self.index_offset, self.PATH_list.shape[0] - self.index_offset))
+
+    def _load_content_key(self) -> None:
+        #* Identify video files for the signature cache
+        for path in self.PATH_list:
+            if self.signature_cache == None or path == "":
+                self.CONTENT_KEY_list.append(None)
+            else:
+                self.CONTENT_KEY_list.append(self.signature_cache.content_key(path))
+        logging.debug("Loaded content key list: {}".format(self.CONTENT_KEY_list))
 
     def _hash_video(self) -> None:
         #* Hash video
-        for i, path in enumerate(self.PATH_list):
-            logging.debug("Hashing video from {}.".format(path))
-            tmp_videohash_retry = self.videohash_retry
-            while (tmp_videohash_retry > 0):
-                try:
-                    #* Hash video
-                    videohash = VideoHash(path)
-                    #* Save data to list
-                    self.VideoHash_list.append(videohash)
-                    self.HASH_list = np.append(self.HASH_list, videohash.hash)
-                    self.HASH_HEX_list = np.append(self.HASH_HEX_list, videohash.hash_hex)
-                    self.COLLAGE_PATH_list = np.append(self.COLLAGE_PATH_list, videohash.collage_path)
-                    self.BITS_IN_HASH_list = np.append(self.BITS_IN_HASH_list, videohash.bits_in_hash)
-                    break
-                except videohash.exceptions.FFmpegNotFound:
-                    vst_error.dependency_not_found("FFmpeg")
-                except Exception as e:
-                    vst_warning.general_warning(e)
-                    logging.warning("Failed to hash {}th video from {}. Try count: {}".format(i+1, path, self.videohash_retry-tmp_videohash_retry+1))
-                    print("Failed to hash {}th video from {}. Try count: {}".format(i+1, path, self.videohash_retry-tmp_videohash_retry+1))
-                    temp_videohash_retry -= 1
-                    if tmp_videohash_retry == 0:
-                        logging.warning("Failed to hash {}th video from {} after {} retries".format(i+1, path, self.videohash_retry))
-                        vst_warning.action_failed("hash video")
-                        self.VideoHash_list.append(None)
-                        self.HASH_list = np.append(self.HASH_list, "")
-                        self.HASH_HEX_list = np.append(self.HASH_HEX_list, "")
-                        self.COLLAGE_PATH_list = np.append(self.COLLAGE_PATH_list, "")
-                        self.BITS_IN_HASH_list = np.append(self.BITS_IN_HASH_list, "")
-            print("Hashing {}/{} videos...".format(i+1, self.PATH_list.shape[0]), end="\r")
-        print("Hashing {}/{} videos... OK".format(i+1, self.PATH_list.shape[0]))
+        task_list = [(_hash_job, i, self.videohash_retry) for i in range(self.PATH_list.shape[0]) if not self._load_cached_hash(i)]
+        try:
+            for job, i, result, failure_list in self._run_job(task_list):
+                self._handle_hash_result(i, result, failure_list)
+                print("Hashing {}/{} videos...".format(len(self.hash_result), self.PATH_list.shape[0]), end="\r")
+        except FFmpegNotFound:
+            vst_error.dependency_not_found("FFmpeg")
+        print("Hashing {}/{} videos... OK".format(len(self.hash_result), self.PATH_list.shape[0]))
+        self._save_hash_result()
+        print("Video hashing phase complete.")
+    
+    def _finger_print_video(self) -> None:
+        #* Fingerprint video
+        task_list = [(_finger_print_job, i, self.fingerprint_retry) for i in range(self.PATH_list.shape[0]) if not self._load_cached_finger_print(i)]
+        for job, i, result, failure_list in self._run_job(task_list):
+            self._handle_finger_print_result(i, result, failure_list)
+            print("Fingerprinting {}/{} videos...".format(len(self.fingerprint_result), self.PATH_list.shape[0]), end="\r")
+        print("Fingerprinting {}/{} videos... OK".format(len(self.fingerprint_result), self.PATH_list.shape[0]))
+        self._save_finger_print_result()
+        print("Video fingerprinting phase complete.")
+
+    def _extract_signature(self) -> None:
+        #* Hash and fingerprint video from a single decode
+        task_list = [(_signature_job, i, self.videohash_retry) for i in range(self.PATH_list.shape[0]) if not self._load_cached_signature(i)]
+        try:
+            for job, i, result, failure_list in self._run_job(task_list):
+                self._handle_signature_result(i, result, failure_list)
+                print("Extracting signature {}/{} videos...".format(len(self.hash_result), self.PATH_list.shape[0]), end="\r")
+        except FFmpegNotFound:
+            vst_error.dependency_not_found("FFmpeg")
+        print("Extracting signature {}/{} videos... OK".format(len(self.hash_result), self.PATH_list.shape[0]))
+        self._save_hash_result()
+        self._save_finger_print_result()
+        print("Video signature extraction phase complete.")
+
+    def _segment_video(self) -> None:
+        #* Per second thumbnails for segment hashing
+        task_list = [(_segment_thumbnail_job, i, self.videohash_retry) for i in range(self.PATH_list.shape[0]) if not self._load_cached_segment_thumbnail(i)]
+        try:
+            for job, i, result, failure_list in self._run_job(task_list):
+                self._handle_segment_thumbnail_result(i, result, failure_list)
+                print("Segmenting {}/{} videos...".format(len(self.segment_result), self.PATH_list.shape[0]), end="\r")
+        except FFmpegNotFound:
+            vst_error.dependency_not_found("FFmpeg")
+        print("Segmenting {}/{} videos... OK".format(len(self.segment_result), self.PATH_list.shape[0]))
+        logging.info("Segmented {} videos.".format(sum(thumbnail is not None for thumbnail in self.segment_result.values())))
+        print("Video segmenting phase complete.")
+
+    def _load_previous_segment_thumbnail(self) -> None:
+        #* Videos of the previous result are only segment matched when their thumbnails are in the signature cache
+        if self.signature_cache == None:
+            logging.warning("Segment matching of previous videos needs the signature cache.")
+            return
+        for i, path in enumerate(self.previous_video_detail_dataframe["PATH"]):
+            if path == "":
+                continue
+            thumbnail = self.signature_cache.get_segment_thumbnail(self.signature_cache.content_key(path)) if os.path.exists(path) else None
+            if thumbnail is not None:
+                self.previous_segment_result[i] = thumbnail
+        logging.info("Loaded segment thumbnails of {} of {} previous videos from signature cache.".format(len(self.previous_segment_result), self.index_offset))
+
+    def _load_cached_hash(self, i: int) -> bool:
+        #* Reuse hash of the interrupted run or of unchanged video
+        entry = self._journal_entry("hash", i)
+        if entry != None:
+            self.hash_result[i] = entry["result"]
+            return True
+        if self.signature_cache == None:
+            return False
+        cached = self.signature_cache.get_hash(self.CONTENT_KEY_list[i])
+        if cached == None:
+            return False
+        logging.debug("Loaded hash of {}th video from signature cache.".format(i+1))
+        self.hash_result[i] = [cached[0], cached[1], "", cached[2]]
+        return True
+
+    def _load_cached_finger_print(self, i: int) -> bool:
+        #* Reuse fingerprint of the interrupted run or of unchanged video
+        entry = self._journal_entry("fingerprint", i)
+        if entry != None:
+            self.fingerprint_result[i] = entry["result"]
+            return True
+        if self.signature_cache == None:
+            return False
+        cached = self.signature_cache.get_fingerprint(self.CONTENT_KEY_list[i])
+        if cached == None:
+            return False
+        logging.debug("Loaded fingerprint of {}th video from signature cache.".format(i+1))
+        self.fingerprint_result[i] = cached
+        return True
+
+    def _load_cached_signature(self, i: int) -> bool:
+        #* Reuse signature of the interrupted run or of unchanged video, only when both hash and fingerprint are known
+        hash_entry, fingerprint_entry = self._journal_entry("hash", i), self._journal_entry("fingerprint", i)
+        if hash_entry != None and fingerprint_entry != None:
+            self.hash_result[i] = hash_entry["result"]
+            self.fingerprint_result[i] = fingerprint_entry["result"]
+            return True
+        if self.signature_cache == None:
+            return False
+        cached_hash = self.signature_cache.get_hash(self.CONTENT_KEY_list[i])
+        cached_fingerprint = self.signature_cache.get_fingerprint(self.CONTENT_KEY_list[i])
+        if cached_hash == None or cached_fingerprint == None:
+            return False
+        logging.debug("Loaded signature of {}th video from signature cache.".format(i+1))
+        self.hash_result[i] = [cached_hash[0], cached_hash[1], "", cached_hash[2]]
+        self.fingerprint_result[i] = cached_fingerprint
+        return True
+
+    def _load_cached_segment_thumbnail(self, i: int) -> bool:
+        #* Reuse segment thumbnails of the interrupted run or of unchanged video
+        if self._journal_entry("segment", i) != None:
+            self.segment_result[i] = self.journal.read_array("segment_{}".format(i))["thumbnail"]
+            return True
+        if self.signature_cache == None:
+            return False
+        cached = self.signature_cache.get_segment_thumbnail(self.CONTENT_KEY_list[i])
+        if cached is None:
+            return False
+        logging.debug("Loaded segment thumbnails of {}th video from signature cache.".format(i+1))
+        self.segment_result[i] = cached
+        return True
+
+    def _handle_hash_result(self, i: int, result, failure_list: list) -> None:
+        path = self.PATH_list[i]
+        for count, failure in enumerate(failure_list):
+            vst_warning.general_warning(failure)
+            logging.warning("Failed to hash {}th video from {}. Try count: {}".format(i+1, path, count+1))
+            print("Failed to hash {}th video from {}. Try count: {}".format(i+1, path, count+1))
+        if result == None:
+            logging.warning("Failed to hash {}th video from {} after {} retries".format(i+1, path, self.videohash_retry))
+            vst_warning.action_failed("hash video")
+            result = ["", "", "", ""]
+        elif self.signature_cache != None and self.CONTENT_KEY_list[i] != None:
+            self.signature_cache.put_hash(self.CONTENT_KEY_list[i], path, result[0], result[1], result[3])
+        if result[0] != "":
+            self._journal_record("hash", i, result=result)
+        self.hash_result[i] = result
+
+    def _handle_finger_print_result(self, i: int, result, failure_list: list) -> None:
+        path = self.PATH_list[i]
+        for count, failure in enumerate(failure_list):
+            vst_warning.general_warning(failure)
+            logging.warning("Failed to fingerprint {}th video from {}. Try count: {}".format(i+1, path, count+1))
+            print("Failed to fingerprint {}th video from {}. Try count: {}".format(i+1, path, count+1))
+        if result == None:
+            logging.warning("Failed to fingerprint {}th video from {} after {} retries".format(i+1, path, self.fingerprint_retry))
+            vst_warning.action_failed("fingerprint video")
+            result = ""
+        elif self.signature_cache != None and self.CONTENT_KEY_list[i] != None:
+            self.signature_cache.put_fingerprint(self.CONTENT_KEY_list[i], path, result)
+        if result != "":
+            self._journal_record("fingerprint", i, result=result)
+        self.fingerprint_result[i] = result
+
+    def _handle_signature_result(self, i: int, result, failure_list: list) -> None:
+        path = self.PATH_list[i]
+        for count, failure in enumerate(failure_list):
+            vst_warning.general_warning(failure)
+            logging.warning("Failed to extract signature of {}th video from {}. Try count: {}".format(i+1, path, count+1))
+            print("Failed to extract signature of {}th video from {}. Try count: {}".format(i+1, path, count+1))
+        if result == None:
+            logging.warning("Failed to extract signature of {}th video from {} after {} retries".format(i+1, path, self.videohash_retry))
+            vst_warning.action_failed("extract video signature")
+            result = ["", "", "", "", ""]
+        elif self.signature_cache != None and self.CONTENT_KEY_list[i] != None:
+            self.signature_cache.put_hash(self.CONTENT_KEY_list[i], path, result[0], result[1], result[3])
+            self.signature_cache.put_fingerprint(self.CONTENT_KEY_list[i], path, result[4])
+        if result[0] != "":
+            self._journal_record("hash", i, result=result[:4])
+            self._journal_record("fingerprint", i, result=result[4])
+        self.hash_result[i] = result[:4]
+        self.fingerprint_result[i] = result[4]
+
+    def _handle_segment_thumbnail_result(self, i: int, result, failure_list: list) -> None:
+        path = self.PATH_list[i]
+        for count, failure in enumerate(failure_list):
+            vst_warning.general_warning(failure)
+            logging.warning("Failed to segment {}th video from {}. Try count: {}".format(i+1, path, count+1))
+            print("Failed to segment {}th video from {}. Try count: {}".format(i+1, path, count+1))
+        if result is None:
+            logging.warning("Failed to segment {}th video from {} after {} retries".format(i+1, path, self.videohash_retry))
+            vst_warning.action_failed("segment video")
+        elif self.signature_cache != None and self.CONTENT_KEY_list[i] != None:
+            self.signature_cache.put_segment_thumbnail(self.CONTENT_KEY_list[i], path, result)
+        if result is not None and self.journal != None:
+            self.journal.write_array("segment_{}".format(i), thumbnail=result)
+            self._journal_record("segment", i)
+        self.segment_result[i] = result
+
+    def _save_hash_result(self) -> None:
+        #* Save data to list in input order
+        for i in range(self.PATH_list.shape[0]):
+            self.HASH_list = np.append(self.HASH_list, self.hash_result[i][0])
+            self.HASH_HEX_list = np.append(self.HASH_HEX_list, self.hash_result[i][1])
+            self.COLLAGE_PATH_list = np.append(self.COLLAGE_PATH_list, self.hash_result[i][2])
+            self.BITS_IN_HASH_list = np.append(self.BITS_IN_HASH_list, self.hash_result[i][3])
         if self.HASH_list.shape[0] != self.PATH_list.shape[0]:
             logging.warning("Some videos are not hashed.")
             vst_warning.action_failed("hash video")
@@ -246,38 +1971,61 @@ class VideoSimilarityTester:
         self.video_detail_dataframe["BITS_IN_HASH"] = self.BITS_IN_HASH_list
         logging.debug("Hashed video list: {}".format(self.HASH_list))
         logging.info("Hashed {} videos.".format(self.HASH_list.shape[0]))
-        print("Video hashing phase complete.")
-    
-    def _finger_print_video(self) -> None:
-        #* Fingerprint video
-        for i, path in enumerate(self.PATH_list):
-            logging.debug("Fingerprinting video from {}.".format(path))
-            tmp_fingerprint_retry = self.fingerprint_retry
-            while (tmp_fingerprint_retry > 0):
-                try:
-                    #* Fingerprint video
-                    vp = vfp.VideoFingerprint(path)
-                    #* Save data to list
-                    self.FINGER_PRINT_list = np.append(self.FINGER_PRINT_list, vp.fingerprint)
-                    break
-                except Exception as e:
-                    vst_warning.general_warning(e)
-                    logging.warning("Failed to fingerprint {}th video from {}. Try count: {}".format(i+1, path, self.fingerprint_retry-tmp_fingerprint_retry+1))
-                    print("Failed to fingerprint {}th video from {}. Try count: {}".format(i+1, path, self.fingerprint_retry-tmp_fingerprint_retry+1))
-                    tmp_fingerprint_retry -= 1
-                    if tmp_fingerprint_retry == 0:
-                        logging.warning("Failed to fingerprint {}th video from {} after {} retries".format(i+1, path, self.fingerprint_retry))
-                        vst_warning.action_failed("fingerprint video")
-                        self.FINGER_PRINT_list = np.append(self.FINGER_PRINT_list, "")
-            print("Fingerprinting {}/{} videos...".format(i+1, self.PATH_list.shape[0]), end="\r")
-        print("Fingerprinting {}/{} videos... OK".format(i+1, self.PATH_list.shape[0]))
+
+    def _save_finger_print_result(self) -> None:
+        #* Save data to list in input order
+        for i in range(self.PATH_list.shape[0]):
+            self.FINGER_PRINT_list = np.append(self.FINGER_PRINT_list, self.fingerprint_result[i])
         if self.FINGER_PRINT_list.shape[0] != self.PATH_list.shape[0]:
             logging.warning("Some videos are not fingerprinted.")
             vst_warning.action_failed("fingerprint video")
         self.video_detail_dataframe["FINGER_PRINT"] = self.FINGER_PRINT_list
         logging.debug("Fingerprinted video list: {}".format(self.FINGER_PRINT_list))
         logging.info("Fingerprinted {} videos.".format(self.FINGER_PRINT_list.shape[0]))
-        print("Video fingerprinting phase complete.")
+
+    def _run_job(self, task_list):
+        #* Run per-video (job, index, retry) tasks in this process or in a process pool, yield (job, index, result, failure_list) as each job finishes
+        #* task_list may be a generator that blocks until the next video is downloaded, tasks are submitted as they come
+        if self.workers <= 1:
+            for job, i, retry in task_list:
+                logging.debug("Running {} on {}.".format(job.__name__, self.PATH_list[i]))
+                result, failure_list, seconds = _timed_job(job, self.PATH_list[i], retry, *self.job_argument.get(job, ()))
+                self._record_job(job, i, result, failure_list, seconds)
+                yield job, i, result, failure_list
+            return
+        logging.info("Running jobs with {} workers.".format(self.workers))
+        with concurrent.futures.ProcessPoolExecutor(max_workers=self.workers) as executor:
+            future_task = {}
+            done_queue = queue.SimpleQueue()
+            for job, i, retry in task_list:
+                future = executor.submit(_timed_job, job, self.PATH_list[i], retry, *self.job_argument.get(job, ()))
+                future_task[future] = (job, i)
+                future.add_done_callback(done_queue.put)
+                while not done_queue.empty():
+                    future = done_queue.get()
+                    job, i = future_task.pop(future)
+                    result, failure_list, seconds = future.result()
+                    self._record_job(job, i, result, failure_list, seconds)
+                    yield job, i, result, failure_list
+            for future in concurrent.futures.as_completed(future_task):
+                job, i = future_task[future]
+                result, failure_list, seconds = future.result()
+                self._record_job(job, i, result, failure_list, seconds)
+                yield job, i, result, failure_list
+
+    def _record_job(self, job, i: int, result, failure_list: list, seconds: float) -> None:
+        self.metrics.video(job.__name__, seconds)
+        self.metrics.count("retry_count", len(failure_list))
+        self.metrics.count("failed_count", int(result is None))
+        if os.path.isfile(self.PATH_list[i]):
+            self.metrics.count("bytes_read", os.path.getsize(self.PATH_list[i]))
+
+    def _close_signature_cache(self) -> None:
+        if self.signature_cache == None:
+            return
+        self.signature_cache.log_statistics()
+        self.signature_cache.evict()
+        self.signature_cache.close()
 
     def _write_video_detail(self) -> None:
         export_path = os.path.join(self.export_video_detail, "video_detail.csv")
@@ -285,94 +2033,566 @@ class VideoSimilarityTester:
         self.video_detail_dataframe.to_csv(export_path, index=False)
         logging.info("Exported video detail to {}.".format(export_path))
         print("Exported video detail to {}.".format(export_path))
+        index_path = os.path.splitext(export_path)[0] + "_index"
+        SignatureIndex.write(index_path, self.PATH_list, self.HASH_list, self.FINGER_PRINT_list)
+        logging.info("Exported signature index to {}.".format(index_path))
+        print("Exported signature index to {}.".format(index_path))
 
     def _generate_result(self) -> None:
         #* Compare video
-        index_list = np.arange(len(self.PATH_list))
-        for cmp_obj_1, cmp_obj_2 in itertools.combinations(index_list, 2):
-            self.comparison_vid1_idx_list = np.append(self.comparison_vid1_idx_list, cmp_obj_1)
-            self.comparison_vid2_idx_list = np.append(self.comparison_vid2_idx_list, cmp_obj_2)
-            self.comparison_mix_idx_list = np.append(self.comparison_mix_idx_list, str(cmp_obj_1)+"-"+str(cmp_obj_2))
-            #! Abandoned using VideoHash.is_similar() because it shows too little information
-            # self.comparison_result_list1 = np.append(self.comparison_result_list1, i.is_similar(j))
-            try:
-                self.comparison_result_list1 = np.append(self.comparison_result_list1, self.__compare_code(self.VideoHash_list[cmp_obj_1].hash, self.VideoHash_list[cmp_obj_2].hash))
-            except Exception as e:
-                logging.warning("Failed to compare hash data from VideoHash_list of {}th video with {}th video.".format(cmp_obj_1+1, cmp_obj_2+1))
-                vst_warning.general_warning(e)
-                self.comparison_result_list1 = np.append(self.comparison_result_list1, 0)
-            try:
-                self.comparison_result_list2 = np.append(self.comparison_result_list2, self.__compare_code(self.FINGER_PRINT_list[cmp_obj_1], self.FINGER_PRINT_list[cmp_obj_2]))
-            except Exception as e:
-                logging.warning("Failed to compare fingerprint data from FINGER_PRINT_list of {}th video with {}th video.".format(cmp_obj_1+1, cmp_obj_2+1))
-                vst_warning.general_warning(e)
-                self.comparison_result_list2 = np.append(self.comparison_result_list2, 0)
-        self.comparison_dataframe["vid1_idx"] = self.comparison_vid1_idx_list
-        self.comparison_dataframe["vid2_idx"] = self.comparison_vid2_idx_list
-        self.comparison_dataframe["mix_idx"] = self.comparison_mix_idx_list
-        #* Individual similarity boost
-        self.comparison_dataframe["hash_similarity"] = self.comparison_result_list1
-        self.comparison_dataframe["fingerprint_similarity"] = (self.comparison_result_list2 - self.comparison_result_list2.min()) / (self.comparison_result_list2.max() - self.comparison_result_list2.min()) #* Normalize fingerprint similarity
-        self.comparison_dataframe["avg_similarity"] = (self.comparison_dataframe["hash_similarity"] * self.method_weight[0]) + (self.comparison_dataframe["fingerprint_similarity"] * self.method_weight[1])
+        #! Abandoned using VideoHash.is_similar() because it shows too little information
+        if self.signature_index != None:
+            #* Exported signatures are compared with the packed hashes and fingerprint codes of the index
+            hash_engine = self.signature_index.hash_engine(fallback=self._compare_hash_fallback, hash_list=self.HASH_list)
+            finger_print_engine = self.signature_index.finger_print_engine(fallback=self._compare_finger_print_fallback, finger_print_list=self.FINGER_PRINT_list)
+        else:
+            hash_engine = HashComparisonEngine(self.HASH_list, fallback=self._compare_hash_fallback)
+            finger_print_engine = FingerprintComparisonEngine(self.FINGER_PRINT_list, fallback=self._compare_finger_print_fallback)
+        if self.journal != None and self.resume == True and self.stream_result == True:
+            #* Comparison checkpoints of the interrupted run are only valid for the same signatures
+            digest = hashlib.blake2b(digest_size=16)
+            for code in list(self.HASH_list) + list(self.FINGER_PRINT_list):
+                digest.update(str(code).encode("utf-8") + b"\n")
+            self.comparison_journal_key = "{}-{}".format(self.index_offset, digest.hexdigest())
+        if self.stream_result == True:
+            self._generate_result_stream(hash_engine, finger_print_engine)
+            return
+        vid1_idx_block_list = [np.empty(0, dtype=int)]
+        vid2_idx_block_list = [np.empty(0, dtype=int)]
+        hash_similarity_block_list = [np.empty(0, dtype=float)]
+        fingerprint_similarity_block_list = [np.empty(0, dtype=float)]
+        for vid1_idx, vid2_idx, hash_similarity, fingerprint_similarity in self._iter_comparison_block(hash_engine, finger_print_engine):
+            vid1_idx_block_list.append(vid1_idx)
+            vid2_idx_block_list.append(vid2_idx)
+            hash_similarity_block_list.append(hash_similarity)
+            fingerprint_similarity_block_list.append(fingerprint_similarity)
+        self.comparison_vid1_idx_list = np.concatenate(vid1_idx_block_list)
+        self.comparison_vid2_idx_list = np.concatenate(vid2_idx_block_list)
+        self.comparison_mix_idx_list = _mix_idx(self.comparison_vid1_idx_list, self.comparison_vid2_idx_list)
+        self.comparison_result_list1 = np.concatenate(hash_similarity_block_list)
+        self.comparison_result_list2 = np.concatenate(fingerprint_similarity_block_list)
+        if self.comparison_result_list2.shape[0] != 0:
+            self.fingerprint_similarity_range = self._fingerprint_similarity_range(float(self.comparison_result_list2.min()), float(self.comparison_result_list2.max()), finger_print_engine)
+        else:
+            self.fingerprint_similarity_range = self._fingerprint_similarity_range(np.inf, -np.inf, finger_print_engine)
+        self.comparison_dataframe = self._comparison_block_dataframe(self.comparison_vid1_idx_list, self.comparison_vid2_idx_list, self.comparison_result_list1, *self._score_block(self.comparison_result_list1, self.comparison_result_list2))
         logging.debug("Comparison dataframe: {}".format(self.comparison_dataframe))
         logging.info("Comparison dataframe generated.")
         print("Video comparison phase complete.")
         if self.export_comparison_result != False:
             export_path = os.path.join(self.export_comparison_result, "comparison_result.csv")
             export_path = os.path.abspath(export_path)
-            self.comparison_dataframe.to_csv(export_path, index=False)
+            #* Previous result stays intact until the new one is complete, --incremental and --resume read it again
+            self.comparison_dataframe.to_csv(export_path + ".tmp", index=False)
+            os.replace(export_path + ".tmp", export_path)
+            self._write_fingerprint_similarity_range(export_path)
             print("Exported comparison result to {}.".format(export_path))
 
+    def _generate_result_stream(self, hash_engine, finger_print_engine) -> None:
+        #* Write comparison result block by block, memory stays proportional to number of videos instead of number of pairs
+        if self.export_comparison_result == False:
+            logging.warning("Streaming comparison result needs an export path.")
+            vst_warning.action_failed("stream comparison result")
+            return
+        export_path = os.path.abspath(os.path.join(self.export_comparison_result, "comparison_result.csv"))
+        #* With --resume, both passes checkpoint their progress after every block: the running range in the first pass, the size of the written result in the second
+        checkpoint = self.comparison_journal_key != None
+        #* First pass only finds the fingerprint similarity range needed for normalization
+        entry = self.journal.get("comparison_range", self.comparison_journal_key) if checkpoint == True else None
+        first_block, fingerprint_similarity_min, fingerprint_similarity_max = (entry["block"], entry["min"], entry["max"]) if entry != None else (0, np.inf, -np.inf)
+        if entry == None or entry["complete"] == False:
+            if first_block != 0:
+                logging.info("Resuming fingerprint similarity range from comparison block {}.".format(first_block))
+            for block, (vid1_idx, vid2_idx, hash_similarity, fingerprint_similarity) in enumerate(self._iter_comparison_block(hash_engine, finger_print_engine, first_block=first_block), start=first_block):
+                if fingerprint_similarity.shape[0] != 0:
+                    fingerprint_similarity_min = min(fingerprint_similarity_min, float(fingerprint_similarity.min()))
+                    fingerprint_similarity_max = max(fingerprint_similarity_max, float(fingerprint_similarity.max()))
+                if checkpoint == True:
+                    self.journal.record("comparison_range", self.comparison_journal_key, block=block + 1, min=fingerprint_similarity_min, max=fingerprint_similarity_max, complete=False)
+            if checkpoint == True:
+                self.journal.record("comparison_range", self.comparison_journal_key, block=0, min=fingerprint_similarity_min, max=fingerprint_similarity_max, complete=True)
+        self.fingerprint_similarity_range = self._fingerprint_similarity_range(fingerprint_similarity_min, fingerprint_similarity_max, finger_print_engine)
+        #* Second pass writes normalized blocks, or keeps the best pairs of every video (kept in memory only, a resumed top-k pass starts over)
+        top_k = TopKCollector(self.PATH_list.shape[0], self.top_k) if self.top_k != None else None
+        tmp_export_path = export_path + ".tmp"
+        entry = self.journal.get("comparison_output", self.comparison_journal_key) if checkpoint == True and top_k == None else None
+        if entry != None and os.path.exists(tmp_export_path) and os.path.getsize(tmp_export_path) >= entry["size"]:
+            #* Rows written after the last checkpoint are cut off and written again
+            logging.info("Resuming comparison result from comparison block {}.".format(entry["block"]))
+            os.truncate(tmp_export_path, entry["size"])
+            first_block, pair_count, mode = entry["block"], entry["pair_count"], "a"
+        else:
+            first_block, pair_count, mode = 0, 0, "w"
+        with open(tmp_export_path, mode, newline="") as f:
+            if mode == "w":
+                self.comparison_dataframe.iloc[0:0].to_csv(f, index=False)
+            for block, (vid1_idx, vid2_idx, hash_similarity, fingerprint_similarity) in enumerate(self._iter_comparison_block(hash_engine, finger_print_engine, first_block=first_block), start=first_block):
+                #* Pairs are scored and filtered as arrays, only the pairs that are written become a dataframe
+                fingerprint_similarity, avg_similarity = self._score_block(hash_similarity, fingerprint_similarity)
+                if self.min_similarity != None:
+                    keep = avg_similarity >= self.min_similarity
+                    vid1_idx, vid2_idx, hash_similarity, fingerprint_similarity, avg_similarity = vid1_idx[keep], vid2_idx[keep], hash_similarity[keep], fingerprint_similarity[keep], avg_similarity[keep]
+                if top_k != None:
+                    top_k.add(vid1_idx, vid2_idx, avg_similarity, hash_similarity, fingerprint_similarity)
+                    continue
+                self._comparison_block_dataframe(vid1_idx, vid2_idx, hash_similarity, fingerprint_similarity, avg_similarity).to_csv(f, index=False, header=False)
+                pair_count += vid1_idx.shape[0]
+                if checkpoint == True:
+                    f.flush()
+                    os.fsync(f.fileno())
+                    self.journal.record("comparison_output", self.comparison_journal_key, block=block + 1, size=os.fstat(f.fileno()).st_size, pair_count=pair_count)
+                print("Comparing and writing {} pairs...".format(pair_count), end="\r")
+            if top_k != None:
+                block_dataframe = top_k.dataframe(self.comparison_dataframe.columns)
+                block_dataframe.to_csv(f, index=False, header=False)
+                pair_count = block_dataframe.shape[0]
+        os.replace(tmp_export_path, export_path)
+        self._write_fingerprint_similarity_range(export_path)
+        logging.info("Streamed {} pairs of comparison result to {}.".format(pair_count, export_path))
+        print("Video comparison phase complete.")
+        print("Exported comparison result to {}.".format(export_path))
+
+    def _iter_comparison_block(self, hash_engine, finger_print_engine, first_block=0):
+        #* Yield (vid1_idx, vid2_idx, hash_similarity, raw fingerprint_similarity), previous result first in incremental mode
+        #* Blocks before first_block were finished before an interruption, they are skipped without computing fingerprint similarity
+        block = -1
+        if self.previous_comparison_result_path != None:
+            for previous in pd.read_csv(self.previous_comparison_result_path, usecols=["vid1_idx", "vid2_idx", "hash_similarity", "fingerprint_similarity"], chunksize=2**20):
+                block += 1
+                if block < first_block:
+                    continue
+                vid1_idx, vid2_idx = previous["vid1_idx"].to_numpy(dtype=int), previous["vid2_idx"].to_numpy(dtype=int)
+                if self.previous_fingerprint_similarity_range != None:
+                    #* Previous fingerprint similarity is mapped back to raw values, it is normalized again with the new range
+                    previous_min, previous_max = self.previous_fingerprint_similarity_range
+                    fingerprint_similarity = np.full(previous.shape[0], previous_min, dtype=float) if previous_max == previous_min else previous["fingerprint_similarity"].to_numpy(dtype=float) * (previous_max - previous_min) + previous_min
+                else:
+                    logging.warning("No fingerprint similarity range of previous result, recomputing previous fingerprint similarity.")
+                    fingerprint_similarity = finger_print_engine.similarity(vid1_idx, vid2_idx)
+                yield vid1_idx, vid2_idx, previous["hash_similarity"].to_numpy(dtype=float), fingerprint_similarity
+        if self.comparison_shard != None:
+            #* New pairs were computed by shard workers
+            yield from self.comparison_shard.iter_block()
+            return
+        if self.hash_threshold == None and self.fingerprint_threshold == None:
+            block_iter = hash_engine.iter_block(first_new=self.index_offset)
+        else:
+            block_iter = [self._candidate_pair(hash_engine, finger_print_engine)]
+        for vid1_idx, vid2_idx, hash_similarity in block_iter:
+            block += 1
+            if block < first_block:
+                continue
+            yield vid1_idx, vid2_idx, hash_similarity, finger_print_engine.similarity(vid1_idx, vid2_idx)
+
+    def _candidate_pair(self, hash_engine, finger_print_engine) -> tuple:
+        #* Pairs above hash similarity threshold (hash index) and/or above fingerprint bigram Jaccard threshold (MinHash LSH), only these are scored
+        if self.candidate_pair != None:
+            return self.candidate_pair
+        vid1_idx_list, vid2_idx_list = [np.empty(0, dtype=int)], [np.empty(0, dtype=int)]
+        if self.hash_threshold != None:
+            vid1_idx, vid2_idx, hash_similarity = HashIndex(hash_engine, self.hash_threshold).pairs_above(first_new=self.index_offset)
+            vid1_idx_list.append(vid1_idx)
+            vid2_idx_list.append(vid2_idx)
+        if self.fingerprint_threshold != None:
+            fingerprint_lsh = FingerprintLSH(finger_print_engine, self.fingerprint_threshold)
+            vid1_idx, vid2_idx = fingerprint_lsh.pairs_above(first_new=self.index_offset)
+            recall, sample_pair_count = fingerprint_lsh.recall(vid1_idx, vid2_idx, first_new=self.index_offset)
+            self.fingerprint_lsh_report = {"threshold": self.fingerprint_threshold, "band_count": fingerprint_lsh.band_count, "row_count": fingerprint_lsh.row_count, "candidate_probability_at_threshold": fingerprint_lsh.candidate_probability, "candidate_count": fingerprint_lsh.candidate_count, "pair_count": int(vid1_idx.shape[0]), "sample_recall": recall, "sample_pair_count": sample_pair_count}
+            logging.info("Fingerprint LSH: {}".format(self.fingerprint_lsh_report))
+            print("Fingerprint LSH found {} pairs at or above Jaccard {} from {} candidates, bigram Jaccard recall {} on {} sampled pairs.".format(vid1_idx.shape[0], self.fingerprint_threshold, fingerprint_lsh.candidate_count, "n/a" if recall == None else "{:.4f}".format(recall), sample_pair_count))
+            vid1_idx_list.append(vid1_idx)
+            vid2_idx_list.append(vid2_idx)
+        #* Union of both candidate sets, hash similarity is recomputed for every pair
+        pair = np.unique(np.stack([np.concatenate(vid1_idx_list), np.concatenate(vid2_idx_list)], axis=1), axis=0)
+        vid1_idx, vid2_idx = pair[:, 0], pair[:, 1]
+        self.candidate_pair = (vid1_idx, vid2_idx, hash_engine.similarity(vid1_idx, vid2_idx))
+        return self.candidate_pair
+
+    def _plan_comparison_shard(self) -> None:
+        #* Leave the comparison to shard workers, they read the signatures from the signature index of export result folder
+        if self.export_video_detail == False or self.export_comparison_result == False:
+            logging.warning("Sharded comparison needs export paths.")
+            vst_warning.action_failed("plan comparison shard")
+            return
+        if self.fingerprint_threshold != None:
+            logging.warning("Fingerprint threshold is not applied to sharded comparison.")
+            vst_warning.general_warning("--fingerprint-threshold is not applied to sharded comparison, every tile is compared")
+        index_path = os.path.abspath(os.path.join(self.export_video_detail, "video_detail_index"))
+        if not os.path.exists(index_path):
+            SignatureIndex.write(index_path, self.PATH_list, self.HASH_list, self.FINGER_PRINT_list)
+        shard_path = os.path.abspath(os.path.join(self.export_comparison_result, "comparison_shard"))
+        ComparisonShard.plan(shard_path, self.PATH_list.shape[0], self.shard_tile_size, first_new=self.index_offset, hash_threshold=self.hash_threshold)
+        #* Previous result is copied, the merge replaces comparison_result.csv
+        if self.previous_comparison_result_path != None:
+            shutil.copyfile(self.previous_comparison_result_path, os.path.join(shard_path, "previous_comparison_result.csv"))
+            range_path = os.path.splitext(self.previous_comparison_result_path)[0] + ".json"
+            if os.path.exists(range_path):
+                shutil.copyfile(range_path, os.path.join(shard_path, "previous_comparison_result.json"))
+        tile_count = len(ComparisonShard(shard_path).tile_list)
+        self.metrics.count("tile_count", tile_count)
+        print("Comparison shard planning phase complete, {} tiles of {}x{} videos in {}.".format(tile_count, self.shard_tile_size, self.shard_tile_size, shard_path))
+        print("Run --shard-worker on every worker, then --shard-merge to write comparison result.")
+
+    def _work_comparison_shard(self) -> None:
+        #* Claim and compute tiles in this process or in worker processes, other hosts may work on the same manifest
+        shard_path = os.path.abspath(os.path.join(self.export_comparison_result, "comparison_shard"))
+        index_path = os.path.abspath(os.path.join(self.export_video_detail, "video_detail_index"))
+        if not os.path.exists(os.path.join(shard_path, "manifest.json")):
+            logging.critical("No comparison shard manifest found.")
+            vst_error.file_not_exist(os.path.join(shard_path, "manifest.json"))
+        if self.workers <= 1:
+            result_list = [_comparison_shard_job(shard_path, index_path)]
+        else:
+            logging.info("Working on comparison shard with {} workers.".format(self.workers))
+            with concurrent.futures.ProcessPoolExecutor(max_workers=self.workers) as executor:
+                result_list = list(executor.map(_comparison_shard_job, [shard_path] * self.workers, [index_path] * self.workers))
+        tile_count, pair_count = sum(result[0] for result in result_list), sum(result[1] for result in result_list)
+        self.metrics.count("tile_count", tile_count)
+        self.metrics.count("pair_count", pair_count)
+        missing_tile_count = len(ComparisonShard(shard_path).missing_tile_list())
+        logging.info("Computed {} comparison shard tiles of {} pairs, {} tiles not finished.".format(tile_count, pair_count, missing_tile_count))
+        print("Comparison shard work phase complete, computed {} tiles ({} pairs), {} tiles still claimed by other workers.".format(tile_count, pair_count, missing_tile_count))
+
+    def _load_comparison_shard(self) -> None:
+        #* Every tile has to be computed before the fingerprint similarity range of the whole matrix is known
+        shard_path = os.path.abspath(os.path.join(self.export_comparison_result, "comparison_shard"))
+        if not os.path.exists(os.path.join(shard_path, "manifest.json")):
+            logging.critical("No comparison shard manifest found.")
+            vst_error.file_not_exist(os.path.join(shard_path, "manifest.json"))
+        comparison_shard = ComparisonShard(shard_path)
+        if comparison_shard.manifest["video_count"] != self.PATH_list.shape[0]:
+            logging.critical("Comparison shard manifest does not match exported signatures.")
+            vst_error.general_error("comparison shard was planned for {} videos, export result folder has {}".format(comparison_shard.manifest["video_count"], self.PATH_list.shape[0]))
+        missing_tile_list = comparison_shard.missing_tile_list()
+        if len(missing_tile_list) != 0:
+            logging.critical("Comparison shard tiles {} are not computed.".format(missing_tile_list))
+            vst_error.general_error("{} of {} comparison shard tiles are not computed yet".format(len(missing_tile_list), len(comparison_shard.tile_list)))
+        self.comparison_shard = comparison_shard
+        self.index_offset = comparison_shard.manifest["first_new"]
+        self.hash_threshold = comparison_shard.manifest["hash_threshold"]
+        previous_comparison_result_path = os.path.join(shard_path, "previous_comparison_result.csv")
+        if os.path.exists(previous_comparison_result_path):
+            self.previous_comparison_result_path = previous_comparison_result_path
+            range_path = os.path.splitext(previous_comparison_result_path)[0] + ".json"
+            if os.path.exists(range_path):
+                self.previous_fingerprint_similarity_range = _read_fingerprint_similarity_range(range_path)
+        logging.info("Loaded {} comparison shard tiles from {}.".format(len(comparison_shard.tile_list), shard_path))
+        print("Comparison shard loading phase complete, {} tiles.".format(len(comparison_shard.tile_list)))
+
+    def _generate_segment_result(self) -> None:
+        #* Partial clip matches found through the segment index instead of comparing every pair of segments
+        thumbnail_list = [self.previous_segment_result.get(i) if i < self.index_offset else self.segment_result.get(i - self.index_offset) for i in range(self.PATH_list.shape[0])]
+        segment_dataframe = SegmentIndex(thumbnail_list, self.segment_length).matches()
+        logging.info("Found {} segment matched video pairs.".format(segment_dataframe.shape[0]))
+        print("Segment matching phase complete, {} video pairs share segments.".format(segment_dataframe.shape[0]))
+        if self.export_comparison_result != False:
+            export_path = os.path.abspath(os.path.join(self.export_comparison_result, "segment_result.csv"))
+            segment_dataframe.to_csv(export_path, index=False)
+            print("Exported segment result to {}.".format(export_path))
+
+    def _score_block(self, hash_similarity: np.ndarray, fingerprint_similarity: np.ndarray) -> tuple:
+        #* (normalized fingerprint similarity, avg_similarity) of raw block values
+        fingerprint_similarity = _normalize_fingerprint_similarity(fingerprint_similarity, self.fingerprint_similarity_range)
+        return fingerprint_similarity, (hash_similarity * self.method_weight[0]) + (fingerprint_similarity * self.method_weight[1])
+
+    def _comparison_block_dataframe(self, vid1_idx: np.ndarray, vid2_idx: np.ndarray, hash_similarity: np.ndarray, fingerprint_similarity: np.ndarray, avg_similarity: np.ndarray) -> pd.DataFrame:
+        block_dataframe = pd.DataFrame(columns=self.comparison_dataframe.columns)
+        block_dataframe["vid1_idx"] = vid1_idx
+        block_dataframe["vid2_idx"] = vid2_idx
+        block_dataframe["mix_idx"] = _mix_idx(vid1_idx, vid2_idx)
+        block_dataframe["hash_similarity"] = hash_similarity
+        block_dataframe["fingerprint_similarity"] = fingerprint_similarity
+        block_dataframe["avg_similarity"] = avg_similarity
+        return block_dataframe
+
+    def _fingerprint_similarity_range(self, fingerprint_similarity_min: float, fingerprint_similarity_max: float, finger_print_engine) -> list:
+        #* Raw fingerprint similarity range of the compared pairs, None when no pair was compared
+        if self.hash_threshold != None or self.fingerprint_threshold != None:
+            #* Threshold mode only scores the pairs that pass, every pair among a sample of videos is scored too so that the range stands for the whole matrix (exact up to sample_size videos)
+            sample_size = 500
+            sample = np.sort(np.random.default_rng(20231018).choice(self.PATH_list.shape[0], size=min(sample_size, self.PATH_list.shape[0]), replace=False))
+            row, column = np.triu_indices(sample.shape[0], k=1)
+            sample_similarity = finger_print_engine.similarity(sample[row], sample[column])
+            if sample_similarity.shape[0] != 0:
+                fingerprint_similarity_min = min(fingerprint_similarity_min, float(sample_similarity.min()))
+                fingerprint_similarity_max = max(fingerprint_similarity_max, float(sample_similarity.max()))
+        if not np.isfinite(fingerprint_similarity_min):
+            return None
+        return [fingerprint_similarity_min, fingerprint_similarity_max]
+
+    def _write_fingerprint_similarity_range(self, export_path: str) -> None:
+        #* Raw fingerprint similarity range, needed to append pairs with --incremental later, null when no pair was compared
+        fingerprint_similarity_range = self.fingerprint_similarity_range if self.fingerprint_similarity_range != None else [None, None]
+        with open(os.path.splitext(export_path)[0] + ".json", "w") as f:
+            json.dump({"fingerprint_similarity_min": fingerprint_similarity_range[0], "fingerprint_similarity_max": fingerprint_similarity_range[1]}, f)
+
+    def _write_run_metrics(self) -> None:
+        #* Run report goes to export result folder, next to comparison_result.csv
+        export_folder = self.export_comparison_result if self.export_comparison_result != False else self.export_video_detail
+        if export_folder == False:
+            return
+        export_path = os.path.abspath(os.path.join(export_folder, "run_metrics.json"))
+        if self.shard_worker == True:
+            #* Workers of the same manifest report separately into the shard folder
+            export_path = os.path.abspath(os.path.join(export_folder, "comparison_shard", "run_metrics_{}_{}.json".format(socket.gethostname(), os.getpid())))
+        self.metrics.detail = {"input_method": self.input_method, "video_count": int(self.PATH_list.shape[0]), "new_video_count": int(self.PATH_list.shape[0]) - self.index_offset, "workers": self.workers, "download_workers": self.download_workers, "single_decode": self.single_decode, "fast_decode": self.fast_decode, "segment_length": self.segment_length, "shard_tile_size": self.shard_tile_size, "shard_worker": self.shard_worker, "shard_merge": self.shard_merge, "fingerprint_lsh": self.fingerprint_lsh_report, "rescore": self.rescore, "resume": self.resume}
+        self.metrics.write(export_path)
+        logging.info("Exported run metrics to {}.".format(export_path))
+        print("Exported run metrics to {}.".format(export_path))
+
     def _remove_cache(self) -> None:
         #* Remove cache
         for i, path in enumerate(self.PATH_list):
-            logging.debug("Removing cache from {}.".format(self.VideoHash_list[i].collage_path))
-            try:
-                os.remove(self.VideoHash_list[i].collage_path)
-            except Exception as e:
-                logging.warning("Failed to remove cache from {}.".format(self.VideoHash_list[i].collage_path))
-                vst_warning.general_warning(e)
-            if self.remove_cache == True:
+            if i < self.index_offset:
+                continue
+            #* Files removed by an interrupted run are skipped
+            if self.COLLAGE_PATH_list[i] != "" and os.path.exists(self.COLLAGE_PATH_list[i]):
+                logging.debug("Removing cache from {}.".format(self.COLLAGE_PATH_list[i]))
+                try:
+                    os.remove(self.COLLAGE_PATH_list[i])
+                except Exception as e:
+                    logging.warning("Failed to remove cache from {}.".format(self.COLLAGE_PATH_list[i]))
+                    vst_warning.general_warning(e)
+            if self.remove_cache == True and os.path.exists(path):
                 logging.debug("Removing video file from {}.".format(path))
                 try:
                     os.remove(path)
                 except Exception as e:
                     logging.warning("Failed to remove video file from {}.".format(path))
                     vst_warning.general_warning(e)
-        logging.info("Removed {} files.".format(len(self.PATH_list)))
+        logging.info("Removed {} files.".format(len(self.PATH_list) - self.index_offset))
         print("Cache removing phase complete.")
 
-    def __compare_code(self, vid1_code: str, vid2_code: str) -> None:
-        #* Check two code should be same length
-        if len(vid1_code) != len(vid2_code):
-            """
-            Perform bigram comparison between two strings
-            and return a percentage match in decimal form.
-            """
-            pairs1 = self.___get_bigrams(vid1_code)
-            pairs2 = self.___get_bigrams(vid2_code)
-            union  = len(pairs1) + len(pairs2)
-            hit_count = 0
-            for x in pairs1:
-                for y in pairs2:
-                    if x == y:
-                        hit_count += 1
-                        break
-            return (2.0 * hit_count) / union
+    def _compare_finger_print_fallback(self, cmp_obj_1: int, cmp_obj_2: int) -> float:
+        #* String comparison for fingerprints that can not be scored from the profiles (empty fingerprint)
+        try:
+            return _compare_code(self.FINGER_PRINT_list[cmp_obj_1], self.FINGER_PRINT_list[cmp_obj_2])
+        except Exception as e:
+            logging.warning("Failed to compare fingerprint data from FINGER_PRINT_list of {}th video with {}th video.".format(cmp_obj_1+1, cmp_obj_2+1))
+            vst_warning.general_warning(e)
+            return 0
+
+    def _compare_hash_fallback(self, cmp_obj_1: int, cmp_obj_2: int) -> float:
+        #* String comparison for hashes that can not be packed (unequal length or failed video)
+        try:
+            return _compare_code(self.HASH_list[cmp_obj_1], self.HASH_list[cmp_obj_2])
+        except Exception as e:
+            logging.warning("Failed to compare hash data from HASH_list of {}th video with {}th video.".format(cmp_obj_1+1, cmp_obj_2+1))
+            vst_warning.general_warning(e)
+            return 0
+
+class VideoSimilarityService:
+    #* Daemon that keeps the corpus signatures of VideoSimilarityTester in memory and answers duplicate queries over local HTTP or a Unix socket
+    #* Requests are handled one after another, so the signature cache and the index are never used by two requests at once
+    def __init__(self, cache_path: str, export_result_path: str, PATH_list_filepath=None, method_weight=[0.7, 0.3], signature_cache=True, single_decode=False, fast_decode=None, top_k=10) -> None:
+        self.cache_path = cache_path
+        self.method_weight = method_weight
+        #* Queries have to be decoded the same way as the corpus
+        self.fast_decode = fast_decode
+        self.single_decode = single_decode or fast_decode != None
+        self.top_k = top_k
+        _import_video_library()
+        self.videohash_retry = 3
+        self.fingerprint_retry = 3
+        self.signature_cache = SignatureCache(self.cache_path, variant=None if self.fast_decode == None else "fast_decode={}".format(self.fast_decode)) if signature_cache == True else None
+        #* Corpus exported by a previous run, from the binary signature index when present, else from video_detail.csv
+        self.PATH_list, self.HASH_list, self.FINGER_PRINT_list = [], [], []
+        index_path = os.path.abspath(os.path.join(export_result_path, "video_detail_index"))
+        video_detail_path = os.path.abspath(os.path.join(export_result_path, "video_detail.csv"))
+        signature_index = None
+        if os.path.exists(index_path):
+            signature_index = SignatureIndex(index_path)
+            self.PATH_list = signature_index.PATH_list.to_array().tolist()
+            self.HASH_list = signature_index.HASH_list.to_array().tolist()
+            self.FINGER_PRINT_list = signature_index.FINGER_PRINT_list.to_array().tolist()
+        elif os.path.exists(video_detail_path):
+            video_detail_dataframe = pd.read_csv(video_detail_path, dtype=str, keep_default_na=False)
+            self.PATH_list = video_detail_dataframe["PATH"].tolist()
+            self.HASH_list = video_detail_dataframe["HASH"].tolist()
+            self.FINGER_PRINT_list = video_detail_dataframe["FINGER_PRINT"].tolist()
         else:
-            #* Compare two code
-            diffcnt = 0
-            for i in range(len(vid1_code)):
-                if vid1_code[i] != vid2_code[i]:
-                    diffcnt += 1
-            return (len(vid1_code) - diffcnt) / len(vid1_code)
-    
-    def ___get_bigrams(self, string):
-        """
-        Take a string and return a list of bigrams.
-        """
-        s = string.lower()
-        return [s[i:i+2] for i in list(range(len(s) - 1))]
+            logging.warning("No signature index or video detail found in {}, starting with an empty corpus.".format(export_result_path))
+            vst_warning.general_warning("No signature index or video detail found in export result folder, starting with an empty corpus")
+        if signature_index != None:
+            #* Engines use the packed hashes and fingerprint codes of the index, and append to the lists above
+            self.hash_engine = signature_index.hash_engine(fallback=None, hash_list=self.HASH_list)
+            self.finger_print_engine = signature_index.finger_print_engine(fallback=None, finger_print_list=self.FINGER_PRINT_list)
+        else:
+            self.hash_engine = HashComparisonEngine(self.HASH_list, fallback=None)
+            self.finger_print_engine = FingerprintComparisonEngine(self.FINGER_PRINT_list, fallback=None)
+        #* Raw fingerprint similarity range of the corpus, queries are normalized the same way as comparison_result.csv
+        self.fingerprint_similarity_range = None
+        range_path = os.path.abspath(os.path.join(export_result_path, "comparison_result.json"))
+        if os.path.exists(range_path):
+            self.fingerprint_similarity_range = _read_fingerprint_similarity_range(range_path)
+        #* Videos of the PATH list that are not in the index yet
+        if PATH_list_filepath != None:
+            known = set(self.PATH_list)
+            with open(PATH_list_filepath, "r") as f:
+                for row in csv.reader(f):
+                    if row[0] in known:
+                        continue
+                    try:
+                        video_hash, finger_print = self.signature(row[0])
+                    except ValueError as e:
+                        logging.warning(str(e))
+                        vst_warning.general_warning(e)
+                        continue
+                    self.PATH_list.append(row[0])
+                    self.hash_engine.append(video_hash)
+                    self.finger_print_engine.append(finger_print)
+                    known.add(row[0])
+        logging.info("Loaded {} videos into similarity service.".format(len(self.PATH_list)))
+        print("Similarity service loaded {} videos.".format(len(self.PATH_list)))
+
+    def signature(self, path: str) -> tuple:
+        #* (hash, fingerprint) of a video file, from the signature cache when unchanged
+        if not os.path.isfile(path):
+            raise ValueError("Video file {} does not exist".format(path))
+        content_key = self.signature_cache.content_key(path) if self.signature_cache != None else None
+        if content_key != None:
+            cached_hash = self.signature_cache.get_hash(content_key)
+            cached_fingerprint = self.signature_cache.get_fingerprint(content_key)
+            if cached_hash != None and cached_fingerprint != None:
+                return cached_hash[0], cached_fingerprint
+        if self.single_decode == True:
+            result, failure_list = _signature_job(path, self.videohash_retry, self.fast_decode)
+            if result == None:
+                raise ValueError("Failed to extract signature of {}: {}".format(path, "; ".join(failure_list)))
+            hash_result, finger_print = result[:4], result[4]
+        else:
+            hash_result, failure_list = _hash_job(path, self.videohash_retry)
+            if hash_result == None:
+                raise ValueError("Failed to hash {}: {}".format(path, "; ".join(failure_list)))
+            if hash_result[2] != "" and os.path.exists(hash_result[2]):
+                os.remove(hash_result[2])
+            finger_print, failure_list = _finger_print_job(path, self.fingerprint_retry)
+            if finger_print == None:
+                raise ValueError("Failed to fingerprint {}: {}".format(path, "; ".join(failure_list)))
+        if content_key != None:
+            self.signature_cache.put_hash(content_key, path, hash_result[0], hash_result[1], hash_result[3])
+            self.signature_cache.put_fingerprint(content_key, path, finger_print)
+        return hash_result[0], finger_print
+
+    def query(self, path: str, top_k=None, min_similarity=None, add=False) -> dict:
+        #* Best matches of a video against the whole corpus, optionally added to the corpus afterwards
+        top_k = self.top_k if top_k == None else top_k
+        start_time = time.perf_counter()
+        video_hash, finger_print = self.signature(path)
+        signature_ms = (time.perf_counter() - start_time) * 1000
+        start_time = time.perf_counter()
+        vid_idx = np.arange(len(self.PATH_list))
+        hash_similarity = self.hash_engine.similarity_to(video_hash, vid_idx)
+        fingerprint_similarity = self.finger_print_engine.similarity_to(finger_print, vid_idx)
+        fingerprint_similarity = _normalize_fingerprint_similarity(fingerprint_similarity, self.fingerprint_similarity_range)
+        avg_similarity = (hash_similarity * self.method_weight[0]) + (fingerprint_similarity * self.method_weight[1])
+        keep = np.flatnonzero(avg_similarity >= min_similarity) if min_similarity != None else vid_idx
+        if keep.shape[0] > top_k:
+            keep = keep[np.argpartition(-avg_similarity[keep], top_k - 1)[:top_k]]
+        keep = keep[np.lexsort((keep, -avg_similarity[keep]))]
+        comparison_ms = (time.perf_counter() - start_time) * 1000
+        match_list = [{"vid_idx": int(i), "path": self.PATH_list[i], "hash_similarity": float(hash_similarity[i]), "fingerprint_similarity": float(fingerprint_similarity[i]), "avg_similarity": float(avg_similarity[i])} for i in keep]
+        result = {"path": path, "hash": video_hash, "finger_print": finger_print, "match": match_list, "signature_ms": signature_ms, "comparison_ms": comparison_ms}
+        if add == True:
+            result["vid_idx"] = self._append(path, video_hash, finger_print)
+        logging.info("Queried {} against {} videos in {:.3f} ms, best avg_similarity {}.".format(path, vid_idx.shape[0], comparison_ms, match_list[0]["avg_similarity"] if len(match_list) != 0 else None))
+        return result
+
+    def add(self, path: str) -> dict:
+        #* Add a video to the in-memory corpus only, run main.py with --incremental to persist it
+        video_hash, finger_print = self.signature(path)
+        return {"path": path, "hash": video_hash, "finger_print": finger_print, "vid_idx": self._append(path, video_hash, finger_print)}
+
+    def status(self) -> dict:
+        return {"video_count": len(self.PATH_list), "method_weight": self.method_weight, "fingerprint_similarity_range": self.fingerprint_similarity_range, "single_decode": self.single_decode, "fast_decode": self.fast_decode}
+
+    def serve(self, address: str) -> None:
+        #* Port number listens on 127.0.0.1, anything else is a Unix socket path
+        if address.isdigit():
+            server = http.server.HTTPServer(("127.0.0.1", int(address)), _ServiceRequestHandler)
+        else:
+            if os.path.exists(address):
+                os.remove(address)
+            server = _UnixHTTPServer(address, _ServiceRequestHandler)
+        server.service = self
+        logging.info("Similarity service listening on {}.".format(address))
+        print("Similarity service listening on {}.".format(address))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            if self.signature_cache != None:
+                self.signature_cache.close()
+            logging.info("Similarity service stopped.")
+
+    def _append(self, path: str, video_hash: str, finger_print: str) -> int:
+        if path in self.PATH_list:
+            return self.PATH_list.index(path)
+        self.PATH_list.append(path)
+        self.hash_engine.append(video_hash)
+        self.finger_print_engine.append(finger_print)
+        logging.info("Added {} to similarity service as {}th video.".format(path, len(self.PATH_list)))
+        return len(self.PATH_list) - 1
+
+class _UnixHTTPServer(socketserver.UnixStreamServer):
+    pass
+
+def _request_error(request: dict):
+    #* Error message of a malformed service request, None when every given field has the right type
+    if not isinstance(request["path"], str):
+        return "\"path\" must be a string"
+    #* bool is an int in python, but true is no count
+    if request.get("top_k") != None and (type(request["top_k"]) != int or request["top_k"] < 1):
+        return "\"top_k\" must be a positive integer"
+    if request.get("min_similarity") != None and type(request["min_similarity"]) not in (int, float):
+        return "\"min_similarity\" must be a number"
+    if type(request.get("add", False)) != bool:
+        return "\"add\" must be true or false"
+    return None
+
+class _ServiceRequestHandler(http.server.BaseHTTPRequestHandler):
+    #* GET /status, POST /query {"path", "top_k", "min_similarity", "add"}, POST /add {"path"}, every answer is JSON
+    def do_GET(self) -> None:
+        if self.path == "/status":
+            self._send(200, self.server.service.status())
+        else:
+            self._send(404, {"error": "Unknown endpoint {}".format(self.path)})
+
+    def do_POST(self) -> None:
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            path = request["path"]
+        except (ValueError, KeyError, TypeError):
+            self._send(400, {"error": "Request body must be JSON with a \"path\""})
+            return
+        error = _request_error(request)
+        if error != None:
+            self._send(400, {"error": error})
+            return
+        try:
+            if self.path == "/query":
+                self._send(200, self.server.service.query(path, top_k=request.get("top_k"), min_similarity=request.get("min_similarity"), add=request.get("add", False)))
+            elif self.path == "/add":
+                self._send(200, self.server.service.add(path))
+            else:
+                self._send(404, {"error": "Unknown endpoint {}".format(self.path)})
+        except ValueError as e:
+            logging.warning(str(e))
+            self._send(422, {"error": str(e)})
+
+    def _send(self, status: int, body: dict) -> None:
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args) -> None:
+        #* Unix socket clients have no address, requests only go to the log file
+        logging.info("Similarity service request: " + format % args)
 
 def input_file_check(input_filepath: str) -> None:
     #* Check if path is valid
@@ -405,19 +2625,41 @@ def ffmpeg_check() -> None:
 def execute():
     """
     Video Similarity Tester
-    Usage: python main.py <input_file> <cache_path> <export_result_path> [--remove-cache] [--weight=<weight>] [-h/--help]
-    !!!For URL links: ONLY ACCEPT YOUTUBE LINKS!!!
+    Usage: python main.py <input_file> <cache_path> <export_result_path> [--remove-cache] [--weight=<weight>] [--no-signature-cache] [--clear-signature-cache] [--signature-cache-max-age=<days>] [--signature-cache-max-entries=<count>] [--workers=<count>] [--single-decode] [--threshold=<hash_similarity>] [--incremental] [--stream] [--top-k=<count>] [--min-similarity=<avg_similarity>] [--download-workers=<count>] [--profile=<phase>[,<phase>]] [--serve=<port/socket>] [--rescore] [--segment=<seconds>] [--fast-decode=<keyframe/fps>] [--shard=<tile_size>] [--shard-worker] [--shard-merge] [--fingerprint-threshold=<jaccard>] [--resume] [-h/--help]
+    !!!For URL links: ONLY ACCEPT YOUTUBE LINKS OR DIRECT LINKS TO VIDEO FILES!!!
     Weight calculation: (hash_similarity * weight) + (fingerprint_similarity * (1-weight))
     sys.argv[1] path of list file
     sys.argv[2] path of cache folder
     sys.argv[3] path of export result folder
     sys.argv[?] (--remove-cache) remove cache after execution
     sys.argv[?] (--weight) weight of videohash method (default: 0.7)
+    sys.argv[?] (--no-signature-cache) do not read or write the signature cache in cache folder
+    sys.argv[?] (--clear-signature-cache) invalidate every signature cache entry before execution
+    sys.argv[?] (--signature-cache-max-age) evict signature cache entries unused for given days
+    sys.argv[?] (--signature-cache-max-entries) keep only given number of most recently used signature cache entries
+    sys.argv[?] (--workers) number of worker processes for hashing and fingerprinting (default: 1)
+    sys.argv[?] (--single-decode) decode each video once and compute hash and fingerprint from the same frames in memory
+    sys.argv[?] (--threshold) only compare pairs with hash similarity at or above given value (0-1), found through a hash index
+    sys.argv[?] (--incremental) only process videos not in the video_detail.csv/comparison_result.csv of export result folder and append their pairs
+    sys.argv[?] (--stream) write comparison result block by block instead of keeping every pair in memory
+    sys.argv[?] (--top-k) only keep the given number of best pairs (by avg_similarity) of every video, implies --stream
+    sys.argv[?] (--min-similarity) only keep pairs with avg_similarity at or above given value, implies --stream
+    sys.argv[?] (--download-workers) number of videos downloaded at the same time for URL list, hashing starts as each download finishes (default: 4)
+    sys.argv[?] (--profile) run given phases (e.g. hash_video,generate_result or all) under cProfile, saved next to run_metrics.json
+    sys.argv[?] (--serve) keep signatures of export result folder in memory and answer queries on given local port or Unix socket path, PATH list videos not in it are added
+    sys.argv[?] (--rescore) recompute comparison result from the signatures exported in export result folder (e.g. with new --weight/--threshold/--top-k), no video is decoded
+    sys.argv[?] (--segment) also hash every window of given seconds and report partial clip matches with time ranges in segment_result.csv
+    sys.argv[?] (--fast-decode) decode only keyframes (keyframe) or given frames per second (e.g. 0.5), downscaled by FFmpeg and piped into memory, implies --single-decode
+    sys.argv[?] (--shard) split comparison into tiles of given number of videos per side and write a manifest to comparison_shard in export result folder instead of comparing
+    sys.argv[?] (--shard-worker) claim and compute tiles of the manifest until none is left (with --workers local processes), can run on several hosts sharing export result folder
+    sys.argv[?] (--shard-merge) merge computed tiles into comparison result with global fingerprint normalization (honors --weight/--stream/--top-k/--min-similarity)
+    sys.argv[?] (--fingerprint-threshold) only compare pairs whose fingerprint bigram Jaccard similarity is at or above given value (0-1), found through MinHash LSH, recall against bigram Jaccard is reported (Dice d is Jaccard d/(2-d), equal length fingerprints are scored position by position instead)
+    sys.argv[?] (--resume) continue an interrupted run with the same options from the journal in cache folder, finished downloads and signatures are not computed again, with --stream comparison progress is checkpointed and resumed too
     sys.argv[?] (-h/--help) help (show available options)
     """
     #* Check arguments
     available_short_options = "h:"
-    available_long_options = ["remove-cache", "weight=", "help"]
+    available_long_options = ["remove-cache", "weight=", "no-signature-cache", "clear-signature-cache", "signature-cache-max-age=", "signature-cache-max-entries=", "workers=", "single-decode", "threshold=", "incremental", "stream", "top-k=", "min-similarity=", "download-workers=", "profile=", "serve=", "rescore", "segment=", "fast-decode=", "shard=", "shard-worker", "shard-merge", "fingerprint-threshold=", "resume", "help"]
     try:
         opts, args = getopt.getopt(sys.argv[4:], available_short_options, available_long_options)
     except getopt.GetoptError:
@@ -436,6 +2678,28 @@ def execute():
     #* Initialize variable
     remove_cache = False
     method_weight = 0.7
+    signature_cache = True
+    clear_signature_cache = False
+    signature_cache_max_age = None
+    signature_cache_max_entries = None
+    workers = 1
+    single_decode = False
+    hash_threshold = None
+    incremental = False
+    stream_result = False
+    top_k = None
+    min_similarity = None
+    download_workers = 4
+    profile_phase_list = None
+    serve_address = None
+    rescore = False
+    segment_length = None
+    fast_decode = None
+    shard_tile_size = None
+    shard_worker = False
+    shard_merge = False
+    fingerprint_threshold = None
+    resume = False
     list_filepath = sys.argv[1]
     cache_path = sys.argv[2]
     export_result_path = sys.argv[3]
@@ -446,18 +2710,74 @@ def execute():
             remove_cache = True
         elif opt in ("--weight"):
             method_weight = float(arg)
+        elif opt in ("--no-signature-cache"):
+            signature_cache = False
+        elif opt in ("--clear-signature-cache"):
+            clear_signature_cache = True
+        elif opt in ("--signature-cache-max-age"):
+            signature_cache_max_age = float(arg)
+        elif opt in ("--signature-cache-max-entries"):
+            signature_cache_max_entries = int(arg)
+        elif opt in ("--workers"):
+            workers = int(arg)
+        elif opt in ("--single-decode"):
+            single_decode = True
+        elif opt in ("--threshold"):
+            hash_threshold = float(arg)
+        elif opt in ("--incremental"):
+            incremental = True
+        elif opt in ("--stream"):
+            stream_result = True
+        elif opt in ("--top-k"):
+            top_k = int(arg)
+        elif opt in ("--min-similarity"):
+            min_similarity = float(arg)
+        elif opt in ("--download-workers"):
+            download_workers = int(arg)
+        elif opt in ("--profile"):
+            profile_phase_list = arg.split(",")
+        elif opt in ("--serve"):
+            serve_address = arg
+        elif opt in ("--rescore"):
+            rescore = True
+        elif opt in ("--segment"):
+            segment_length = int(arg)
+        elif opt in ("--fast-decode"):
+            fast_decode = arg if arg == "keyframe" else float(arg)
+        #* --shard is checked first, it is contained in --shard-worker and --shard-merge
+        elif opt in ("--shard"):
+            shard_tile_size = int(arg)
+        elif opt in ("--shard-worker"):
+            shard_worker = True
+        elif opt in ("--shard-merge"):
+            shard_merge = True
+        elif opt in ("--fingerprint-threshold"):
+            fingerprint_threshold = float(arg)
+        elif opt in ("--resume"):
+            resume = True
     logging.info("Parsed arguments.")
     #* Check input method (URL list or PATH list)
     input_method = input_file_check(list_filepath)
     logging.info("Input method checked.")
-    #* Check if FFmpeg is installed
-    ffmpeg_check()
-    logging.info("FFmpeg checked.")
+    #* Check if FFmpeg is installed, re-scoring and sharded comparison do not decode any video
+    if rescore == False and shard_worker == False and shard_merge == False:
+        ffmpeg_check()
+        logging.info("FFmpeg checked.")
     #* Call class
-    if input_method == "URL_list":
-        VideoSimilarityTester(cache_path=cache_path, URL_list_filepath=list_filepath, export_video_detail=export_result_path, export_comparison_result=export_result_path, remove_cache=remove_cache, method_weight=[method_weight, 1-method_weight])
+    if shard_worker == True or shard_merge == True:
+        VideoSimilarityTester(cache_path=cache_path, PATH_list_filepath=list_filepath, export_video_detail=export_result_path, export_comparison_result=export_result_path, remove_cache=False, method_weight=[method_weight, 1-method_weight], signature_cache=False, workers=workers, stream_result=stream_result, top_k=top_k, min_similarity=min_similarity, profile_phase_list=profile_phase_list, shard_worker=shard_worker, shard_merge=shard_merge)
+    elif rescore == True:
+        VideoSimilarityTester(cache_path=cache_path, PATH_list_filepath=list_filepath, export_video_detail=export_result_path, export_comparison_result=export_result_path, remove_cache=False, method_weight=[method_weight, 1-method_weight], signature_cache=False, hash_threshold=hash_threshold, stream_result=stream_result, top_k=top_k, min_similarity=min_similarity, profile_phase_list=profile_phase_list, shard_tile_size=shard_tile_size, fingerprint_threshold=fingerprint_threshold, rescore=True)
+    elif serve_address != None:
+        if input_method == "URL_list":
+            logging.warning("URL list is not added to similarity service, serving export result folder only.")
+            vst_warning.general_warning("URL list is not added to similarity service, serving export result folder only")
+        service = VideoSimilarityService(cache_path=cache_path, export_result_path=export_result_path, PATH_list_filepath=list_filepath if input_method == "PATH_list" else None, method_weight=[method_weight, 1-method_weight], signature_cache=signature_cache, single_decode=single_decode, fast_decode=fast_decode, top_k=top_k if top_k != None else 10)
+        service.serve(serve_address)
+    elif input_method == "URL_list":
+        VideoSimilarityTester(cache_path=cache_path, URL_list_filepath=list_filepath, export_video_detail=export_result_path, export_comparison_result=export_result_path, remove_cache=remove_cache, method_weight=[method_weight, 1-method_weight], signature_cache=signature_cache, clear_signature_cache=clear_signature_cache, signature_cache_max_age=signature_cache_max_age, signature_cache_max_entries=signature_cache_max_entries, workers=workers, single_decode=single_decode, hash_threshold=hash_threshold, incremental=incremental, stream_result=stream_result, top_k=top_k, min_similarity=min_similarity, download_workers=download_workers, profile_phase_list=profile_phase_list, segment_length=segment_length, fast_decode=fast_decode, shard_tile_size=shard_tile_size, fingerprint_threshold=fingerprint_threshold, resume=resume)
     elif input_method == "PATH_list":
-        VideoSimilarityTester(cache_path=cache_path, PATH_list_filepath=list_filepath, export_video_detail=export_result_path, export_comparison_result=export_result_path, remove_cache=remove_cache, method_weight=[method_weight, 1-method_weight])
+        VideoSimilarityTester(cache_path=cache_path, PATH_list_filepath=list_filepath, export_video_detail=export_result_path, export_comparison_result=export_result_path, remove_cache=remove_cache, method_weight=[method_weight, 1-method_weight], signature_cache=signature_cache, clear_signature_cache=clear_signature_cache, signature_cache_max_age=signature_cache_max_age, signature_cache_max_entries=signature_cache_max_entries, workers=workers, single_decode=single_decode, hash_threshold=hash_threshold, incremental=incremental, stream_result=stream_result, top_k=top_k, min_similarity=min_similarity, download_workers=download_workers, profile_phase_list=profile_phase_list, segment_length=segment_length, fast_decode=fast_decode, shard_tile_size=shard_tile_size, fingerprint_threshold=fingerprint_threshold, resume=resume)
 
 if __name__ == "__main__":
     # URL_filepath = "./URL_list.csv"
@@ -465,6 +2785,7 @@ if __name__ == "__main__":
     # cache_path = "./cache"
     # # VideoSimilarityTester(cache_path=cache_path, URL_list_filepath=URL_filepath, export_video_detail=cache_path, export_comparison_result=cache_path, remove_cache=False)
     # VideoSimilarityTester(cache_path=cache_path, PATH_list_filepath=PATH_filepath, export_video_detail=cache_path, export_comparison_result=cache_path, remove_cache=False)
+    multiprocessing.freeze_support()
     #* Initialize logger
     logger = config_logging()
     logging.info("Initialized logger.")